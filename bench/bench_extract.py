@@ -0,0 +1,91 @@
+"""
+Micro-benchmark for itchio.extract_rating_from_html.
+
+Runs the saved pages in bench/corpus through the current extractor (on raw
+bytes and on decoded str) and through the original full-page regex version,
+checks both against corpus/expected.json, and prints pages per second.
+
+    python bench/bench_extract.py [--rounds 200]
+"""
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+
+from itchio import extract_rating_from_html
+
+CORPUS = HERE / "corpus"
+
+def legacy_extract_rating_from_html(html: str):
+    # The pre-optimization implementation, kept verbatim as the baseline.
+    for m in re.finditer(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+                         html, flags=re.S|re.I):
+        try:
+            data = json.loads(m.group(1).strip())
+        except Exception:
+            continue
+        candidates = data if isinstance(data, list) else [data]
+        for obj in candidates:
+            agg = obj.get("aggregateRating") if isinstance(obj, dict) else None
+            if not isinstance(agg, dict):
+                continue
+            val = agg.get("ratingValue")
+            cnt = agg.get("ratingCount") or agg.get("reviewCount")
+            try:
+                avg = float(val) if val is not None else None
+                count = int(cnt) if cnt is not None else None
+                if avg is not None:
+                    return avg, count
+            except Exception:
+                pass
+    m = re.search(r'([0-5](?:\.\d)?)\s*(?:average|stars)[^0-9]{0,20}\(?([\d,]+)\s*ratings?\)?',
+                  html, flags=re.I)
+    if m:
+        return float(m.group(1)), int(m.group(2).replace(",", ""))
+    return None, None
+
+def load_corpus():
+    expected = json.loads((CORPUS / "expected.json").read_text())
+    pages = [(name, (CORPUS / name).read_bytes(), tuple(exp)) for name, exp in sorted(expected.items())]
+    return pages
+
+def run(label, fn, inputs, rounds):
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for page in inputs:
+            fn(page)
+    secs = time.perf_counter() - t0
+    n = rounds * len(inputs)
+    print(f"{label:<28} {n / secs:>10,.0f} pages/s  ({secs * 1e6 / n:,.0f} µs/page)")
+    return n / secs
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=200)
+    args = ap.parse_args()
+
+    pages = load_corpus()
+    raw = [body for _, body, _ in pages]
+    text = [body.decode("utf-8", errors="ignore") for body in raw]
+
+    for (name, body, exp), s in zip(pages, text):
+        for label, got in (("bytes", extract_rating_from_html(body)),
+                           ("str", extract_rating_from_html(s)),
+                           ("legacy", legacy_extract_rating_from_html(s))):
+            if got != exp:
+                raise SystemExit(f"{name}: {label} extractor returned {got}, expected {exp}")
+
+    kb = sum(len(b) for b in raw) / len(raw) / 1024
+    print(f"{len(pages)} pages, avg {kb:.0f} KiB, {args.rounds} rounds")
+    base = run("legacy (str)", legacy_extract_rating_from_html, text, args.rounds)
+    fast_str = run("extract_rating_from_html(str)", extract_rating_from_html, text, args.rounds)
+    fast_raw = run("extract_rating_from_html(bytes)", extract_rating_from_html, raw, args.rounds)
+    print(f"speedup: {fast_str / base:.1f}x on str, {fast_raw / base:.1f}x on bytes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Benchmark harness: times the importers, the single-rating writers, both
+export fetchers, the XLSX writer and the HTML rating extractor on synthetic
+data (bench/synth.py) at several scales, and records wall time and peak
+Python heap (tracemalloc; SQLite's own allocations are not included) as JSON.
+
+    python bench/run.py                               # scales 1000,10000
+    python bench/run.py --scales 1000,10000,100000 --cases import,fetch
+    python bench/run.py --compare bench/results/20260101-120000.json
+
+Each scale gets N items, 5N ratings over 4 sources and N-record itch.io dumps.
+Results go to bench/results/<timestamp>.json unless --out is given.
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+
+import synth
+from db import init_db, connect, _fetch_items_for_export, _fetch_ratings_ledger
+from itchio import import_itchio_file, extract_rating_from_html
+from ratings import add_rating_stars5, add_rating_thumb
+
+RESULTS = HERE / "results"
+WRITES_PER_RUN = 2000      # add_rating_* calls per run (each commits)
+PAGES = 200
+
+# ---------- Cases ----------
+# Each case takes the per-scale fixture dict and returns (run, units): setup
+# happens before the return, run() is the timed part.
+CASES = {}
+
+def case(name, group):
+    def register(fn):
+        CASES[name] = (group, fn)
+        return fn
+    return register
+
+def _quiet(fn, *args, **kw):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kw)
+
+def _fresh_db(fx):
+    path = fx["tmp"] / "fresh.db"
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    init_db(path)
+    return connect(path)
+
+def _scratch_copy(fx):
+    # writers mutate the DB: every run starts from a copy of the populated one
+    path = fx["tmp"] / "scratch.db"
+    src = connect(fx["db"])
+    dst = sqlite3.connect(path)
+    src.backup(dst)
+    dst.close()
+    src.close()
+    return connect(path)
+
+@case("import_itchio_json", "import")
+def _import_json(fx):
+    conn = _fresh_db(fx)
+    return lambda: _quiet(import_itchio_file, conn, str(fx["json"])), fx["n"]
+
+@case("import_itchio_rss", "import")
+def _import_rss(fx):
+    conn = _fresh_db(fx)
+    return lambda: _quiet(import_itchio_file, conn, str(fx["rss"])), fx["n"]
+
+def _writes(fx, fn, value_key, values):
+    conn = _scratch_copy(fx)
+    titles = [r[0] for r in conn.execute("SELECT title FROM item WHERE media_code='game' LIMIT ?",
+                                         (WRITES_PER_RUN // 2,))]
+    # half existing items, half new ones
+    titles += [f"bench new item {i}" for i in range(WRITES_PER_RUN - len(titles))]
+    def run():
+        for i, title in enumerate(titles):
+            fn(conn, item_title=title, media_code="game", source_name="fred",
+               votes=i % 50 + 1, **{value_key: values[i % len(values)]})
+    return run, len(titles)
+
+@case("add_rating_stars5", "write")
+def _stars5(fx):
+    return _writes(fx, add_rating_stars5, "stars", (1.0, 2.5, 3.5, 4.0, 5.0))
+
+@case("add_rating_thumb", "write")
+def _thumb(fx):
+    return _writes(fx, add_rating_thumb, "up", (True, False, True))
+
+@case("fetch_items_for_export", "fetch")
+def _fetch_items(fx):
+    conn = connect(fx["db"])
+    return lambda: sum(1 for _ in _fetch_items_for_export(conn, sources="all")), fx["n"]
+
+@case("fetch_ratings_ledger", "fetch")
+def _fetch_ledger(fx):
+    conn = connect(fx["db"])
+    return lambda: sum(1 for _ in _fetch_ratings_ledger(conn)), fx["ratings"]
+
+@case("fetch_ratings_ledger_latest", "fetch")
+def _fetch_ledger_latest(fx):
+    conn = connect(fx["db"])
+    n = conn.execute("SELECT COUNT(*) FROM item_rating_latest").fetchone()[0]
+    return lambda: sum(1 for _ in _fetch_ratings_ledger(conn, latest_only=True)), n
+
+@case("write_xlsx", "export")
+def _xlsx(fx):
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return None
+    from export import _write_xlsx
+    rows = list(_fetch_items_for_export(connect(fx["db"]), sources="all"))
+    out = fx["tmp"] / "bench.xlsx"
+    return lambda: _write_xlsx(out, {"Items": {"rows": rows}}), len(rows)
+
+@case("extract_rating_from_html", "extract")
+def _extract(fx):
+    pages = fx["pages"]
+    def run():
+        for html, expected in pages:
+            if extract_rating_from_html(html) != expected:
+                raise AssertionError("extractor disagrees with synthetic page")
+    return run, len(pages)
+
+# ---------- Harness ----------
+def _fixtures(n, tmp):
+    t0 = time.perf_counter()
+    tmp.mkdir(parents=True, exist_ok=True)
+    fx = {"n": n, "ratings": 5 * n, "tmp": tmp, "db": tmp / "bench.db",
+          "json": tmp / "itchio.json", "rss": tmp / "itchio.rss"}
+    synth.build_db(fx["db"], items=n, ratings=fx["ratings"], sources=4)
+    synth.write_json(fx["json"], n)
+    synth.write_rss(fx["rss"], n)
+    fx["pages"] = synth.html_pages(PAGES)
+    print(f"scale {n:,}: fixtures built in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return fx
+
+def _measure(setup, fx, repeat, memory):
+    times, units, peak = [], 0, None
+    for _ in range(repeat):
+        made = setup(fx)
+        if made is None:
+            return None
+        run, units = made
+        gc.collect()
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+    if memory:
+        run, _ = setup(fx)
+        gc.collect()
+        tracemalloc.start()
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    best = min(times)
+    return {"units": units, "seconds": round(best, 6), "median": round(statistics.median(times), 6),
+            "per_sec": round(units / best, 1) if best else None,
+            "peak_kib": None if peak is None else round(peak / 1024, 1)}
+
+def _meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"when": datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "machine": platform.machine(), "system": platform.system(),
+            "scales": args.scales, "repeat": args.repeat}
+
+def _print_table(results, baseline):
+    base = {(r["case"], r["scale"]): r for r in (baseline or {}).get("results", [])}
+    print(f"{'case':<30} {'scale':>9} {'seconds':>9} {'units/s':>12} {'peak KiB':>10}" +
+          ("  vs base" if base else ""))
+    for r in results:
+        peak = "-" if r["peak_kib"] is None else f"{r['peak_kib']:,.0f}"
+        line = f"{r['case']:<30} {r['scale']:>9,} {r['seconds']:>9.3f} {r['per_sec'] or 0:>12,.0f} {peak:>10}"
+        old = base.get((r["case"], r["scale"]))
+        if old and old["seconds"]:
+            line += f"  {r['seconds'] / old['seconds']:6.2f}x"
+        print(line)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scales", default="1000,10000", help="Comma list of item counts (default 1000,10000)")
+    ap.add_argument("--cases", help=f"Comma list of cases or groups "
+                                    f"({', '.join(sorted({g for g, _ in CASES.values()}))}); default all")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the best is reported (default 3)")
+    ap.add_argument("--no-memory", action="store_true", help="Skip the extra tracemalloc run per case")
+    ap.add_argument("--out", help="Result JSON path (default bench/results/<timestamp>.json)")
+    ap.add_argument("--compare", help="Earlier result JSON to show time ratios against")
+    ap.add_argument("--keep", action="store_true", help="Keep the generated fixtures (printed path)")
+    args = ap.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    wanted = set(args.cases.split(",")) if args.cases else None
+    selected = [(name, fn) for name, (group, fn) in CASES.items()
+                if wanted is None or name in wanted or group in wanted]
+    if not selected:
+        raise SystemExit(f"no such case; choose from: {', '.join(CASES)}")
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    tmp_root = Path(tempfile.mkdtemp(prefix="recommend-it-bench-"))
+    results = []
+    try:
+        for n in scales:
+            fx = _fixtures(n, tmp_root / str(n))
+            for name, setup in selected:
+                m = _measure(setup, fx, args.repeat, not args.no_memory)
+                if m is None:
+                    print(f"  {name}: skipped (dependency missing)", file=sys.stderr)
+                    continue
+                results.append({"case": name, "scale": n, **m})
+                print(f"  {name:<30} {m['seconds']:.3f}s", file=sys.stderr)
+    finally:
+        if args.keep:
+            print(f"fixtures kept in {tmp_root}", file=sys.stderr)
+        else:
+            shutil.rmtree(tmp_root, ignore_errors=True)
+
+    out = Path(args.out) if args.out else RESULTS / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"meta": _meta(args), "results": results}, indent=1))
+    _print_table(results, baseline)
+    print(f"\nwrote {out}")
+
+if __name__ == "__main__":
+    main()
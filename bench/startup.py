@@ -0,0 +1,97 @@
+"""
+CLI cold-start benchmark: runs recommend-it.py commands in fresh interpreters
+and compares them with a bare `python -c pass`. It also breaks down
+`-X importtime` by top-level module, so a heavy import that creeps back into
+a simple command shows up by name.
+
+    python bench/startup.py                    # rate-thumb, rate5, --help
+    python bench/startup.py --runs 30 --budget-ms 40
+
+Exits 1 if a command's median import time (our modules plus everything they
+pull in) exceeds --budget-ms, or if a light command imports one of HEAVY.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+CLI = HERE.parent / "src" / "recommend-it.py"
+
+# modules only the commands that need them may load
+HEAVY = ("numpy", "scipy", "openpyxl", "xml.etree", "http.client", "concurrent.futures")
+
+def _commands(db):
+    return {
+        "help": ["--help"],
+        "rate-thumb": ["rate-thumb", db, "--item", "Startup Bench", "--media", "game", "--source", "fred", "--up"],
+        "rate5": ["rate5", db, "--item", "Startup Bench", "--media", "game", "--source", "fred", "--stars", "4"],
+    }
+
+def _run(argv, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + argv
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=HERE.parent)
+    secs = time.perf_counter() - t0
+    if proc.returncode:
+        raise SystemExit(f"{' '.join(argv)} failed:\n{proc.stderr[-2000:]}")
+    return secs, proc.stderr
+
+def _import_breakdown(stderr):
+    """-X importtime lines -> ({top-level package: cumulative us}, {module names})."""
+    tops, names = {}, set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[12:].split("|")
+        names.add(name.strip())
+        if name.startswith(" ") and not name.startswith("  "):      # direct imports of __main__
+            top = name.strip()
+            tops[top] = tops.get(top, 0) + int(cumulative)
+    return tops, names
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=15, help="Interpreter starts per command (default 15)")
+    ap.add_argument("--budget-ms", type=float, default=50.0,
+                    help="Fail if a command's median import time exceeds this (default 50)")
+    ap.add_argument("--top", type=int, default=8, help="Slowest top-level imports to list (default 8)")
+    args = ap.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="recommend-it-startup-"))
+    db = str(tmp / "startup.db")
+    _run([str(CLI), "init-db", db])
+    _run([str(CLI), "add-scale-defaults", db])
+    _run([str(CLI), "add-source", db, "fred", "user"])
+
+    base = statistics.median(_run(["-c", "pass"])[0] for _ in range(args.runs))
+    print(f"{'command':<12} {'median ms':>10} {'over python':>12} {'imports ms':>11}  slowest imports")
+    print(f"{'python':<12} {base * 1000:>10.1f} {'':>12} {'':>11}")
+    failed = []
+    for name, argv in _commands(db).items():
+        argv = [str(CLI)] + argv
+        wall = statistics.median(_run(argv)[0] for _ in range(args.runs))
+        samples = [_import_breakdown(_run(argv, importtime=True)[1]) for _ in range(max(3, args.runs // 3))]
+        tops = {k: statistics.median(s[0].get(k, 0) for s in samples) for k in samples[0][0]}
+        ours = sum(v for k, v in tops.items() if k not in ("site", "encodings")) / 1000
+        slow = sorted(tops.items(), key=lambda kv: -kv[1])[:args.top]
+        print(f"{name:<12} {wall * 1000:>10.1f} {(wall - base) * 1000:>+12.1f} {ours:>11.1f}  " +
+              ", ".join(f"{k} {v / 1000:.1f}" for k, v in slow))
+        heavy = sorted({n for n in samples[0][1] if n.split(".")[0] in HEAVY or n.startswith(HEAVY)})
+        if heavy:
+            failed.append(f"{name}: imports {', '.join(heavy[:6])}")
+        if ours > args.budget_ms:
+            failed.append(f"{name}: {ours:.1f} ms of imports > {args.budget_ms:.0f} ms budget")
+    for p in tmp.iterdir():
+        p.unlink()
+    os.rmdir(tmp)
+    if failed:
+        print("\n" + "\n".join(failed))
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Synthetic data for the benchmarks: a populated database, itch.io JSON /
+NDJSON / RSS dumps and saved game pages. Everything is seeded, so the same
+arguments always produce the same data.
+
+    python bench/synth.py db /tmp/bench.db --items 100000 --ratings 500000 --sources 6
+    python bench/synth.py dumps /tmp/dumps --items 100000 --pages 500
+"""
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "src"))
+
+from db import init_db, connect, load_item_ids, bulk_ensure_items, load_tag_ids, bulk_ensure_tags
+from ratings import add_scale_defaults, add_source, normalize_percent_for_stars5, confidence_for_votes
+
+WORDS = ("pixel cozy dungeon idle puzzle jam roguelike build patch update browser devlog "
+         "space horror farm quest tiny dark neon lost garden robot ghost arcade card tower").split()
+TAGS = WORDS + [f"{w}-{v}" for w in WORDS[:12] for v in ("like", "core", "lite")]
+PLATFORMS = ("windows", "linux", "osx", "html5", "android")
+MEDIA = ("game", "game", "game", "book", "movie", "tv", "music")
+
+def _title(rng, i):
+    return f"{' '.join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 3)))} {i}"
+
+# ---------- itch.io dumps ----------
+def itchio_records(n, seed=1):
+    rng = random.Random(seed)
+    for i in range(n):
+        yield {
+            "id": 100000 + i,
+            "title": _title(rng, i),
+            "short_text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16))),
+            "url": f"https://dev{rng.randint(1, 999)}.itch.io/game-{i}",
+            "platforms": {p: rng.random() < 0.4 for p in PLATFORMS},
+            "tags": ",".join(rng.sample(TAGS, rng.randint(0, 6))),
+            "price": rng.choice((0, 0, 0, 2.99, 4.99)),
+        }
+
+def write_json(path, n, seed=1):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, rec in enumerate(itchio_records(n, seed)):
+            f.write(("," if i else "") + json.dumps(rec))
+        f.write("]")
+
+def write_ndjson(path, n, seed=1):
+    with open(path, "w", encoding="utf-8") as f:
+        for rec in itchio_records(n, seed):
+            f.write(json.dumps(rec) + "\n")
+
+def write_rss(path, n, seed=1):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel><title>itch.io</title>\n')
+        for rec in itchio_records(n, seed):
+            cats = "".join(f"<category>{escape(t)}</category>" for t in rec["tags"].split(",") if t)
+            f.write(f"<item><title>{escape(rec['title'])}</title><link>{escape(rec['url'])}</link>"
+                    f"<description>{escape(rec['short_text'])}</description>{cats}</item>\n")
+        f.write("</channel></rss>\n")
+
+# ---------- saved game pages ----------
+def html_pages(n, seed=1, cells=40):
+    """
+    Pages shaped like itch.io game pages: a big body of game cells, then the
+    rating as JSON-LD (most pages), as visible text only, or missing.
+    Returns [(bytes, expected (avg, count))].
+    """
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n):
+        body = "".join(
+            f'<div class="game_cell" data-game_id="{rng.randint(1, 999999)}"><a class="title game_link" '
+            f'href="https://dev{rng.randint(1, 999)}.itch.io/g">{_title(rng, j)}</a><div class="game_text">'
+            f'{" ".join(rng.choice(WORDS) for _ in range(18))}</div></div>\n' for j in range(cells))
+        avg, count = round(rng.uniform(1, 5), 1), rng.randint(1, 20000)
+        kind = rng.random()
+        if kind < 0.7:
+            ld = {"@context": "http://schema.org/", "@type": "Product", "name": f"Game {i}",
+                  "aggregateRating": {"@type": "AggregateRating", "ratingValue": str(avg), "ratingCount": count}}
+            tail = f'<script type="application/ld+json">{json.dumps(ld)}</script>'
+            expected = (avg, count)
+        elif kind < 0.9:
+            tail = f'<div class="aggregate_rating">{avg} average rating ({count:,} ratings)</div>'
+            expected = (avg, count)
+        else:
+            tail, expected = "<div>No ratings yet</div>", (None, None)
+        html = (f'<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>Game {i}</title>'
+                f'<script type="text/javascript">window.R={{}};</script></head><body>{body}{tail}</body></html>')
+        pages.append((html.encode("utf-8"), expected))
+    return pages
+
+def write_pages(outdir, n, seed=1):
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    expected = {}
+    for i, (html, exp) in enumerate(html_pages(n, seed)):
+        (outdir / f"page-{i:05d}.html").write_bytes(html)
+        expected[f"page-{i:05d}.html"] = list(exp)
+    (outdir / "expected.json").write_text(json.dumps(expected, indent=1))
+
+# ---------- populated database ----------
+def build_db(path, *, items, ratings, sources=4, seed=1):
+    """
+    N items across media types with tags, platforms and external refs, and M
+    ratings spread over K sources (source 0 is the user 'fred', the rest are
+    external) with a rated_at history, so the latest-per-source tables matter.
+    """
+    rng = random.Random(seed)
+    init_db(path)
+    conn = connect(path)
+    add_scale_defaults(conn)
+    names = ["fred", "itchio"] + [f"site{k}" for k in range(2, max(sources, 2))]
+    for k, name in enumerate(names[:max(sources, 1)]):
+        add_source(conn, name, "user" if k == 0 else "external", 1.0, 1.0)
+    src_ids = [r[0] for r in conn.execute("SELECT id FROM rating_source ORDER BY id")]
+    scale = conn.execute("SELECT id FROM rating_scale WHERE name='stars_5'").fetchone()[0]
+
+    item_ids, tag_ids = load_item_ids(conn), load_tag_ids(conn)
+    rows = [(_title(rng, i), MEDIA[i % len(MEDIA)], f"synthetic item {i}" if i % 3 else None)
+            for i in range(items)]
+    bulk_ensure_items(conn, item_ids, rows)
+    bulk_ensure_tags(conn, tag_ids, TAGS)
+    ids = [item_ids[(t, m)] for t, m, _ in rows]
+    conn.executemany("INSERT OR IGNORE INTO item_tag(item_id, tag_id) VALUES (?,?)",
+                     [(iid, tag_ids[t]) for iid in ids for t in rng.sample(TAGS, rng.randint(0, 5))])
+    conn.executemany("INSERT OR IGNORE INTO item_platform(item_id, platform_code) VALUES (?,?)",
+                     [(iid, p) for iid in ids for p in ("web", "windows", "linux", "mac") if rng.random() < 0.3])
+    conn.executemany("INSERT OR IGNORE INTO external_ref(item_id, source, external_id, url) VALUES (?,?,?,?)",
+                     [(iid, "itchio", str(100000 + iid), f"https://dev{iid % 997}.itch.io/game-{iid}")
+                      for iid in ids if rng.random() < 0.5])
+
+    def rating_rows():
+        for r in range(ratings):
+            stars = round(rng.uniform(0.5, 5), 1)
+            votes = rng.randint(1, 5000)
+            day = 1 + r * 3650 // max(ratings, 1)
+            yield (rng.choice(ids), rng.choice(src_ids), scale, stars, normalize_percent_for_stars5(stars),
+                   votes, confidence_for_votes(votes), f"+{day} days")
+    conn.executemany(
+        "INSERT INTO item_rating(item_id, source_id, scale_id, value_num, percent, vote_count, confidence, rated_at) "
+        "VALUES (?,?,?,?,?,?,?,datetime('2015-01-01', ?))",
+        rating_rows())
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="what", required=True)
+    sp = sub.add_parser("db", help="Populated SQLite database")
+    sp.add_argument("path")
+    sp.add_argument("--items", type=int, default=10000)
+    sp.add_argument("--ratings", type=int, default=50000)
+    sp.add_argument("--sources", type=int, default=4)
+    sp.add_argument("--seed", type=int, default=1)
+    sp = sub.add_parser("dumps", help="itch.io JSON/NDJSON/RSS dumps and saved pages")
+    sp.add_argument("outdir")
+    sp.add_argument("--items", type=int, default=10000)
+    sp.add_argument("--pages", type=int, default=200)
+    sp.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    if args.what == "db":
+        build_db(Path(args.path).resolve(), items=args.items, ratings=args.ratings,
+                 sources=args.sources, seed=args.seed)
+        print(f"wrote {args.path}")
+        return
+    out = Path(args.outdir)
+    out.mkdir(parents=True, exist_ok=True)
+    write_json(out / "itchio.json", args.items, args.seed)
+    write_ndjson(out / "itchio.ndjson", args.items, args.seed)
+    write_rss(out / "itchio.rss", args.items, args.seed)
+    write_pages(out / "pages", args.pages, args.seed)
+    print(f"wrote dumps and {args.pages} pages to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -93,6 +93,52 @@ CREATE TABLE IF NOT EXISTS item_rating (
 
 CREATE INDEX IF NOT EXISTS idx_item_rating_item   ON item_rating(item_id);
 CREATE INDEX IF NOT EXISTS idx_item_rating_source ON item_rating(source_id);
+-- "latest rating per (item, source)" lookups; rowid breaks rated_at ties
+CREATE INDEX IF NOT EXISTS idx_item_rating_latest ON item_rating(item_id, source_id, rated_at);
+
+-- Latest rating per (item, source), kept current by the triggers below.
+-- Readers join item_rating by rating_id instead of re-deriving MAX(rated_at).
+-- No FK on item_id: rows go away through the item_rating delete trigger.
+CREATE TABLE IF NOT EXISTS item_rating_latest (
+  item_id   INTEGER NOT NULL,
+  source_id INTEGER NOT NULL,
+  rating_id INTEGER NOT NULL,
+  PRIMARY KEY (item_id, source_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_item_rating_latest_ins
+AFTER INSERT ON item_rating
+FOR EACH ROW BEGIN
+  INSERT OR REPLACE INTO item_rating_latest(item_id, source_id, rating_id)
+  SELECT item_id, source_id, id FROM item_rating
+  WHERE item_id = NEW.item_id AND source_id = NEW.source_id
+  ORDER BY rated_at DESC, id DESC LIMIT 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_item_rating_latest_upd
+AFTER UPDATE OF item_id, source_id, rated_at ON item_rating
+FOR EACH ROW BEGIN
+  DELETE FROM item_rating_latest WHERE item_id = OLD.item_id AND source_id = OLD.source_id;
+  INSERT OR REPLACE INTO item_rating_latest(item_id, source_id, rating_id)
+  SELECT item_id, source_id, id FROM item_rating
+  WHERE item_id = OLD.item_id AND source_id = OLD.source_id
+  ORDER BY rated_at DESC, id DESC LIMIT 1;
+  INSERT OR REPLACE INTO item_rating_latest(item_id, source_id, rating_id)
+  SELECT item_id, source_id, id FROM item_rating
+  WHERE item_id = NEW.item_id AND source_id = NEW.source_id
+  ORDER BY rated_at DESC, id DESC LIMIT 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_item_rating_latest_del
+AFTER DELETE ON item_rating
+FOR EACH ROW BEGIN
+  DELETE FROM item_rating_latest
+  WHERE item_id = OLD.item_id AND source_id = OLD.source_id AND rating_id = OLD.id;
+  INSERT OR IGNORE INTO item_rating_latest(item_id, source_id, rating_id)
+  SELECT item_id, source_id, id FROM item_rating
+  WHERE item_id = OLD.item_id AND source_id = OLD.source_id
+  ORDER BY rated_at DESC, id DESC LIMIT 1;
+END;
 
 -- Tags + external refs (used by Itch importer & exports)
 CREATE TABLE IF NOT EXISTS tag (
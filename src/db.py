@@ -1,13 +1,128 @@
+import re
 import sqlite3
+import unicodedata
+import weakref
+from collections import OrderedDict
 from pathlib import Path
+from urllib.parse import urlsplit
 SCHEMA_PATH = Path(__file__).resolve().parents[1] / 'db' / 'schema.sql'
 STORAGE_DIR = Path(__file__).resolve().parents[1] / 'data' / 'sys'
 
-def connect(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(STORAGE_DIR / db_path)
+# ---------- Identity-map cache ----------
+class IdCache:
+    """
+    Bounded LRU maps for ids that almost never change:
+      item   (title, media_code) -> id
+      tag    name -> id
+      source name -> id
+      scale  name -> id
+    Filled lazily by the lookup helpers below (or in bulk via preload) and
+    invalidated by the writes in this module that delete or re-key rows.
+    """
+    NAMESPACES = ("item", "tag", "source", "scale")
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self._maps = {ns: OrderedDict() for ns in self.NAMESPACES}
+        self.hits = dict.fromkeys(self.NAMESPACES, 0)
+        self.misses = dict.fromkeys(self.NAMESPACES, 0)
+
+    def get(self, ns, key):
+        m = self._maps[ns]
+        value = m.get(key)
+        if value is None:
+            self.misses[ns] += 1
+            return None
+        m.move_to_end(key)
+        self.hits[ns] += 1
+        return value
+
+    def put(self, ns, key, value):
+        m = self._maps[ns]
+        m[key] = value
+        m.move_to_end(key)
+        if len(m) > self.maxsize:
+            m.popitem(last=False)
+
+    def preload(self, ns, pairs):
+        for key, value in pairs:
+            self.put(ns, key, value)
+
+    def invalidate(self, ns=None, key=None):
+        if ns is None:
+            for m in self._maps.values():
+                m.clear()
+        elif key is None:
+            self._maps[ns].clear()
+        else:
+            self._maps[ns].pop(key, None)
+
+    def stats(self):
+        out = {}
+        for ns in self.NAMESPACES:
+            h, m = self.hits[ns], self.misses[ns]
+            out[ns] = {"hits": h, "misses": m, "size": len(self._maps[ns]),
+                       "hit_rate": round(h / (h + m), 4) if h + m else 0.0}
+        return out
+
+class Connection(sqlite3.Connection):
+    """sqlite3 connection that carries an IdCache as conn.ids."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ids = IdCache()
+
+    def rollback(self):
+        # ids handed out inside the rolled-back transaction may no longer exist
+        super().rollback()
+        self.ids.invalidate()
+
+_connections = weakref.WeakSet()
+
+def _ids(conn):
+    return getattr(conn, "ids", None)
+
+def id_cache_stats():
+    """IdCache stats summed over every connection opened through connect()."""
+    total = {}
+    for conn in list(_connections):
+        for ns, st in conn.ids.stats().items():
+            agg = total.setdefault(ns, {"hits": 0, "misses": 0, "size": 0})
+            for k in agg:
+                agg[k] += st[k]
+    for agg in total.values():
+        n = agg["hits"] + agg["misses"]
+        agg["hit_rate"] = round(agg["hits"] / n, 4) if n else 0.0
+    return total
+
+def preload_ids(conn, *, items=False):
+    """Fills conn.ids from the small lookup tables (and optionally every item)."""
+    ids = conn.ids
+    ids.preload("source", conn.execute("SELECT name, id FROM rating_source"))
+    ids.preload("scale", conn.execute("SELECT name, id FROM rating_scale"))
+    ids.preload("tag", conn.execute("SELECT name, id FROM tag"))
+    if items:
+        ids.preload("item", (((t, m), i) for t, m, i in
+                             conn.execute("SELECT title, media_code, id FROM item")))
+
+# tracing.enable() swaps in its instrumented subclass
+connection_factory = Connection
+
+def connect(db_path: str, *, readonly=False, factory=None, check_same_thread=True) -> sqlite3.Connection:
+    """
+    readonly opens the file with mode=ro (the database must already be in
+    WAL mode, which any earlier writable connect() leaves it in).
+    """
+    factory = factory or connection_factory
+    if readonly:
+        uri = (STORAGE_DIR / db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, factory=factory, check_same_thread=check_same_thread)
+    else:
+        conn = sqlite3.connect(STORAGE_DIR / db_path, factory=factory, check_same_thread=check_same_thread)
+    _connections.add(conn)
     conn.row_factory = sqlite3.Row
     conn.execute('PRAGMA foreign_keys = ON;')
-    conn.execute('PRAGMA journal_mode = WAL;')
+    if not readonly:
+        conn.execute('PRAGMA journal_mode = WAL;')
     conn.execute('PRAGMA synchronous = NORMAL;')
     return conn
 
@@ -17,21 +132,540 @@ def init_db(db_path: str):
         sql = f.read()
     conn.executescript(sql)
     conn.commit()
+    migrate(conn)
     conn.close()
 
+# ---------- Latest rating per (item, source) ----------
+_LATEST_SQL = """
+    SELECT item_id, source_id, id AS rating_id FROM (
+      SELECT item_id, source_id, id,
+             ROW_NUMBER() OVER (PARTITION BY item_id, source_id
+                                ORDER BY rated_at DESC, id DESC) AS rn
+      FROM item_rating
+    ) WHERE rn = 1
+"""
+
+def _rebuild_rating_latest(conn) -> int:
+    conn.execute("DELETE FROM item_rating_latest")
+    cur = conn.execute(f"INSERT INTO item_rating_latest(item_id, source_id, rating_id) {_LATEST_SQL}")
+    return cur.rowcount
+
+def rebuild_rating_latest(conn) -> int:
+    """Recomputes item_rating_latest from the full history; returns the row count."""
+    n = _rebuild_rating_latest(conn)
+    conn.commit()
+    return n
+
+def check_rating_latest(conn) -> int:
+    """Number of (item, source) pairs where item_rating_latest disagrees with the history."""
+    q = f"""
+    SELECT COUNT(*) FROM (
+      SELECT * FROM ({_LATEST_SQL}) EXCEPT SELECT item_id, source_id, rating_id FROM item_rating_latest
+      UNION ALL
+      SELECT item_id, source_id, rating_id FROM item_rating_latest EXCEPT SELECT * FROM ({_LATEST_SQL})
+    )
+    """
+    return conn.execute(q).fetchone()[0]
+
+# ---------- Full-text index (item_fts, migration 3) ----------
+def _sync_item_fts(conn) -> int:
+    """Rewrites the item_fts rows of every queued item id. No commit."""
+    n = conn.execute("SELECT COUNT(*) FROM item_fts_pending").fetchone()[0]
+    if not n:
+        return 0
+    # all deletes, then all inserts, each in rowid order: FTS5 keeps appending
+    # to one in-memory segment instead of flushing per row
+    conn.execute("DELETE FROM item_fts WHERE rowid IN (SELECT item_id FROM item_fts_pending)")
+    conn.execute("""
+        INSERT INTO item_fts(rowid, title, description, tags)
+        SELECT i.id, i.title, COALESCE(i.description, ''),
+               COALESCE((SELECT group_concat(t.name, ' ') FROM item_tag it JOIN tag t ON t.id = it.tag_id
+                         WHERE it.item_id = i.id), '')
+        FROM item_fts_pending p
+        JOIN item i ON i.id = p.item_id
+        ORDER BY i.id""")
+    conn.execute("DELETE FROM item_fts_pending")
+    return n
+
+def sync_item_fts(conn) -> int:
+    """Brings item_fts up to date with item/item_tag; returns the rows rewritten."""
+    n = _sync_item_fts(conn)
+    conn.commit()
+    return n
+
+# ---------- Normalized title keys (item_title_key, migration 5) ----------
+_URL_TITLE = re.compile(r"^[a-z][a-z0-9+.-]*://", re.I)
+_NON_WORD = re.compile(r"[\W_]+")
+
+def title_key(title: str) -> str:
+    """
+    Case-, accent- and punctuation-insensitive form of a title. URL titles
+    (left behind by fetch-itchio-rating) become their slug, so
+    https://anuke.itch.io/mindustry, "MINDUSTRY" and "Mindustry!" share a key.
+    """
+    t = title.strip()
+    if _URL_TITLE.match(t):
+        parts = urlsplit(t)
+        segments = [seg for seg in parts.path.split("/") if seg]
+        t = segments[-1] if segments else parts.netloc.split(".")[0]
+    t = unicodedata.normalize("NFKD", t)
+    t = "".join(ch for ch in t if not unicodedata.combining(ch)).casefold()
+    return _NON_WORD.sub(" ", t).strip() or title.strip().casefold()
+
+def _refresh_title_keys(conn, batch=10000, into="item_title_key") -> int:
+    """Computes item_title_key for items that have none, inserting into `into` (same columns). No commit."""
+    done, last = 0, 0
+    while True:
+        rows = conn.execute("""
+            SELECT i.id, i.media_code, i.title FROM item i
+            WHERE i.id > ? AND NOT EXISTS (SELECT 1 FROM item_title_key k WHERE k.item_id = i.id)
+            ORDER BY i.id LIMIT ?""", (last, batch)).fetchall()
+        if not rows:
+            return done
+        conn.executemany(f"INSERT INTO {into}(item_id, media_code, title_key) VALUES (?,?,?)",
+                         [(r[0], r[1], title_key(r[2])) for r in rows])
+        done += len(rows)
+        last = rows[-1][0]
+
+def refresh_title_keys(conn) -> int:
+    n = _refresh_title_keys(conn)
+    conn.commit()
+    return n
+
+# ---------- Rating rollups ----------
+# Appended to an INSERT INTO item_rating_rollup ... SELECT: folds the new
+# aggregate into an existing row for the same (item, source, bucket, period).
+ROLLUP_UPSERT = """
+    ON CONFLICT(item_id, source_id, bucket, period) DO UPDATE SET
+      n_rows = n_rows + excluded.n_rows,
+      n_seen = n_seen + excluded.n_seen,
+      percent_min = MIN(percent_min, excluded.percent_min),
+      percent_max = MAX(percent_max, excluded.percent_max),
+      percent_sum = percent_sum + excluded.percent_sum,
+      percent_last = CASE WHEN excluded.last_at >= last_at THEN excluded.percent_last ELSE percent_last END,
+      votes_min = COALESCE(MIN(votes_min, excluded.votes_min), votes_min, excluded.votes_min),
+      votes_max = COALESCE(MAX(votes_max, excluded.votes_max), votes_max, excluded.votes_max),
+      votes_last = CASE WHEN excluded.last_at >= last_at THEN excluded.votes_last ELSE votes_last END,
+      first_at = MIN(first_at, excluded.first_at),
+      last_at = MAX(last_at, excluded.last_at)"""
+
+def _has_table(conn, name) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+# ---------- Item merging (no commit; caller owns the transaction) ----------
+def _merge_items(conn) -> int:
+    """
+    Folds every item listed in the temp table _merge(dup_id, keep_id) into its
+    keep_id: ratings are re-pointed, tags/platforms/refs are unioned, a missing
+    description is filled in, then the duplicates are deleted.
+    """
+    if _ids(conn):
+        _ids(conn).invalidate("item")
+    steps = [
+        "UPDATE item_rating SET item_id = (SELECT keep_id FROM _merge WHERE dup_id = item_rating.item_id) "
+        "WHERE item_id IN (SELECT dup_id FROM _merge)",
+        "INSERT OR IGNORE INTO item_tag(item_id, tag_id) "
+        "SELECT m.keep_id, t.tag_id FROM item_tag t JOIN _merge m ON m.dup_id = t.item_id",
+        "INSERT OR IGNORE INTO item_platform(item_id, platform_code) "
+        "SELECT m.keep_id, p.platform_code FROM item_platform p JOIN _merge m ON m.dup_id = p.item_id",
+        "INSERT OR IGNORE INTO external_ref(item_id, source, external_id, url) "
+        "SELECT m.keep_id, e.source, e.external_id, e.url FROM external_ref e JOIN _merge m ON m.dup_id = e.item_id",
+        "UPDATE item SET description = (SELECT d.description FROM _merge m JOIN item d ON d.id = m.dup_id "
+        "                               WHERE m.keep_id = item.id AND d.description IS NOT NULL "
+        "                               ORDER BY d.id LIMIT 1) "
+        "WHERE description IS NULL AND id IN (SELECT keep_id FROM _merge)",
+        "DELETE FROM item WHERE id IN (SELECT dup_id FROM _merge)",
+    ]
+    if _has_table(conn, "item_rating_rollup"):      # schema version 6+
+        steps[1:1] = [
+            "UPDATE item_rating_archive SET item_id = (SELECT keep_id FROM _merge WHERE dup_id = item_rating_archive.item_id) "
+            "WHERE item_id IN (SELECT dup_id FROM _merge)",
+            "INSERT INTO item_rating_rollup SELECT m.keep_id, u.source_id, u.bucket, u.period, u.n_rows, u.n_seen, "
+            "u.percent_min, u.percent_max, u.percent_sum, u.percent_last, u.votes_min, u.votes_max, u.votes_last, "
+            "u.first_at, u.last_at FROM item_rating_rollup u JOIN _merge m ON m.dup_id = u.item_id WHERE true"
+            + ROLLUP_UPSERT,
+        ]
+    for sql in steps:
+        conn.execute(sql)
+    return conn.execute("SELECT COUNT(*) FROM _merge").fetchone()[0]
+
+# ---------- Schema migrations (PRAGMA user_version) ----------
+# schema.sql is the idempotent baseline; anything that has to transform an
+# existing database is a numbered step here. Steps run inside one transaction
+# each, must not commit, and are never edited once released: add a new one.
+def _m1_backfill_latest(conn):
+    _rebuild_rating_latest(conn)
+
+def _m2_lookup_indexes(conn):
+    # exact duplicates would block the unique index: merge them into the oldest row
+    conn.execute("DROP TABLE IF EXISTS temp._merge")
+    conn.execute("""
+        CREATE TEMP TABLE _merge AS
+        SELECT i.id AS dup_id, k.keep_id
+        FROM item i
+        JOIN (SELECT media_code, title, MIN(id) AS keep_id FROM item
+              GROUP BY media_code, title HAVING COUNT(*) > 1) k
+          ON k.media_code = i.media_code AND k.title = i.title
+        WHERE i.id <> k.keep_id""")
+    _merge_items(conn)
+    conn.execute("DROP TABLE temp._merge")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_item_media_title ON item(media_code, title)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_tag_tag ON item_tag(tag_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_external_ref_source_ext ON external_ref(source, external_id)")
+
+def _m3_item_fts(conn):
+    # rowid = item.id; title/description/tags weighted 10/1/4 in the bm25 rank
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5(
+          title, description, tags,
+          tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""")
+    conn.execute("INSERT INTO item_fts(item_fts, rank) VALUES('rank', 'bm25(10.0, 1.0, 4.0)')")
+    # Triggers only queue item ids; sync_item_fts() rewrites each queued row once.
+    # Rewriting item_fts directly from item_tag triggers costs one FTS segment
+    # flush per tag (FTS5 flushes whenever a rowid repeats), which made bulk
+    # imports ~45x slower.
+    conn.execute("CREATE TABLE IF NOT EXISTS item_fts_pending (item_id INTEGER PRIMARY KEY)")
+    for sql in (
+        """CREATE TRIGGER IF NOT EXISTS trg_item_fts_ins AFTER INSERT ON item BEGIN
+             INSERT OR IGNORE INTO item_fts_pending(item_id) VALUES (NEW.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_item_fts_upd AFTER UPDATE OF title, description ON item BEGIN
+             INSERT OR IGNORE INTO item_fts_pending(item_id) VALUES (NEW.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_item_fts_del AFTER DELETE ON item BEGIN
+             INSERT OR IGNORE INTO item_fts_pending(item_id) VALUES (OLD.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_item_tag_fts_ins AFTER INSERT ON item_tag BEGIN
+             INSERT OR IGNORE INTO item_fts_pending(item_id) VALUES (NEW.item_id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_item_tag_fts_del AFTER DELETE ON item_tag BEGIN
+             INSERT OR IGNORE INTO item_fts_pending(item_id) VALUES (OLD.item_id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_tag_fts_upd AFTER UPDATE OF name ON tag BEGIN
+             INSERT OR IGNORE INTO item_fts_pending(item_id)
+             SELECT item_id FROM item_tag WHERE tag_id = NEW.id;
+           END""",
+    ):
+        conn.execute(sql)
+    conn.execute("DELETE FROM item_fts")
+    conn.execute("INSERT OR IGNORE INTO item_fts_pending(item_id) SELECT id FROM item")
+    _sync_item_fts(conn)
+    conn.execute("INSERT INTO item_fts(item_fts) VALUES('optimize')")
+
+def _m4_item_similar(conn):
+    # top-N neighbours per item, written by similar.build_similar(); no FKs so
+    # deleted items can still be found in neighbor_id and refreshed away
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_similar (
+          item_id INTEGER NOT NULL,
+          rank INTEGER NOT NULL,
+          neighbor_id INTEGER NOT NULL,
+          score REAL NOT NULL,
+          PRIMARY KEY (item_id, rank)
+        ) WITHOUT ROWID""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_similar_neighbor ON item_similar(neighbor_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_similar_build (
+          id INTEGER PRIMARY KEY CHECK (id = 1),
+          built_at TEXT NOT NULL,
+          top_n INTEGER NOT NULL,
+          rating_weight REAL NOT NULL,
+          n_items INTEGER NOT NULL
+        )""")
+    conn.execute("CREATE TABLE IF NOT EXISTS item_similar_pending (item_id INTEGER PRIMARY KEY)")
+    for sql in (
+        """CREATE TRIGGER IF NOT EXISTS trg_item_similar_ins AFTER INSERT ON item BEGIN
+             INSERT OR IGNORE INTO item_similar_pending(item_id) VALUES (NEW.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_item_similar_del AFTER DELETE ON item BEGIN
+             INSERT OR IGNORE INTO item_similar_pending(item_id) VALUES (OLD.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_item_tag_similar_ins AFTER INSERT ON item_tag BEGIN
+             INSERT OR IGNORE INTO item_similar_pending(item_id) VALUES (NEW.item_id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_item_tag_similar_del AFTER DELETE ON item_tag BEGIN
+             INSERT OR IGNORE INTO item_similar_pending(item_id) VALUES (OLD.item_id);
+           END""",
+        # co-rating features only use 'user' sources: scraped ratings don't queue
+        """CREATE TRIGGER IF NOT EXISTS trg_item_rating_similar AFTER INSERT ON item_rating
+           WHEN (SELECT kind FROM rating_source WHERE id = NEW.source_id) = 'user' BEGIN
+             INSERT OR IGNORE INTO item_similar_pending(item_id) VALUES (NEW.item_id);
+           END""",
+    ):
+        conn.execute(sql)
+
+def _m5_title_keys(conn):
+    # normalized titles live beside item, not in it: backfilling a column on
+    # item would bump every updated_at through trg_item_updated_at
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_title_key (
+          item_id INTEGER PRIMARY KEY REFERENCES item(id) ON DELETE CASCADE,
+          media_code TEXT NOT NULL,
+          title_key TEXT NOT NULL
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_title_key ON item_title_key(media_code, title_key)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_external_ref_url ON external_ref(url, source)")
+    # a renamed item loses its key; refresh_title_keys() recomputes it
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_item_title_key_upd AFTER UPDATE OF title, media_code ON item BEGIN
+          DELETE FROM item_title_key WHERE item_id = NEW.id;
+        END""")
+    _refresh_title_keys(conn)
+
+def _m6_change_only_ratings(conn):
+    # a rating identical to the latest one for its (item, source) extends that
+    # row (last_seen_at, seen_count) instead of adding a new one
+    conn.execute("ALTER TABLE item_rating ADD COLUMN last_seen_at TEXT")
+    conn.execute("ALTER TABLE item_rating ADD COLUMN seen_count INTEGER NOT NULL DEFAULT 1")
+    # compact_history() folds old rows into per-day/month rollups (and
+    # optionally keeps the raw rows in item_rating_archive)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_rating_rollup (
+          item_id INTEGER NOT NULL REFERENCES item(id) ON DELETE CASCADE,
+          source_id INTEGER NOT NULL REFERENCES rating_source(id),
+          bucket TEXT NOT NULL CHECK (bucket IN ('day', 'month')),
+          period TEXT NOT NULL,
+          n_rows INTEGER NOT NULL,
+          n_seen INTEGER NOT NULL,
+          percent_min INTEGER NOT NULL,
+          percent_max INTEGER NOT NULL,
+          percent_sum INTEGER NOT NULL,
+          percent_last INTEGER NOT NULL,
+          votes_min INTEGER,
+          votes_max INTEGER,
+          votes_last INTEGER,
+          first_at TEXT NOT NULL,
+          last_at TEXT NOT NULL,
+          PRIMARY KEY (item_id, source_id, bucket, period)
+        ) WITHOUT ROWID""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_rating_archive (
+          id INTEGER PRIMARY KEY,
+          item_id INTEGER NOT NULL REFERENCES item(id) ON DELETE CASCADE,
+          source_id INTEGER NOT NULL REFERENCES rating_source(id),
+          scale_id INTEGER NOT NULL REFERENCES rating_scale(id),
+          raw_value TEXT,
+          value_num REAL,
+          percent INTEGER NOT NULL,
+          vote_count INTEGER,
+          confidence REAL NOT NULL,
+          rated_at TEXT NOT NULL,
+          notes TEXT,
+          last_seen_at TEXT,
+          seen_count INTEGER NOT NULL DEFAULT 1
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_rating_archive_item "
+                 "ON item_rating_archive(item_id, source_id, rated_at)")
+
+def _m7_export_changes(conn):
+    # Delta exports read changed items from item_change, not from timestamps:
+    # rated_at can be back-dated by imports, tag/platform edits don't touch
+    # item.updated_at, and deletes leave no row. The log is append-only (a
+    # plain insert is the cheapest thing a trigger can do during bulk imports),
+    # is only written while some export target exists, and export_delta()
+    # prunes what every target has seen. seq is AUTOINCREMENT: it never goes
+    # backwards, even after pruning. With a single writer, a change committed
+    # after an export read MAX(seq) always gets a higher seq, so the next
+    # export picks it up.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_watermark (
+          target TEXT PRIMARY KEY,
+          change_seq INTEGER NOT NULL,
+          rating_id INTEGER NOT NULL,
+          delta_seq INTEGER NOT NULL,
+          exported_at TEXT
+        )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_change (
+          seq INTEGER PRIMARY KEY AUTOINCREMENT,
+          item_id INTEGER NOT NULL
+        )""")
+    when = "WHEN EXISTS (SELECT 1 FROM export_watermark)"
+    for name, event, ref in (
+        ("trg_item_change_ins", "AFTER INSERT ON item", "NEW.id"),
+        ("trg_item_change_upd", "AFTER UPDATE OF title, media_code ON item", "NEW.id"),
+        ("trg_item_change_del", "AFTER DELETE ON item", "OLD.id"),
+        ("trg_item_tag_change_ins", "AFTER INSERT ON item_tag", "NEW.item_id"),
+        ("trg_item_tag_change_del", "AFTER DELETE ON item_tag", "OLD.item_id"),
+        ("trg_item_platform_change_ins", "AFTER INSERT ON item_platform", "NEW.item_id"),
+        ("trg_item_platform_change_del", "AFTER DELETE ON item_platform", "OLD.item_id"),
+        ("trg_item_rating_change_ins", "AFTER INSERT ON item_rating", "NEW.item_id"),
+    ):
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} {when} BEGIN "
+                     f"INSERT INTO item_change(item_id) VALUES ({ref}); END")
+    # re-pointed or edited ratings change both items' rows
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_item_rating_change_upd
+        AFTER UPDATE OF item_id, source_id, percent, vote_count, rated_at ON item_rating {when} BEGIN
+          INSERT INTO item_change(item_id) VALUES (OLD.item_id);
+          INSERT INTO item_change(item_id) SELECT NEW.item_id WHERE NEW.item_id <> OLD.item_id;
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_tag_change_upd AFTER UPDATE OF name ON tag {when} BEGIN
+          INSERT INTO item_change(item_id) SELECT item_id FROM item_tag WHERE tag_id = NEW.id;
+        END""")
+    # ledger exports filter (--since) and sort on rated_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_rating_rated_at ON item_rating(rated_at)")
+
+# Percent an item sorts by in keyset pages: its latest rating from the first
+# user-kind source, else the first external one (sources in id order), the
+# same precedence export uses for sources="all".
+_RANK_PERCENT_SQL = """
+    (SELECT r.percent FROM item_rating_latest l
+     JOIN item_rating r ON r.id = l.rating_id
+     JOIN rating_source s ON s.id = l.source_id
+     WHERE l.item_id = {item} AND r.percent IS NOT NULL
+     ORDER BY s.kind <> 'user', s.id LIMIT 1)
+"""
+
+def _rebuild_item_rank(conn) -> int:
+    conn.execute("DELETE FROM item_rank")
+    cur = conn.execute("INSERT INTO item_rank(item_id, percent, title) "
+                       f"SELECT i.id, {_RANK_PERCENT_SQL.format(item='i.id')}, i.title FROM item i")
+    return cur.rowcount
+
+def _m8_item_rank(conn):
+    # Keyset pages need an index that matches the sort. The export sort key
+    # is a pivot over item_rating_latest, so it is kept per item in item_rank
+    # by triggers. sort_key is a generated column (unrated items last) so the
+    # index can serve (sort_key, title, item_id) > (?, ?, ?) seeks; a plain
+    # expression index only gets scanned for row-value comparisons.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS item_rank (
+          item_id INTEGER PRIMARY KEY,
+          percent INTEGER,
+          title TEXT NOT NULL,
+          sort_key INTEGER GENERATED ALWAYS AS (-COALESCE(percent, -1)) VIRTUAL
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_item_rank_order ON item_rank(sort_key, title, item_id)")
+    _create_item_rank_triggers(conn)
+    _rebuild_item_rank(conn)
+
+def _create_item_rank_triggers(conn):
+    rank = "UPDATE item_rank SET percent = {pct} WHERE item_id = {item};"
+    for name, event, body in (
+        # a new item has no ratings yet
+        ("trg_item_rank_item_ins", "AFTER INSERT ON item",
+         "INSERT OR REPLACE INTO item_rank(item_id, percent, title) VALUES (NEW.id, NULL, NEW.title);"),
+        ("trg_item_rank_item_upd", "AFTER UPDATE OF title ON item",
+         "UPDATE item_rank SET title = NEW.title WHERE item_id = NEW.id;"),
+        ("trg_item_rank_item_del", "AFTER DELETE ON item",
+         "DELETE FROM item_rank WHERE item_id = OLD.id;"),
+        ("trg_item_rank_latest_ins", "AFTER INSERT ON item_rating_latest",
+         rank.format(pct=_RANK_PERCENT_SQL.format(item="NEW.item_id"), item="NEW.item_id")),
+        ("trg_item_rank_latest_upd", "AFTER UPDATE OF item_id, source_id, rating_id ON item_rating_latest",
+         rank.format(pct=_RANK_PERCENT_SQL.format(item="OLD.item_id"), item="OLD.item_id") +
+         rank.format(pct=_RANK_PERCENT_SQL.format(item="NEW.item_id"), item="NEW.item_id")),
+        ("trg_item_rank_latest_del", "AFTER DELETE ON item_rating_latest",
+         rank.format(pct=_RANK_PERCENT_SQL.format(item="OLD.item_id"), item="OLD.item_id")),
+        ("trg_item_rank_rating_upd", "AFTER UPDATE OF percent ON item_rating",
+         rank.format(pct=_RANK_PERCENT_SQL.format(item="NEW.item_id"), item="NEW.item_id")),
+        ("trg_item_rank_source_upd", "AFTER UPDATE OF kind ON rating_source",
+         "UPDATE item_rank SET percent = " + _RANK_PERCENT_SQL.format(item="item_rank.item_id") +
+         " WHERE item_id IN (SELECT item_id FROM item_rating_latest WHERE source_id = NEW.id);"),
+    ):
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+def _m9_latest_rated_at(conn):
+    # latest_only ledger pages walk item_rating_latest in (rated_at, rating_id)
+    # order; filtering the full history by "is latest" reads every old row.
+    # rated_at is copied in after each insert: the schema triggers write the
+    # row with INSERT OR REPLACE, so this also covers re-pointed pairs.
+    conn.execute("ALTER TABLE item_rating_latest ADD COLUMN rated_at TEXT")
+    conn.execute("""
+        UPDATE item_rating_latest
+        SET rated_at = (SELECT r.rated_at FROM item_rating r WHERE r.id = item_rating_latest.rating_id)""")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_item_rating_latest_rated_at
+        ON item_rating_latest(rated_at, rating_id)""")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_item_rating_latest_rated_at
+        AFTER INSERT ON item_rating_latest
+        FOR EACH ROW BEGIN
+          UPDATE item_rating_latest
+          SET rated_at = (SELECT rated_at FROM item_rating WHERE id = NEW.rating_id)
+          WHERE item_id = NEW.item_id AND source_id = NEW.source_id;
+        END""")
+    # that update must not recompute item_rank a second time
+    conn.execute("DROP TRIGGER IF EXISTS trg_item_rank_latest_upd")
+    _create_item_rank_triggers(conn)
+
+def _m10_rating_change_ids(conn):
+    # Delta exports took the ledger as an item_rating id range past the last
+    # watermark, but item_rating ids are plain rowids: deleting the top row
+    # (compact-history, item deletes) lets the next insert reuse its id below
+    # the watermark. Rating inserts now log their id in item_change, whose
+    # AUTOINCREMENT seq never goes backwards; export_watermark.rating_id is
+    # no longer read. Existing targets restart with a full snapshot, since
+    # inserts logged before this step carry no rating id.
+    conn.execute("ALTER TABLE item_change ADD COLUMN rating_id INTEGER")
+    conn.execute("DROP TRIGGER IF EXISTS trg_item_rating_change_ins")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_item_rating_change_ins
+        AFTER INSERT ON item_rating WHEN EXISTS (SELECT 1 FROM export_watermark) BEGIN
+          INSERT INTO item_change(item_id, rating_id) VALUES (NEW.item_id, NEW.id);
+        END""")
+    conn.execute("UPDATE export_watermark SET delta_seq = 0")
+
+MIGRATIONS = [
+    (1, "backfill item_rating_latest", _m1_backfill_latest),
+    (2, "unique item(media_code, title); item_tag(tag_id); external_ref(source, external_id)", _m2_lookup_indexes),
+    (3, "item_fts full-text index over title, description and tags", _m3_item_fts),
+    (4, "item_similar neighbour table and refresh queue", _m4_item_similar),
+    (5, "item_title_key normalized titles; external_ref(url, source)", _m5_title_keys),
+    (6, "item_rating last_seen_at/seen_count; item_rating_rollup and item_rating_archive", _m6_change_only_ratings),
+    (7, "item_change log and export_watermark for delta exports; item_rating(rated_at)", _m7_export_changes),
+    (8, "item_rank sort keys for keyset-paginated item pages", _m8_item_rank),
+    (9, "item_rating_latest(rated_at, rating_id) for latest-only ledger pages", _m9_latest_rated_at),
+    (10, "item_change.rating_id: delta ledgers follow the change log, not rowid ranges", _m10_rating_change_ids),
+]
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn, *, analyze=True):
+    """Applies pending MIGRATIONS in order; returns [(version, description)] applied."""
+    applied = []
+    conn.commit()
+    for version, desc, step in MIGRATIONS:
+        if version <= schema_version(conn):
+            continue
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append((version, desc))
+    if applied and _ids(conn):
+        _ids(conn).invalidate()
+    if applied and analyze:
+        conn.execute("ANALYZE")
+        conn.commit()
+    return applied
+
 # ---------- Items / platforms / tags ----------
 def ensure_item(conn, title: str, media_code: str, description: str=None) -> int:
-    row = conn.execute("SELECT id FROM item WHERE title=? AND media_code=?", (title, media_code)).fetchone()
-    if row:
+    ids = _ids(conn)
+    item_id = ids.get("item", (title, media_code)) if ids else None
+    if item_id is None:
+        row = conn.execute("SELECT id FROM item WHERE title=? AND media_code=?", (title, media_code)).fetchone()
+        item_id = row["id"] if row else None
+    if item_id is not None:
         if description:
-            conn.execute("UPDATE item SET description=COALESCE(description, ?) WHERE id=?", (description, row["id"]))
+            conn.execute("UPDATE item SET description=COALESCE(description, ?) WHERE id=?", (description, item_id))
             conn.commit()
-        return row["id"]
-    cur = conn.execute("INSERT INTO item(media_code,title,description) VALUES(?,?,?)", (media_code, title, description))
-    conn.commit()
-    return cur.lastrowid
+    else:
+        cur = conn.execute("INSERT INTO item(media_code,title,description) VALUES(?,?,?)", (media_code, title, description))
+        conn.commit()
+        item_id = cur.lastrowid
+    if ids:
+        ids.put("item", (title, media_code), item_id)
+    return item_id
 
-def set_platforms(conn, item_id: int, plat_list):
+def platform_codes(plat_list):
     codes = set()
     for raw in plat_list or []:
         s = str(raw).lower()
@@ -41,16 +675,47 @@ def set_platforms(conn, item_id: int, plat_list):
         elif s in ("mac","macos","osx"): codes.add("mac")
         elif s=="android": codes.add("android")
         elif s=="ios": codes.add("ios")
-    for code in codes:
+    return codes
+
+def set_platforms(conn, item_id: int, plat_list):
+    for code in platform_codes(plat_list):
         conn.execute("INSERT OR IGNORE INTO item_platform(item_id,platform_code) VALUES (?,?)", (item_id, code))
     conn.commit()
 
 def ensure_tag(conn, name: str) -> int:
+    ids = _ids(conn)
+    tid = ids.get("tag", name) if ids else None
+    if tid is not None: return tid
     row = conn.execute("SELECT id FROM tag WHERE name=?", (name,)).fetchone()
-    if row: return row["id"]
-    cur = conn.execute("INSERT INTO tag(name) VALUES (?)", (name,))
-    conn.commit()
-    return cur.lastrowid
+    if row:
+        tid = row["id"]
+    else:
+        cur = conn.execute("INSERT INTO tag(name) VALUES (?)", (name,))
+        conn.commit()
+        tid = cur.lastrowid
+    if ids:
+        ids.put("tag", name, tid)
+    return tid
+
+def _lookup_id(conn, ns, table, name):
+    ids = _ids(conn)
+    value = ids.get(ns, name) if ids else None
+    if value is None:
+        row = conn.execute(f"SELECT id FROM {table} WHERE name=?", (name,)).fetchone()
+        if row is None:
+            return None
+        value = row["id"]
+        if ids:
+            ids.put(ns, name, value)
+    return value
+
+def source_id(conn, name: str):
+    """rating_source id by name (None if missing)."""
+    return _lookup_id(conn, "source", "rating_source", name)
+
+def scale_id(conn, name: str):
+    """rating_scale id by name (None if missing)."""
+    return _lookup_id(conn, "scale", "rating_scale", name)
 
 def attach_tags(conn, item_id: int, tags):
     if not tags: return
@@ -64,92 +729,352 @@ def attach_tags(conn, item_id: int, tags):
 def add_external_ref(conn, item_id: int, source: str, external_id: str=None, url: str=None):
     conn.execute(
         "INSERT OR IGNORE INTO external_ref(item_id,source,external_id,url) VALUES (?,?,?,?)",
-        (item_id, source, external_id, url)
+        (item_id, source, external_id or "", url or "")  # NULL would be silently ignored
     )
     conn.commit()
 
-def _dict_rows(cur):
+# ---------- Bulk helpers (no commit; caller owns the transaction) ----------
+def load_item_ids(conn, media_code: str=None) -> dict:
+    """{(title, media_code): id} for every item (optionally one media type)."""
+    cur = conn.execute(
+        "SELECT id, title, media_code FROM item WHERE ? IS NULL OR media_code = ?",
+        (media_code, media_code))
+    return {(r["title"], r["media_code"]): r["id"] for r in cur}
+
+def load_tag_ids(conn) -> dict:
+    return {r["name"]: r["id"] for r in conn.execute("SELECT id, name FROM tag")}
+
+def bulk_ensure_items(conn, item_ids: dict, rows):
+    """
+    rows: iterable of (title, media_code, description|None)
+    Inserts the items missing from item_ids with one executemany, fills in
+    missing descriptions on existing ones, and updates item_ids in place.
+    """
+    new, descs = {}, []
+    for title, media_code, desc in rows:
+        key = (title, media_code)
+        iid = item_ids.get(key)
+        if iid is None:
+            if key not in new or (desc and not new[key]):
+                new[key] = desc
+        elif desc:
+            descs.append((desc, iid))
+    if descs:
+        conn.executemany("UPDATE item SET description=? WHERE id=? AND description IS NULL", descs)
+    if new:
+        # ids of freshly inserted rows are read back by rowid watermark
+        floor = conn.execute("SELECT COALESCE(MAX(id), 0) FROM item").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO item(media_code,title,description) VALUES(?,?,?)",
+            [(m, t, d) for (t, m), d in new.items()])
+        for r in conn.execute("SELECT id, title, media_code FROM item WHERE id > ?", (floor,)):
+            item_ids[(r["title"], r["media_code"])] = r["id"]
+
+def bulk_ensure_tags(conn, tag_ids: dict, names):
+    missing = {n for n in names if n not in tag_ids}
+    if not missing:
+        return
+    missing = sorted(missing)
+    conn.executemany("INSERT OR IGNORE INTO tag(name) VALUES (?)", [(n,) for n in missing])
+    # re-read by name: OR IGNORE leaves no usable lastrowid
+    for start in range(0, len(missing), 500):
+        chunk = missing[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        for r in conn.execute(f"SELECT id, name FROM tag WHERE name IN ({marks})", chunk):
+            tag_ids[r["name"]] = r["id"]
+
+def _dict_rows(cur, size=1000):
     cols = [c[0] for c in cur.description]
-    for row in cur.fetchall():
-        yield {k: row[i] for i, k in enumerate(cols)}
-
-def _fetch_items_for_export(conn, *, media=None, platform=None, min_itchio=None, limit=None):
-    # latest itchio & latest fred via correlated subqueries (portable)
-    q = """
-    WITH plats AS (
-      SELECT item_id, GROUP_CONCAT(DISTINCT platform_code) AS platforms
-      FROM item_platform GROUP BY item_id
-    ),
-    tags AS (
-      SELECT it.item_id, GROUP_CONCAT(DISTINCT t.name) AS tags
-      FROM item_tag it JOIN tag t ON t.id = it.tag_id
-      GROUP BY it.item_id
-    ),
-    latest_itch AS (
-      SELECT r.*
-      FROM item_rating r
-      JOIN rating_source s ON s.id = r.source_id AND s.name = 'itchio'
-      WHERE r.rated_at = (
-        SELECT MAX(r2.rated_at)
-        FROM item_rating r2
-        JOIN rating_source s2 ON s2.id = r2.source_id AND s2.name = 'itchio'
-        WHERE r2.item_id = r.item_id
-      )
-    ),
-    latest_me AS (
-      SELECT r.*
-      FROM item_rating r
-      JOIN rating_source s ON s.id = r.source_id AND s.name = 'fred'
-      WHERE r.rated_at = (
-        SELECT MAX(r2.rated_at)
-        FROM item_rating r2
-        JOIN rating_source s2 ON s2.id = r2.source_id AND s2.name = 'fred'
-        WHERE r2.item_id = r.item_id
-      )
-    )
-    SELECT
+    while True:
+        batch = cur.fetchmany(size)
+        if not batch:
+            return
+        for row in batch:
+            yield dict(zip(cols, row))
+
+DEFAULT_EXPORT_SOURCES = ("itchio", "fred")
+
+def _column_prefix(name: str) -> str:
+    return re.sub(r"[^0-9a-z]+", "_", name.lower()).strip("_") or "source"
+
+def _resolve_export_sources(conn, sources):
+    """
+    sources: list of rating_source names, "all", or None for the defaults.
+    Returns [(name, id|None, kind|None)]; unknown names keep a slot (NULL columns).
+    """
+    known = {r["name"]: (r["id"], r["kind"]) for r in
+             conn.execute("SELECT id, name, kind FROM rating_source ORDER BY id")}
+    if sources == "all":
+        names = list(known)
+    else:
+        names = list(dict.fromkeys(sources or DEFAULT_EXPORT_SOURCES))
+    return [(n,) + known.get(n, (None, None)) for n in names]
+
+# Columns and sort precedence of the default (itchio, fred) export, kept
+# from before exports took --sources: fred's are my_percent / my_rated_at.
+_DEFAULT_EXPORT_COLUMNS = {
+    "itchio": (("percent", "itchio_percent"), ("vote_count", "itchio_votes"), ("rated_at", "itchio_rated_at")),
+    "fred": (("percent", "my_percent"), ("rated_at", "my_rated_at")),
+}
+_DEFAULT_EXPORT_RANK = ("fred", "itchio")
+_EXPORT_FIELDS = (("percent", "percent"), ("vote_count", "votes"), ("rated_at", "rated_at"))
+
+def _export_columns(srcs, default):
+    """
+    [(sid, [(item_rating field, column name)])] per source, and the columns
+    holding each source's percent by name. Sources whose names fold to the
+    same prefix ("a-b", "a_b") get their id (or position) appended, so no
+    column silently overwrites another in the dict rows.
+    """
+    if default:
+        out = [(sid, _DEFAULT_EXPORT_COLUMNS[name]) for name, sid, _ in srcs]
+        return out, {name: cols[0][1] for (name, _, _), (_, cols) in zip(srcs, out)}
+    prefixes = [_column_prefix(name) for name, _, _ in srcs]
+    out, percent = [], {}
+    for pos, ((name, sid, _), pre) in enumerate(zip(srcs, prefixes)):
+        if prefixes.count(pre) > 1:
+            pre = f"{pre}_{sid if sid is not None else pos}"
+        out.append((sid, [(field, f"{pre}_{col}") for field, col in _EXPORT_FIELDS]))
+        percent[name] = f"{pre}_percent"
+    return out, percent
+
+def _export_pivots(conn, sources):
+    """(pivot select exprs, their params, outer column refs, source ids, ranked percent cols)."""
+    srcs = _resolve_export_sources(conn, sources)
+    default = not sources
+    columns, percent = _export_columns(srcs, default)
+    cols, pivots, params = [], [], []
+    for sid, fields in columns:
+        for field, col in fields:
+            pivots.append(f'MAX(CASE WHEN l.source_id = ? THEN r.{field} END) AS "{col}"')
+            params.append(sid)
+            cols.append(f'lat."{col}"')
+    if default:
+        ranked = list(_DEFAULT_EXPORT_RANK)
+    else:
+        ranked = [n for n, _, k in srcs if k == "user"] + [n for n, _, k in srcs if k != "user"]
+    order = [f'lat."{percent[n]}"' for n in ranked]
+    ids = [sid for _, sid, _ in srcs if sid is not None]
+    return pivots, params, cols, ids, order
+
+_ITEM_COLUMNS = """
       i.id, i.title, i.media_code,
-      COALESCE(p.platforms, '') AS platforms,
-      COALESCE(g.tags, '') AS tags,
-      li.percent AS itchio_percent,
-      li.vote_count AS itchio_votes,
-      li.rated_at AS itchio_rated_at,
-      lm.percent AS my_percent,
-      lm.rated_at AS my_rated_at
-    FROM item i
-    LEFT JOIN plats p ON p.item_id = i.id
-    LEFT JOIN tags  g ON g.item_id = i.id
-    LEFT JOIN latest_itch li ON li.item_id = i.id
-    LEFT JOIN latest_me   lm ON lm.item_id = i.id
-    WHERE 1=1
+      COALESCE((SELECT GROUP_CONCAT(ip.platform_code) FROM item_platform ip
+                WHERE ip.item_id = i.id), '') AS platforms,
+      COALESCE((SELECT GROUP_CONCAT(t.name) FROM item_tag it JOIN tag t ON t.id = it.tag_id
+                WHERE it.item_id = i.id), '') AS tags"""
+
+_ITEM_FILTERS = """
       AND (? IS NULL OR i.media_code = ?)
       AND (? IS NULL OR EXISTS (
           SELECT 1 FROM item_platform ip
           WHERE ip.item_id = i.id AND ip.platform_code = ?
       ))
-      AND (? IS NULL OR (li.percent IS NOT NULL AND li.percent >= ?))
-    ORDER BY COALESCE(lm.percent, li.percent) DESC, i.title ASC
-    LIMIT COALESCE(?, 1000000)
+      AND (? IS NULL OR EXISTS (
+          SELECT 1 FROM item_rating_latest xl
+          JOIN rating_source xs ON xs.id = xl.source_id AND xs.name = 'itchio'
+          JOIN item_rating xr ON xr.id = xl.rating_id
+          WHERE xl.item_id = i.id AND xr.percent >= ?
+      ))"""
+
+def _fetch_items_for_export(conn, *, media=None, platform=None, min_itchio=None, limit=None,
+                            sources=None, changed=None):
+    """
+    One row per item with <source>_percent / _votes / _rated_at columns for
+    every requested source (default itchio + fred, or "all"). Latest ratings
+    are pivoted with conditional aggregation in a single pass over
+    item_rating_latest, however many sources are asked for. Rows are ordered
+    by the first available user-kind rating, then the other sources. The
+    default sources keep the original layout: itchio_percent / _votes /
+    _rated_at and my_percent / my_rated_at for fred, ordered fred first.
+    changed=(lo, hi) keeps only items logged in item_change with lo < seq <= hi.
+    """
+    pivots, params, cols, ids, order = _export_pivots(conn, sources)
+    order_by = (f"COALESCE({', '.join(order)}, NULL)" if order else "NULL")
+
+    q = f"""
+    WITH lat AS (
+      SELECT l.item_id{''.join(', ' + p for p in pivots)}
+      FROM item_rating_latest l
+      JOIN item_rating r ON r.id = l.rating_id
+      WHERE l.source_id IN ({",".join("?" * len(ids)) or "NULL"})
+      GROUP BY l.item_id
+    )
+    SELECT{_ITEM_COLUMNS}{''.join(', ' + c for c in cols)}
+    FROM item i
+    LEFT JOIN lat ON lat.item_id = i.id
+    WHERE 1=1{_ITEM_FILTERS}
+      AND (? IS NULL OR i.id IN (SELECT item_id FROM item_change WHERE seq > ? AND seq <= ?))
+    ORDER BY {order_by} DESC, i.title ASC
+    {"" if limit is None else "LIMIT ?"}
     """
-    params = (media, media, platform, platform, min_itchio, min_itchio, limit)
+    params += ids
+    lo, hi = changed or (None, None)
+    params += [media, media, platform, platform, min_itchio, min_itchio, lo, lo, hi]
+    if limit is not None:
+        params.append(limit)
     cur = conn.execute(q, params)
-    return list(_dict_rows(cur))
+    return _dict_rows(cur)
 
-def _fetch_ratings_ledger(conn, *, media=None, source=None, since=None, limit=None):
-    q = """
+_LEDGER_COLUMNS = """
     SELECT i.id AS item_id, i.title, i.media_code,
            s.name AS source, r.scale_id, r.raw_value, r.value_num,
-           r.percent, r.vote_count, r.confidence, r.rated_at
-    FROM item_rating r
-    JOIN item i ON i.id = r.item_id
-    JOIN rating_source s ON s.id = r.source_id
-    WHERE 1=1
+           r.percent, r.vote_count, r.confidence, r.rated_at"""
+
+_LEDGER_FILTERS = """
       AND (? IS NULL OR i.media_code = ?)
       AND (? IS NULL OR s.name = ?)
-      AND (? IS NULL OR r.rated_at >= ?)
-    ORDER BY r.rated_at DESC, i.title ASC
-    LIMIT COALESCE(?, 1000000)
+      AND (? IS NULL OR r.rated_at >= ?)"""
+
+def _fetch_ratings_ledger(conn, *, media=None, source=None, since=None, limit=None, latest_only=False,
+                          ids=None, changed=None):
+    # latest_only: one row per (item, source), read straight from item_rating_latest
+    # ids=(lo, hi): only item_rating rows with lo < id <= hi, in id (insertion)
+    # order (full snapshots: a rowid range scan, no sort)
+    # changed=(lo, hi): only ratings whose insert was logged in item_change
+    # with lo < seq <= hi, in seq order (delta exports; rowids can be reused)
+    # limit=None: every row
+    q = f"""{_LEDGER_COLUMNS}
+    FROM {{ratings}}
+    JOIN item i ON i.id = r.item_id
+    JOIN rating_source s ON s.id = r.source_id
+    WHERE 1=1{_LEDGER_FILTERS}
+      {{range}}
+    ORDER BY {{order}}
+    {"" if limit is None else "LIMIT ?"}
     """
-    params = (media, media, source, source, since, since, limit)
-    cur = conn.execute(q, params)
-    return list(_dict_rows(cur))
+    if changed:
+        # a reused rowid can be logged twice; its last insert is the live row
+        ratings = ("""(SELECT rating_id, MAX(seq) AS seq FROM item_change
+                       WHERE seq > ? AND seq <= ? AND rating_id IS NOT NULL GROUP BY rating_id) c
+                      JOIN item_rating r ON r.id = c.rating_id""")
+    elif latest_only:
+        ratings = "item_rating_latest l JOIN item_rating r ON r.id = l.rating_id"
+    else:
+        ratings = "item_rating r"
+    params = list(changed or []) + [media, media, source, source, since, since]
+    if ids:
+        params += ids
+    if limit is not None:
+        params.append(limit)
+    order = "c.seq" if changed else "r.id" if ids else "r.rated_at DESC, i.title ASC"
+    cur = conn.execute(q.format(ratings=ratings, range="AND r.id > ? AND r.id <= ?" if ids else "",
+                                order=order), params)
+    return _dict_rows(cur)
+
+# ---------- Keyset pages ----------
+# A page token is base64url JSON: [kind, query fingerprint, *sort key of the
+# last row]. The fingerprint ties it to the filters it was issued for.
+# Each page is an index seek past that key plus page_size + 1 rows, however
+# deep into the result it is, and rows written between pages never shift
+# or repeat the ones already seen.
+MAX_PAGE_SIZE = 10_000
+
+# (token helpers import lazily: db is on every command's startup path)
+def _page_fingerprint(kind, filters):
+    import hashlib, json
+    raw = json.dumps([kind, filters], sort_keys=True, default=str).encode()
+    return hashlib.blake2b(raw, digest_size=6).hexdigest()
+
+def _encode_page_token(kind, filters, key):
+    import base64, json
+    raw = json.dumps([kind, _page_fingerprint(kind, filters), *key], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_page_token(token, kind, filters, n_keys):
+    """Sort key from a token; ValueError if it is malformed or from another query."""
+    import base64, json
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("malformed page token")
+    if not isinstance(raw, list) or len(raw) != 2 + n_keys or raw[0] != kind:
+        raise ValueError(f"not a page token for {kind}")
+    if raw[1] != _page_fingerprint(kind, filters):
+        raise ValueError("page token was issued for different filters")
+    return raw[2:]
+
+def _page_size(page_size):
+    if not isinstance(page_size, int) or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page size must be 1..{MAX_PAGE_SIZE}")
+    return page_size
+
+def _fetch_items_page(conn, *, page_size, after=None, media=None, platform=None, min_itchio=None,
+                      sources=None):
+    """
+    One page of export rows (same columns as _fetch_items_for_export) and
+    the token for the next one (None on the last page). Pages follow
+    item_rank: best percent first (first user-kind source, else the first
+    external one, in source id order; unrated last), then title, then id.
+    That is the sources="all" export order whichever columns are asked for.
+    """
+    page_size = _page_size(page_size)
+    filters = [media, platform, min_itchio, sources if sources == "all" else list(sources or [])]
+    key = _decode_page_token(after, "items", filters, 3) if after else None
+    pivots, params, cols, ids, _order = _export_pivots(conn, sources)
+    q = f"""
+    WITH page AS (
+      SELECT k.item_id, k.sort_key, k.title
+      FROM item_rank k
+      JOIN item i ON i.id = k.item_id
+      WHERE {"(k.sort_key, k.title, k.item_id) > (?, ?, ?)" if key else "1=1"}{_ITEM_FILTERS}
+      ORDER BY k.sort_key, k.title, k.item_id
+      LIMIT ?
+    ),
+    lat AS (
+      SELECT l.item_id{''.join(', ' + p for p in pivots)}
+      FROM item_rating_latest l
+      JOIN item_rating r ON r.id = l.rating_id
+      WHERE l.item_id IN (SELECT item_id FROM page)
+        AND l.source_id IN ({",".join("?" * len(ids)) or "NULL"})
+      GROUP BY l.item_id
+    )
+    SELECT page.sort_key AS _sort_key,{_ITEM_COLUMNS}{''.join(', ' + c for c in cols)}
+    FROM page
+    JOIN item i ON i.id = page.item_id
+    LEFT JOIN lat ON lat.item_id = i.id
+    ORDER BY page.sort_key, page.title, page.item_id
+    """
+    params = (list(key or []) + [media, media, platform, platform, min_itchio, min_itchio, page_size + 1]
+              + params + ids)
+    rows = list(_dict_rows(conn.execute(q, params)))
+    token = None
+    if len(rows) > page_size:
+        del rows[page_size:]
+        last = rows[-1]
+        token = _encode_page_token("items", filters, (last["_sort_key"], last["title"], last["id"]))
+    for r in rows:
+        del r["_sort_key"]
+    return rows, token
+
+def _fetch_ratings_page(conn, *, page_size, after=None, media=None, source=None, since=None,
+                        latest_only=False):
+    """
+    One page of ledger rows (same columns as _fetch_ratings_ledger) and the
+    next page token. Pages are ordered rated_at DESC, then rating id DESC
+    (not title as in the full ledger), so idx_item_rating_rated_at, whose
+    entries end in the rowid, serves the whole sort. latest_only pages walk
+    idx_item_rating_latest_rated_at instead, never touching older ratings.
+    """
+    page_size = _page_size(page_size)
+    filters = [media, source, since, bool(latest_only)]
+    key = _decode_page_token(after, "ratings", filters, 2) if after else None
+    src, at, rid = (("item_rating_latest l JOIN item_rating r ON r.id = l.rating_id", "l.rated_at", "l.rating_id")
+                    if latest_only else ("item_rating r", "r.rated_at", "r.id"))
+    q = f"""{_LEDGER_COLUMNS}, r.id AS _rating_id
+    FROM {src}
+    JOIN item i ON i.id = r.item_id
+    JOIN rating_source s ON s.id = r.source_id
+    WHERE {f"({at}, {rid}) < (?, ?)" if key else "1=1"}{_LEDGER_FILTERS}
+    ORDER BY {at} DESC, {rid} DESC
+    LIMIT ?
+    """
+    params = list(key or []) + [media, media, source, source, since, since, page_size + 1]
+    rows = list(_dict_rows(conn.execute(q, params)))
+    token = None
+    if len(rows) > page_size:
+        del rows[page_size:]
+        token = _encode_page_token("ratings", filters, (rows[-1]["rated_at"], rows[-1]["_rating_id"]))
+    for r in rows:
+        del r["_rating_id"]
+    return rows, token
@@ -0,0 +1,224 @@
+import re
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from db import connect, _refresh_title_keys, _merge_items, _sync_item_fts, _URL_TITLE
+
+MINHASH_PERMS = 32       # signature length
+MINHASH_BANDS = 8        # LSH bands of MINHASH_PERMS // MINHASH_BANDS rows (~0.6 Jaccard S-curve)
+MAX_BUCKET = 50          # ignore LSH buckets bigger than this (generic titles)
+_PRIME = (1 << 31) - 1
+_DIGITS = re.compile(r"\d+")
+
+# ---------- Union-find over item ids ----------
+def _find(parent, x):
+    root = x
+    while parent.get(root, root) != root:
+        root = parent[root]
+    while parent.get(x, x) != root:       # path compression
+        parent[x], x = root, parent[x]
+    return root
+
+def _union(parent, reasons, ids, reason):
+    ids = list(ids)
+    root = _find(parent, ids[0])
+    for other in ids[1:]:
+        r = _find(parent, other)
+        if r != root:
+            parent[r] = root
+    reasons.append((ids[0], reason))
+
+def _id_groups(cur):
+    for row in cur:
+        ids = sorted({int(x) for x in row[-1].split(",")})
+        if len(ids) > 1:
+            yield ids
+
+# ---------- Blocking ----------
+def _title_keys(conn, *, write):
+    """
+    The table the title blockers read. write stores missing keys in
+    item_title_key (committed with the merge); otherwise they go to a temp
+    table, so a dry run never writes the database and works read-only.
+    """
+    if write:
+        _refresh_title_keys(conn)
+        return "item_title_key"
+    conn.execute("""CREATE TEMP TABLE IF NOT EXISTS _title_key_new (
+        item_id INTEGER PRIMARY KEY, media_code TEXT NOT NULL, title_key TEXT NOT NULL)""")
+    conn.execute("DELETE FROM temp._title_key_new")
+    if not _refresh_title_keys(conn, into="temp._title_key_new"):
+        return "item_title_key"
+    return """(SELECT item_id, media_code, title_key FROM item_title_key
+               UNION ALL SELECT item_id, media_code, title_key FROM temp._title_key_new)"""
+
+def _exact_key_groups(conn, keys):
+    # covering index (media_code, title_key) -> one sorted pass, no pair comparisons
+    return _id_groups(conn.execute(f"""
+        SELECT media_code, title_key, group_concat(item_id) FROM {keys}
+        GROUP BY media_code, title_key HAVING COUNT(*) > 1"""))
+
+def _external_ref_groups(conn):
+    """Hard matches: shared (source, external_id), shared (source, url), or a URL title naming a ref."""
+    yield from _id_groups(conn.execute("""
+        SELECT source, external_id, group_concat(DISTINCT item_id) FROM external_ref
+        WHERE external_id <> '' GROUP BY source, external_id HAVING COUNT(DISTINCT item_id) > 1"""))
+    yield from _id_groups(conn.execute("""
+        SELECT url, source, group_concat(DISTINCT item_id) FROM external_ref
+        WHERE url <> '' GROUP BY url, source HAVING COUNT(DISTINCT item_id) > 1"""))
+    for a, b in conn.execute("""
+            SELECT i.id, e.item_id FROM item i
+            JOIN external_ref e ON e.url = i.title
+            WHERE i.title LIKE '%://%' AND e.item_id <> i.id"""):
+        yield sorted((a, b))
+
+def _grams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)} or {padded}
+
+def _minhash_pairs(keys, *, threshold):
+    """
+    keys: [(media_code, title_key)]. Returns index pairs whose trigram Jaccard
+    is >= threshold, found through MinHash LSH buckets (never all pairs).
+    """
+    grams = [_grams(k) for _, k in keys]
+    lengths = np.fromiter((len(g) for g in grams), dtype=np.int64, count=len(grams))
+    flat = np.fromiter((zlib.crc32(s.encode()) for g in grams for s in g), dtype=np.uint64,
+                       count=int(lengths.sum()))
+    rng = np.random.default_rng(0x5EED)
+    a = rng.integers(1, _PRIME, size=MINHASH_PERMS, dtype=np.uint64)[:, None]
+    b = rng.integers(0, _PRIME, size=MINHASH_PERMS, dtype=np.uint64)[:, None]
+    sig = np.empty((len(keys), MINHASH_PERMS), dtype=np.uint64)
+    offsets = np.r_[0, np.cumsum(lengths)]
+    step = 4096
+    for start in range(0, len(keys), step):
+        stop = min(start + step, len(keys))
+        seg = flat[offsets[start]:offsets[stop]]
+        hv = (a * seg[None, :] + b) % _PRIME
+        sig[start:stop] = np.minimum.reduceat(hv, offsets[start:stop] - offsets[start], axis=1).T
+
+    media_idx = np.unique([m for m, _ in keys], return_inverse=True)[1].astype(np.uint64)
+    rows = MINHASH_PERMS // MINHASH_BANDS
+    mult = rng.integers(1, 1 << 62, size=rows, dtype=np.uint64)
+    candidates = set()
+    for band in range(MINHASH_BANDS):
+        with np.errstate(over="ignore"):
+            bucket = (sig[:, band * rows:(band + 1) * rows] * mult).sum(axis=1) ^ (media_idx << np.uint64(56))
+        order = np.argsort(bucket, kind="stable")
+        sb = bucket[order]
+        starts = np.flatnonzero(np.r_[True, sb[1:] != sb[:-1]])
+        sizes = np.diff(np.r_[starts, len(sb)])
+        for s, n in zip(starts[(sizes > 1) & (sizes <= MAX_BUCKET)],
+                        sizes[(sizes > 1) & (sizes <= MAX_BUCKET)]):
+            members = order[s:s + n].tolist()
+            for i, x in enumerate(members):
+                for y in members[i + 1:]:
+                    candidates.add((x, y) if x < y else (y, x))
+    # numbers are sequels, volumes and years: "Game 2" is not "Game 3" however
+    # close the strings are, so fuzzy matches must agree on them exactly
+    digits = [_DIGITS.findall(k) for _, k in keys]
+    out = []
+    for x, y in candidates:
+        gx, gy = grams[x], grams[y]
+        if digits[x] == digits[y] and len(gx & gy) >= threshold * len(gx | gy):
+            out.append((x, y))
+    return out
+
+def _fuzzy_groups(conn, keys, *, threshold):
+    reps = conn.execute(f"""
+        SELECT media_code, title_key, MIN(item_id) FROM {keys}
+        GROUP BY media_code, title_key""").fetchall()
+    keys = [(r[0], r[1]) for r in reps]
+    for x, y in _minhash_pairs(keys, threshold=threshold):
+        yield sorted((reps[x][2], reps[y][2]))
+
+# ---------- Clusters ----------
+def find_duplicates(conn, *, fuzzy=False, threshold=0.85, write_keys=False):
+    """
+    Returns [(keep_id, [dup_ids], {reasons})], biggest clusters first.
+    Clusters never span media types; the keeper is the oldest item whose
+    title is not a URL. write_keys stores missing title keys (uncommitted).
+    """
+    keys = _title_keys(conn, write=write_keys)
+    parent, reasons = {}, []
+    blockers = [("title", _exact_key_groups(conn, keys)), ("external_ref", _external_ref_groups(conn))]
+    if fuzzy:
+        blockers.append(("fuzzy", _fuzzy_groups(conn, keys, threshold=threshold)))
+    for reason, groups in blockers:
+        for ids in groups:
+            _union(parent, reasons, ids, reason)
+
+    members = {}
+    for x in list(parent):
+        root = _find(parent, x)
+        members.setdefault(root, {root}).add(x)
+    why = {}
+    for x, reason in reasons:
+        why.setdefault(_find(parent, x), set()).add(reason)
+    meta = {}
+    ids = sorted({i for group in members.values() for i in group})
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        for r in conn.execute(f"SELECT id, media_code, title FROM item WHERE id IN ({marks})", chunk):
+            meta[r["id"]] = (r["media_code"], r["title"])
+
+    clusters = []
+    for root, group in members.items():
+        by_media = {}
+        for i in group:
+            if i in meta:
+                by_media.setdefault(meta[i][0], []).append(i)
+        for same in by_media.values():
+            if len(same) < 2:
+                continue
+            same.sort(key=lambda i: (bool(_URL_TITLE.match(meta[i][1])), i))
+            clusters.append((same[0], same[1:], why.get(root, set())))
+    clusters.sort(key=lambda c: (-len(c[1]), c[0]))
+    return clusters, meta
+
+def merge_clusters(conn, clusters) -> int:
+    """Merges every cluster in one transaction; returns the items removed."""
+    conn.commit()
+    conn.execute("BEGIN")
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp._merge")
+        conn.execute("CREATE TEMP TABLE _merge (dup_id INTEGER PRIMARY KEY, keep_id INTEGER NOT NULL)")
+        conn.executemany("INSERT INTO _merge(dup_id, keep_id) VALUES (?,?)",
+                         [(d, keep) for keep, dups, _ in clusters for d in dups])
+        merged = _merge_items(conn)
+        conn.execute("DROP TABLE temp._merge")
+        _sync_item_fts(conn)            # merged tags and deleted items, in the same transaction
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return merged
+
+def cmd_dedupe(args):
+    if args.fuzzy and np is None:
+        raise SystemExit("numpy not installed. Run:  pip install numpy")
+    conn = connect(args.db, readonly=not args.apply)     # a dry run only reads
+    t0 = time.perf_counter()
+    clusters, meta = find_duplicates(conn, fuzzy=args.fuzzy, threshold=args.threshold, write_keys=args.apply)
+    n_dups = sum(len(d) for _, d, _ in clusters)
+    print(f"{len(clusters)} duplicate cluster(s), {n_dups} item(s) to fold in "
+          f"({time.perf_counter() - t0:.2f}s)")
+    for keep, dups, why in clusters[:args.show]:
+        print(f"  keep {keep} {meta[keep][1]!r} ({meta[keep][0]})  [{', '.join(sorted(why))}]")
+        for d in dups:
+            print(f"      <- {d} {meta[d][1]!r}")
+    if len(clusters) > args.show:
+        print(f"  ... {len(clusters) - args.show} more")
+    if not args.apply:
+        if clusters:
+            print("Dry run; pass --apply to merge.")
+        return
+    t0 = time.perf_counter()
+    merged = merge_clusters(conn, clusters)
+    print(f"Merged {merged} item(s) in {time.perf_counter() - t0:.2f}s")
@@ -1,72 +1,86 @@
-try:
-    from openpyxl import Workbook
-    from openpyxl.utils import get_column_letter
-    from openpyxl.styles import Font
-except ImportError:
-    raise SystemExit("openpyxl not installed. Run:  pip install openpyxl")
+import csv
+import gzip
+import io
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from itertools import chain, islice
+from pathlib import Path
 
-from db import connect, _fetch_items_for_export, _fetch_ratings_ledger
+from db import connect, _fetch_items_for_export, _fetch_ratings_ledger, _fetch_items_page, _fetch_ratings_page
+from tracing import phase, timed
 
-def _bucket_by_media(items, order=None, include_empty=False):
+WIDTH_SAMPLE_ROWS = 500
+PROGRESS_EVERY = 50000
+
+def _parse_sources(text):
+    """--sources value: comma list of rating_source names, 'all', or None for the defaults."""
+    if not text:
+        return None
+    if text.strip().lower() == "all":
+        return "all"
+    return [s.strip() for s in text.split(",") if s.strip()]
+
+# friendly sheet names (<=31 chars for Excel)
+MEDIA_SHEETS = {
+    "game": "Games",
+    "book": "Books",
+    "movie": "Movies",
+    "tv": "TV",
+    "music": "Music",
+}
+
+def _media_sheet_codes(present, order=None):
     """
-    items: list of dict rows from _fetch_items_for_export(...)
+    present: media codes that have items
     order: optional explicit order like ["game","book","movie","tv","music"]
-    include_empty: if True, create empty sheets for media in 'order' even when no rows
-    returns: Ordered dict-like {sheet_title: {"rows": [...]}}
+    returns: media codes in tab order
     """
-    # friendly sheet names (<=31 chars for Excel)
-    DISPLAY = {
-        "game": "Games",
-        "book": "Books",
-        "movie": "Movies",
-        "tv": "TV",
-        "music": "Music",
-    }
-    # group rows
-    grouped = {}
-    for r in items:
-        code = (r.get("media_code") or "").lower()
-        grouped.setdefault(code, []).append(r)
-
-    # determine order
     if order:
-        codes = order
-    else:
-        # keep a natural, friendly default order
-        default = ["game","book","movie","tv","music"]
-        present = [c for c in default if c in grouped]
-        # add any unknown codes at the end
-        others = [c for c in grouped.keys() if c not in present]
-        codes = present + others
+        return order
+    # keep a natural, friendly default order
+    default = ["game","book","movie","tv","music"]
+    codes = [c for c in default if c in present]
+    # add any unknown codes at the end
+    return codes + [c for c in present if c not in codes]
 
-    sheets = {}
-    for code in codes:
-        rows = grouped.get(code, [])
-        if rows or include_empty:
-            title = DISPLAY.get(code, (code or "Other")).strip()[:31]
-            sheets[title] = {"rows": rows}
-    return sheets
+def _peek(rows):
+    """(has_rows, rows) without losing the first row of a generator."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return False, iter(())
+    return True, chain([first], rows)
 
 def cmd_export_xlsx(args):
     conn = connect(args.db)
-
-    # Pull items (optionally filtered by a single media/platform)
-    items = _fetch_items_for_export(
-        conn,
-        media=args.media,              # note: if you set --split-by-media, consider leaving this None
+    fetch = dict(
         platform=args.platform,
         min_itchio=args.min_itchio,
-        limit=args.limit
+        limit=args.limit,
+        sources=_parse_sources(args.sources)
     )
 
+    # Each sheet is fed by its own streaming cursor
     sheets = {}
     if args.split_by_media:
         # Optional explicit order via --tab-order=game,book,...
-        order = [s.strip() for s in (args.tab_order or "").split(",") if s.strip()] or None
-        sheets.update(_bucket_by_media(items, order=order, include_empty=args.include_empty_tabs))
+        order = [s.strip().lower() for s in (args.tab_order or "").split(",") if s.strip()] or None
+        present = [r[0].lower() for r in conn.execute("SELECT DISTINCT media_code FROM item ORDER BY 1")]
+        for code in _media_sheet_codes(present, order):
+            if args.media and code != args.media:
+                continue
+            has_rows, rows = _peek(_fetch_items_for_export(conn, media=code, **fetch)
+                                   if code in present else ())
+            if has_rows or args.include_empty_tabs:
+                title = MEDIA_SHEETS.get(code, (code or "Other")).strip()[:31]
+                sheets[title] = {"rows": rows}
     else:
         # Single 'Items' sheet (current behavior)
-        sheets["Items"] = {"rows": items}
+        sheets["Items"] = {"rows": _fetch_items_for_export(conn, media=args.media, **fetch)}
 
     # Optional Ratings sheet (unchanged behavior)
     if args.include_ratings:
@@ -75,45 +89,300 @@ def cmd_export_xlsx(args):
             media=args.media if not args.split_by_media else None,  # if split, include all ratings
             source=args.source,
             since=args.since,
-            limit=args.limit_ratings
+            limit=args.limit_ratings,
+            latest_only=args.latest_only
         )
         sheets["Ratings"] = {"rows": ratings}
 
     # Write the workbook
-    _write_xlsx(args.out, sheets)
+    for payload in sheets.values():
+        payload["rows"] = timed(payload["rows"], "fetch")
+    with phase("serialize"):
+        counts = _write_xlsx(args.out, sheets, progress=sys.stderr.isatty())
     # Friendly summary
-    tab_counts = ", ".join(f"{name}:{len(payload['rows'])}" for name, payload in sheets.items())
+    tab_counts = ", ".join(f"{name}:{n}" for name, n in counts.items())
     print(f"wrote Excel → {args.out}  ({tab_counts})")
 
-def _write_xlsx(path, sheets_dict):
+def _write_xlsx(path, sheets_dict, progress=False):
     """
     sheets_dict = {
-      "Items": {"rows": [ {col:val,...}, ... ]},
-      "Ratings": {"rows": [...]}
+      "Items": {"rows": iterable of {col:val,...}},
+      "Ratings": {"rows": ...}
     }
+    Streams rows into a write-only workbook, so rows can come straight from a
+    cursor. Column widths are estimated from the first WIDTH_SAMPLE_ROWS rows.
+    Returns {sheet_name: row_count}.
     """
-    
-    wb = Workbook()
-    # Remove default sheet
-    wb.remove(wb.active)
+    # openpyxl is only needed here, so CSV/NDJSON exports work without it
+    try:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.utils import get_column_letter
+        from openpyxl.styles import Font
+    except ImportError:
+        raise SystemExit("openpyxl not installed. Run:  pip install openpyxl")
+
+    wb = Workbook(write_only=True)
+    counts = {}
 
     for sheet_name, payload in sheets_dict.items():
         ws = wb.create_sheet(title=sheet_name[:31])  # Excel sheet name limit
-        rows = payload.get("rows", [])
+        rows = iter(payload.get("rows", []))
+        sample = list(islice(rows, WIDTH_SAMPLE_ROWS))
         # headers
-        if rows:
-            headers = list(rows[0].keys())
+        if sample:
+            headers = list(sample[0].keys())
         else:
             headers = ["(no data)"]
-        ws.append(headers)
-        for cell in ws[1]:
+        # autosize columns (must happen before the first row in write-only mode)
+        for col_idx, header in enumerate(headers, start=1):
+            max_len = max((len(str(header)),) + tuple(len(str(r.get(header))) for r in sample))
+            ws.column_dimensions[get_column_letter(col_idx)].width = min(max_len + 2, 60)
+        header_cells = []
+        for h in headers:
+            cell = WriteOnlyCell(ws, value=h)
             cell.font = Font(bold=True)
+            header_cells.append(cell)
+        ws.append(header_cells)
         # data
-        for r in rows:
+        n = 0
+        for r in chain(sample, rows):
             ws.append([r.get(h) for h in headers])
-        # autosize columns
-        for col_idx, header in enumerate(headers, start=1):
-            max_len = max((len(str(header)),) + tuple(len(str(r.get(header))) for r in rows)) if rows else len(str(header))
-            ws.column_dimensions[get_column_letter(col_idx)].width = min(max_len + 2, 60)
+            n += 1
+            if progress and n % PROGRESS_EVERY == 0:
+                print(f"\r  {sheet_name}: {n:,} rows", end="", file=sys.stderr, flush=True)
+        if progress and n >= PROGRESS_EVERY:
+            print(f"\r  {sheet_name}: {n:,} rows", file=sys.stderr)
+        counts[sheet_name] = n
 
     wb.save(path)
+    return counts
+
+# ---------- CSV / NDJSON (streamed, constant memory) ----------
+def _open_text_out(path, use_gzip=False):
+    """Text stream for path ('-' or None = stdout); gzip if asked or path ends in .gz."""
+    use_gzip = use_gzip or bool(path and path.endswith(".gz"))
+    if not path or path == "-":
+        raw = sys.stdout.buffer
+        if use_gzip:
+            raw = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+        return io.TextIOWrapper(raw, encoding="utf-8", newline="", write_through=False)
+    if use_gzip:
+        return gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6)
+    return open(path, "w", encoding="utf-8", newline="", buffering=1 << 20)
+
+def _export_rows(conn, args):
+    if args.what == "ratings":
+        return _fetch_ratings_ledger(
+            conn,
+            media=args.media,
+            source=args.source,
+            since=args.since,
+            limit=args.limit,
+            latest_only=args.latest_only
+        )
+    return _fetch_items_for_export(
+        conn,
+        media=args.media,
+        platform=args.platform,
+        min_itchio=args.min_itchio,
+        limit=args.limit,
+        sources=_parse_sources(args.sources)
+    )
+
+def _export_page(conn, args):
+    """--page-size: one keyset page and the --after token for the next (None on the last)."""
+    try:
+        if args.what == "ratings":
+            return _fetch_ratings_page(conn, page_size=args.page_size, after=args.after, media=args.media,
+                                       source=args.source, since=args.since, latest_only=args.latest_only)
+        return _fetch_items_page(conn, page_size=args.page_size, after=args.after, media=args.media,
+                                 platform=args.platform, min_itchio=args.min_itchio,
+                                 sources=_parse_sources(args.sources))
+    except ValueError as e:
+        raise SystemExit(f"--after: {e}" if args.after else str(e))
+
+def write_csv(out, rows):
+    """Writes dict rows as CSV (header from the first row); returns the row count."""
+    has_rows, rows = _peek(rows)
+    if not has_rows:
+        return 0
+    w = csv.writer(out)
+    n = 0
+    for r in rows:
+        if n == 0:
+            w.writerow(r.keys())
+        w.writerow(r.values())
+        n += 1
+    return n
+
+def write_ndjson(out, rows):
+    """Writes one compact JSON object per line; returns the row count."""
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    n = 0
+    for r in rows:
+        out.write(dumps(r))
+        out.write("\n")
+        n += 1
+    return n
+
+def _cmd_export_stream(args, writer, label):
+    conn = connect(args.db)
+    token = None
+    if args.page_size:
+        with phase("fetch"):
+            rows, token = _export_page(conn, args)
+    elif args.after:
+        raise SystemExit("--after needs --page-size")
+    else:
+        rows = timed(_export_rows(conn, args), "fetch")
+    out = _open_text_out(args.out, args.gzip)
+    try:
+        with phase("serialize"):
+            n = writer(out, rows)
+    finally:
+        if out.buffer is sys.stdout.buffer:
+            out.flush()
+            out.detach()
+        else:
+            out.close()
+    print(f"wrote {label} → {args.out or 'stdout'}  ({args.what}:{n})", file=sys.stderr)
+    if args.page_size:
+        print(f"next page: --after {token}" if token else "last page", file=sys.stderr)
+
+def cmd_export_csv(args):
+    _cmd_export_stream(args, write_csv, "CSV")
+
+def cmd_export_ndjson(args):
+    _cmd_export_stream(args, write_ndjson, "NDJSON")
+
+# ---------- Delta exports (per-target watermark) ----------
+MANIFEST = "manifest.json"
+REASSEMBLE = ("items: start from the last 'full' entry and apply every later entry in seq order, "
+              "replacing rows by id and dropping deleted_item_ids. ratings: concatenate the ratings "
+              "files of the same entries in seq order. Every rating inserted after the full snapshot "
+              "is in exactly one later file, unless it was deleted before the run that would have "
+              "written it. The ledger is append-only: later edits to a rating and rows removed by "
+              "compact-history or item deletes are not retracted (the items files carry current values).")
+
+def _write_delta_file(path, rows, fmt, use_gzip):
+    out = _open_text_out(str(path), use_gzip)
+    try:
+        return (write_csv if fmt == "csv" else write_ndjson)(out, rows)
+    finally:
+        out.close()
+
+def _save_manifest(out_dir, manifest):
+    tmp = out_dir / (MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1))
+    os.replace(tmp, out_dir / MANIFEST)
+
+def export_delta(conn, *, target, out_dir, fmt="csv", sources=None, use_gzip=False, full=False):
+    """
+    Writes the items (export-csv shape) and ledger ratings that changed since
+    target's watermark into out_dir, appends an entry to out_dir/manifest.json
+    and advances the watermark. The first run, or full=True, writes a full
+    snapshot and starts a new chain. Returns the manifest entry.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / MANIFEST
+    manifest = json.loads(path.read_text()) if path.exists() else None
+    settings = {"target": target, "format": fmt, "gzip": use_gzip,
+                "sources": sources if sources in (None, "all") else ",".join(sources)}
+    if manifest and manifest["target"] != target:
+        raise ValueError(f"{out_dir} holds deltas for target {manifest['target']!r}")
+    if manifest and not full and any(manifest.get(k) != v for k, v in settings.items()):
+        raise ValueError(f"{out_dir} was written with other settings "
+                         f"({', '.join(f'{k}={manifest.get(k)}' for k in settings)}); pass --full to restart")
+
+    # registering the target first turns on change logging before the snapshot is read
+    conn.execute("""
+        INSERT OR IGNORE INTO export_watermark(target, change_seq, rating_id, delta_seq)
+        VALUES (?, COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'item_change'), 0), 0, 0)""", (target,))
+    conn.commit()
+    wm = conn.execute("SELECT change_seq, delta_seq FROM export_watermark WHERE target = ?",
+                      (target,)).fetchone()
+    full = full or manifest is None or wm["delta_seq"] == 0
+    n = wm["delta_seq"] + 1
+    suffix = fmt + (".gz" if use_gzip and fmt != "xlsx" else "")
+
+    conn.execute("BEGIN")            # one read snapshot for the bounds and the rows
+    try:
+        hi_seq = conn.execute("SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'item_change'), 0)"
+                              ).fetchone()[0]
+        lo_seq = 0 if full else wm["change_seq"]
+        # limit=None: no LIMIT at all; the watermark moves to hi_seq, so a cap would lose rows.
+        # The delta ledger follows the change log too: item_rating ids are rowids and get reused.
+        items = _fetch_items_for_export(conn, sources=sources, limit=None,
+                                        changed=None if full else (lo_seq, hi_seq))
+        if full:
+            hi_rating = conn.execute("SELECT COALESCE(MAX(id), 0) FROM item_rating").fetchone()[0]
+            ratings = _fetch_ratings_ledger(conn, ids=(0, hi_rating), limit=None)
+        else:
+            ratings = _fetch_ratings_ledger(conn, changed=(lo_seq, hi_seq), limit=None)
+        deleted = [] if full else [r[0] for r in conn.execute("""
+            SELECT DISTINCT c.item_id FROM item_change c
+            WHERE c.seq > ? AND c.seq <= ? AND NOT EXISTS (SELECT 1 FROM item i WHERE i.id = c.item_id)
+            ORDER BY 1""", (lo_seq, hi_seq))]
+        kind = "full" if full else "delta"
+        files = {}
+        with phase("serialize"):
+            if fmt == "xlsx":
+                sheets = {"Items": {"rows": timed(items, "fetch")}, "Ratings": {"rows": timed(ratings, "fetch")}}
+                if deleted:
+                    sheets["Deleted"] = {"rows": ({"item_id": i} for i in deleted)}
+                name = f"{n:06d}-{kind}.xlsx"
+                counts = _write_xlsx(out_dir / name, sheets)
+                files = {"workbook": {"path": name, "rows": {k.lower(): v for k, v in counts.items()}}}
+            else:
+                for what, rows in (("items", items), ("ratings", ratings)):
+                    name = f"{n:06d}-{kind}-{what}.{suffix}"
+                    rows_written = _write_delta_file(out_dir / name, timed(rows, "fetch"), fmt, use_gzip)
+                    if rows_written:
+                        files[what] = {"path": name, "rows": rows_written}
+                    else:
+                        (out_dir / name).unlink(missing_ok=True)
+    finally:
+        conn.commit()                # ends the read transaction
+
+    entry = {"seq": n, "kind": kind, "created_at": datetime.now().isoformat(timespec="seconds"),
+             "change_seq": [lo_seq, hi_seq],
+             "files": files, "deleted_item_ids": deleted}
+    deltas = [] if full or manifest is None else [d for d in manifest["deltas"] if d["seq"] < n]
+    _save_manifest(out_dir, {**settings, "reassemble": REASSEMBLE, "deltas": deltas + [entry]})
+    # the watermark moves only once the files and manifest are on disk; a
+    # crash before this point just redoes the same window next time
+    conn.execute("""
+        UPDATE export_watermark SET change_seq = ?, delta_seq = ?, exported_at = datetime('now')
+        WHERE target = ?""", (hi_seq, n, target))
+    conn.execute("DELETE FROM item_change WHERE seq <= (SELECT MIN(change_seq) FROM export_watermark)")
+    conn.commit()
+    return entry
+
+def drop_export_target(conn, target) -> bool:
+    gone = conn.execute("DELETE FROM export_watermark WHERE target = ?", (target,)).rowcount > 0
+    # with no targets left the whole log goes (MIN() is NULL -> IFNULL keeps every seq)
+    conn.execute("DELETE FROM item_change WHERE seq <= IFNULL((SELECT MIN(change_seq) FROM export_watermark), seq)")
+    conn.commit()
+    return gone
+
+def cmd_export_delta(args):
+    conn = connect(args.db)
+    try:
+        if args.drop:
+            print(f"dropped target {args.target}" if drop_export_target(conn, args.target)
+                  else f"no target {args.target}")
+            return
+        t0 = time.perf_counter()
+        entry = export_delta(conn, target=args.target, out_dir=args.out_dir, fmt=args.format,
+                             sources=_parse_sources(args.sources), use_gzip=args.gzip, full=args.full)
+    except sqlite3.OperationalError as e:
+        if "export_watermark" in str(e) or "item_change" in str(e):  # pre-migration database
+            raise SystemExit("No export_watermark table. Run:  python src/recommend-it.py migrate <db>")
+        raise
+    except ValueError as e:
+        raise SystemExit(str(e))
+    rows = {k: v["rows"] for k, v in entry["files"].items()}
+    print(f"{entry['kind']} #{entry['seq']} → {args.out_dir}  ({rows or 'no changes'}, "
+          f"deleted:{len(entry['deleted_item_ids'])}) in {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,259 @@
+import gzip
+import http.client
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit, urljoin
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+
+class Response:
+    def __init__(self, url, status, headers, body, not_modified=False):
+        self.url = url
+        self.status = status
+        self.headers = headers   # lower-cased names
+        self.body = body         # bytes, already gunzipped
+        # True when the body was served from the cache (fresh hit or 304).
+        # The cache is shared by every database, so this says nothing about
+        # what a particular database already stores.
+        self.not_modified = not_modified
+
+    def text(self):
+        return self.body.decode("utf-8", errors="ignore")
+
+def _host_key(netloc):
+    # Throttle per site, not per subdomain: every itch.io creator page lives
+    # on <creator>.itch.io but is served by the same hosts.
+    host = netloc.rsplit("@", 1)[-1].split(":", 1)[0].lower()
+    if host.replace(".", "").isdigit():
+        return host
+    return ".".join(host.split(".")[-2:])
+
+class HttpCache:
+    """
+    Persistent response cache keyed by URL, kept in its own SQLite file.
+    Bodies are zlib-compressed; ETag/Last-Modified are kept for revalidation.
+    Entries younger than ttl seconds are served without a request; the
+    least recently used entries are evicted once bodies exceed max_bytes.
+    """
+    def __init__(self, path, *, ttl=86400, max_bytes=256 << 20):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = self.revalidated = self.misses = self.evictions = 0
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode = WAL;")
+        self._db.execute("PRAGMA synchronous = NORMAL;")
+        self._db.execute("""
+          CREATE TABLE IF NOT EXISTS http_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            used_at REAL NOT NULL
+          )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_http_cache_used ON http_cache(used_at)")
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM http_cache").fetchone()[0]
+
+    def lookup(self, url):
+        """Returns (etag, last_modified, body, fresh) or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, body, fetched_at FROM http_cache WHERE url=?", (url,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self._db.execute("UPDATE http_cache SET used_at=? WHERE url=?", (now, url))
+        etag, last_modified, body, fetched_at = row
+        return etag, last_modified, zlib.decompress(body), (now - fetched_at) < self.ttl
+
+    def store(self, url, headers, body):
+        blob = zlib.compress(body, 6)
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM http_cache WHERE url=?", (url,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO http_cache(url,etag,last_modified,body,size,fetched_at,used_at) "
+                "VALUES (?,?,?,?,?,?,?)",
+                (url, headers.get("etag"), headers.get("last-modified"), blob, len(blob), now, now))
+            self._total += len(blob) - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def touch(self, url):
+        # a 304 re-validates the entry: restart its TTL
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE http_cache SET fetched_at=?, used_at=? WHERE url=?", (now, now, url))
+
+    def _evict(self):
+        # drop LRU entries until we are back under 90% of the budget
+        target = int(self.max_bytes * 0.9)
+        doomed = []
+        for url, size in self._db.execute("SELECT url, size FROM http_cache ORDER BY used_at"):
+            if self._total <= target:
+                break
+            doomed.append((url,))
+            self._total -= size
+        self._db.executemany("DELETE FROM http_cache WHERE url=?", doomed)
+        self.evictions += len(doomed)
+
+    def record(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self):
+        lookups = self.hits + self.revalidated + self.misses
+        rate = (self.hits + self.revalidated) / lookups if lookups else 0.0
+        return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": round(rate, 4), "bytes": self._total}
+
+    def close(self):
+        self._db.close()
+
+class HttpClient:
+    """
+    Thread-safe GET client for scraping:
+      - one keep-alive connection per (thread, scheme, netloc)
+      - at most per_host requests in flight per site, spaced min_interval apart
+      - retries on connection errors and 429/5xx with exponential backoff
+      - optional HttpCache: fresh entries skip the network, stale ones are
+        revalidated with If-None-Match / If-Modified-Since
+    """
+    def __init__(self, *, timeout=20, per_host=4, min_interval=0.0, retries=3, backoff=0.5,
+                 user_agent="Recommend-It/1.0", cache: HttpCache=None):
+        self.cache = cache
+        self.timeout = timeout
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.user_agent = user_agent
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sems = {}
+        self._next_slot = {}
+        self._all_conns = []
+
+    # ---- connections ----
+    def _conn(self, scheme, netloc):
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = conns[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+            with self._lock:
+                self._all_conns.append(conn)
+        return conn
+
+    def _drop(self, scheme, netloc):
+        conn = self._local.conns.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            conns, self._all_conns = self._all_conns, []
+        for conn in conns:
+            conn.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    # ---- throttling ----
+    @contextmanager
+    def _slot(self, netloc):
+        key = _host_key(netloc)
+        with self._lock:
+            sem = self._sems.get(key)
+            if sem is None:
+                sem = self._sems[key] = threading.BoundedSemaphore(self.per_host)
+        with sem:
+            if self.min_interval:
+                with self._lock:
+                    now = time.monotonic()
+                    at = max(now, self._next_slot.get(key, now))
+                    self._next_slot[key] = at + self.min_interval
+                if at > now:
+                    time.sleep(at - now)
+            yield
+
+    def _sleep_backoff(self, attempt, retry_after=None):
+        if retry_after is not None and retry_after.strip().isdigit():
+            delay = float(retry_after)
+        else:
+            delay = self.backoff * (2 ** attempt)
+        time.sleep(delay * (1 + random.random() * 0.25))
+
+    # ---- requests ----
+    def get(self, url, headers=None, max_redirects=5) -> Response:
+        if self.cache is None:
+            return self._get_following(url, headers, max_redirects)
+        entry = self.cache.lookup(url)
+        if entry is not None:
+            etag, last_modified, body, fresh = entry
+            if fresh:
+                self.cache.record("hits")
+                return Response(url, 200, {}, body, not_modified=True)
+            headers = dict(headers or {})
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        resp = self._get_following(url, headers, max_redirects)
+        if resp.status == 304 and entry is not None:
+            self.cache.record("revalidated")
+            self.cache.touch(url)
+            return Response(url, 200, resp.headers, entry[2], not_modified=True)
+        self.cache.record("misses")
+        if resp.status == 200:
+            self.cache.store(url, resp.headers, resp.body)
+        return resp
+
+    def _get_following(self, url, headers, max_redirects):
+        for _ in range(max_redirects + 1):
+            resp = self._get_once(url, headers)
+            if resp.status in REDIRECT_STATUS and "location" in resp.headers:
+                url = urljoin(url, resp.headers["location"])
+                continue
+            return resp
+        raise http.client.HTTPException(f"too many redirects: {url}")
+
+    def _get_once(self, url, headers):
+        parts = urlsplit(url)
+        scheme, netloc = parts.scheme or "http", parts.netloc
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        hdrs = {"User-Agent": self.user_agent, "Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        hdrs.update(headers or {})
+
+        for attempt in range(self.retries + 1):
+            try:
+                with self._slot(netloc):
+                    conn = self._conn(scheme, netloc)
+                    conn.request("GET", path, headers=hdrs)
+                    r = conn.getresponse()
+                    body = r.read()
+                    rhdrs = {k.lower(): v for k, v in r.getheaders()}
+                    if r.will_close:
+                        self._drop(scheme, netloc)
+            except (http.client.HTTPException, OSError):
+                self._drop(scheme, netloc)
+                if attempt == self.retries:
+                    raise
+                self._sleep_backoff(attempt)
+                continue
+            if r.status in RETRY_STATUS and attempt < self.retries:
+                self._sleep_backoff(attempt, rhdrs.get("retry-after"))
+                continue
+            if rhdrs.get("content-encoding") == "gzip":
+                body = gzip.decompress(body)
+            return Response(url, r.status, rhdrs, body)
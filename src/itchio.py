@@ -1,13 +1,21 @@
 import json
 import xml.etree.ElementTree as ET
-import json, re
+import json, re, time
+import glob
+import multiprocessing
+import os
+import queue
 
-from pathlib import Path
-from urllib.request import urlopen, Request
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from db import set_platforms, attach_tags, add_external_ref, connect
-from ratings import add_scale_defaults, add_source
-from ratings import ensure_item 
+from db import set_platforms, attach_tags, add_external_ref, connect, ensure_item, sync_item_fts, STORAGE_DIR
+from db import platform_codes, load_item_ids, load_tag_ids, bulk_ensure_items, bulk_ensure_tags
+from ratings import add_scale_defaults, add_source, add_ratings_stars5_bulk
+from httpclient import HttpClient, HttpCache
+from tracing import phase, timed
+
+HTTP_CACHE_PATH = STORAGE_DIR / "http-cache.db"
 
 # ---------- Itch.io import ----------
 def _norm_list(x):
@@ -15,14 +23,30 @@ def _norm_list(x):
     if isinstance(x, (list, tuple)): return list(x)
     return [x]
 
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
 def cmd_fetch_itchio_rating(args):
     conn = connect(args.db)
     # Ensure scales and the 'itchio' source exist
     add_scale_defaults(conn)
     add_source(conn, "itchio", "external")
 
-    html = fetch_html(args.url)
-    avg, count = extract_rating_from_html(html)
+    client = _cli_client(args)
+    try:
+        resp = client.get(args.url)
+    finally:
+        client.close()
+    if resp.status >= 400:
+        raise SystemExit(f"HTTP {resp.status} for {args.url}")
+    # a cached page is still saved: the cache is shared by every database and
+    # does not know what this one holds (an unchanged rating only extends the row)
+    avg, count = extract_rating_from_html(resp.body)
     if avg is None:
         print("No rating found on page (or game has no public ratings yet).")
         return
@@ -39,58 +63,198 @@ def cmd_fetch_itchio_rating(args):
         votes=count,
         notes=f"Scraped from {args.url}"
     )
+    add_external_ref(conn, item_id, source="itchio", url=args.url)
+    sync_item_fts(conn)
     print(f"Saved: item_id={item_id}, avg={avg}, votes={count}, percent={percent}, conf={conf:.2f}")
 
-def fetch_html(url: str) -> str:
-    req = Request(url, headers={"User-Agent": "Recommend-It/1.0"})
-    with urlopen(req, timeout=20) as r:
-        return r.read().decode("utf-8", errors="ignore")
+_client = None
+
+def _default_client():
+    global _client
+    if _client is None:
+        _client = HttpClient()
+    return _client
+
+def _cli_client(args, **kw):
+    cache = None
+    if not getattr(args, "no_cache", False):
+        cache = HttpCache(HTTP_CACHE_PATH, ttl=args.cache_ttl * 3600,
+                          max_bytes=args.cache_max_mb << 20)
+    return HttpClient(cache=cache, **kw)
+
+def fetch_html(url: str, client: HttpClient=None) -> str:
+    resp = (client or _default_client()).get(url)
+    if resp.status >= 400:
+        raise OSError(f"HTTP {resp.status} for {url}")
+    return resp.text()
 
-def extract_rating_from_html(html: str):
+# ---------- Batch refresh of stored itch.io refs ----------
+def _scrape_rating(client, url):
+    """(avg, count, served from cache)."""
+    resp = client.get(url)
+    if resp.status >= 400:
+        raise OSError(f"HTTP {resp.status} for {url}")
+    avg, count = extract_rating_from_html(resp.body)
+    return avg, count, resp.not_modified
+
+def refresh_itchio_ratings(conn, refs, client: HttpClient, *, workers=16):
     """
-    Returns (avg_stars: float|None, rating_count: int|None)
-    Tries JSON-LD first, then falls back to simple heuristics.
+    refs: iterable of (item_id, url). Fetches pages concurrently and stores every
+    rating found in one transaction. Pages served from the HTTP cache (fresh or
+    304) skip the network but are still parsed and saved, since the cache is
+    not tied to this database; a rating equal to the stored latest one only
+    extends it. Returns (saved, same, cached, no_rating, failed).
     """
-    # 1) JSON-LD blocks
-    for m in re.finditer(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
-                         html, flags=re.S|re.I):
+    found, cached, no_rating, failed = [], 0, 0, []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futs = {pool.submit(_scrape_rating, client, url): (item_id, url) for item_id, url in refs}
+        for fut in as_completed(futs):
+            item_id, url = futs[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                failed.append((url, e))
+                continue
+            avg, count, from_cache = result
+            cached += from_cache
+            if avg is None:
+                no_rating += 1
+            else:
+                found.append((item_id, avg, count, f"Scraped from {url}"))
+    saved, same = add_ratings_stars5_bulk(conn, source_name="itchio", rows=found) if found else (0, 0)
+    return saved, same, cached, no_rating, failed
+
+def cmd_refresh_itchio_ratings(args):
+    conn = connect(args.db)
+    add_scale_defaults(conn)
+    add_source(conn, "itchio", "external")
+
+    refs = [(r["item_id"], r["url"]) for r in conn.execute(
+        "SELECT item_id, MIN(url) AS url FROM external_ref "
+        "WHERE source='itchio' AND url <> '' GROUP BY item_id ORDER BY item_id")]
+    if args.limit:
+        refs = refs[:args.limit]
+    client = _cli_client(args, per_host=args.per_host, retries=args.retries,
+                         min_interval=(1.0 / args.rate) if args.rate else 0.0)
+    t0 = time.perf_counter()
+    try:
+        saved, same, cached, no_rating, failed = refresh_itchio_ratings(conn, refs, client, workers=args.workers)
+        cache_stats = client.cache.stats() if client.cache else None
+    finally:
+        client.close()
+    secs = time.perf_counter() - t0
+    rate = len(refs) / secs if secs > 0 else 0.0
+    for url, err in failed[:10]:
+        print(f"  failed: {url} ({err})")
+    print(f"Refreshed {len(refs)} pages in {secs:.2f}s ({rate:,.1f} pages/s): "
+          f"saved={saved}, same={same}, cached={cached}, no_rating={no_rating}, failed={len(failed)}")
+    if cache_stats:
+        print("cache: " + ", ".join(f"{k}={v}" for k, v in cache_stats.items()))
+
+_LD_MARK = b"application/ld+json"
+_LD_OPEN = re.compile(rb'<script[^>]+type=["\']application/ld\+json["\'][^>]*>', re.I)
+_SCRIPT_CLOSE = re.compile(rb'</script\s*>', re.I)
+_RATING_TEXT = re.compile(rb'([0-5](?:\.\d)?)\s*(?:average|stars)[^0-9]{0,20}\(?([\d,]+)\s*ratings?\)?', re.I)
+
+def _rating_from_jsonld(block: bytes):
+    try:
+        data = json.loads(block)
+    except Exception:
+        return None
+
+    # Some pages provide a single object, others a list
+    candidates = data if isinstance(data, list) else [data]
+    for obj in candidates:
+        agg = obj.get("aggregateRating") if isinstance(obj, dict) else None
+        if not isinstance(agg, dict):
+            continue
+        val = agg.get("ratingValue")
+        cnt = agg.get("ratingCount") or agg.get("reviewCount")
         try:
-            data = json.loads(m.group(1).strip())
+            avg = float(val) if val is not None else None
+            count = int(cnt) if cnt is not None else None
+            if avg is not None:
+                return avg, count
         except Exception:
+            pass
+    return None
+
+def _search_rating_text(data: bytes):
+    # The heuristic always ends in "rating(s)", so only run the regex in a
+    # short window before each literal occurrence instead of over the page.
+    hits = []
+    for marker in (b"ating", b"ATING"):
+        k = data.find(marker)
+        while k >= 0:
+            hits.append(k)
+            k = data.find(marker, k + len(marker))
+    for k in sorted(hits):
+        m = _RATING_TEXT.search(data, max(0, k - 200), k + 7)
+        if m:
+            return m
+    return None
+
+def _jsonld_rating(data, hay):
+    """
+    Jumps between literal markers in hay (data, or data lower-cased: same
+    offsets) instead of regex-scanning the page, and only json-parses blocks
+    of data that mention aggregateRating.
+    """
+    pos = 0
+    while True:
+        mark = hay.find(_LD_MARK, pos)
+        if mark < 0:
+            return None
+        start = hay.rfind(b"<script", 0, mark)
+        m = _LD_OPEN.match(data, start) if start >= 0 else None
+        pos = mark + len(_LD_MARK)
+        if m is None or m.end() <= mark:
             continue
+        close = _SCRIPT_CLOSE.search(data, m.end())
+        if close is None:
+            return None
+        pos = close.end()
+        block = data[m.end():close.start()]
+        if b"aggregateRating" not in block:
+            continue
+        found = _rating_from_jsonld(block)
+        if found:
+            return found
 
-        # Some pages provide a single object, others a list
-        candidates = data if isinstance(data, list) else [data]
-        for obj in candidates:
-            agg = obj.get("aggregateRating") if isinstance(obj, dict) else None
-            if not isinstance(agg, dict):
-                continue
-            val = agg.get("ratingValue")
-            cnt = agg.get("ratingCount") or agg.get("reviewCount")
-            try:
-                avg = float(val) if val is not None else None
-                count = int(cnt) if cnt is not None else None
-                if avg is not None:
-                    return avg, count
-            except Exception:
-                pass
+def extract_rating_from_html(html):
+    """
+    Returns (avg_stars: float|None, rating_count: int|None)
+    Tries JSON-LD first, then falls back to simple heuristics.
+    Accepts str or raw bytes; bytes are scanned without decoding the page.
+    """
+    data = html if isinstance(html, (bytes, bytearray)) else html.encode("utf-8", "ignore")
+
+    # 1) JSON-LD blocks. Tag and type names are case-insensitive: the
+    # exact-case scan covers almost every page, and only pages where it finds
+    # nothing are scanned again through a lower-cased copy.
+    found = _jsonld_rating(data, data) or _jsonld_rating(data, data.lower())
+    if found:
+        return found
 
     # 2) Fallback: look for common rating text like “4.2 average (1,234 ratings)”
     # (Heuristic — safe to keep as a last resort)
-    m = re.search(r'([0-5](?:\.\d)?)\s*(?:average|stars)[^0-9]{0,20}\(?([\d,]+)\s*ratings?\)?',
-                  html, flags=re.I)
+    m = _search_rating_text(data)
     if m:
         avg = float(m.group(1))
-        count = int(m.group(2).replace(",", ""))
+        count = int(m.group(2).replace(b",", b""))
         return avg, count
 
     return None, None
 
-def import_itchio_json_record(conn, rec: dict, *, web_only=False, free_only=False):
+def _normalize_itchio_record(rec: dict, *, web_only=False, free_only=False):
+    """
+    Returns (title, description, platforms, tags, game_id, url), or None when
+    the record is filtered out. Pure function: no DB access.
+    """
     # Try to read common fields present in API or exported JSON
     title = rec.get("title") or rec.get("name") or rec.get("game_title") or "(untitled)"
     desc = rec.get("short_text") or rec.get("description") or None
-    url  = rec.get("url") or rec.get("game_url") or rec.get("cover_url") or None
+    url  = rec.get("url") or rec.get("game_url") or rec.get("cover_url") or ""
     game_id = str(rec.get("id") or rec.get("game_id") or "")
 
     # platforms: Itch often lists like {"windows":true,"linux":false,"html5":true}
@@ -107,6 +271,7 @@ def import_itchio_json_record(conn, rec: dict, *, web_only=False, free_only=Fals
     tags = rec.get("tags") or rec.get("tag_names")
     if isinstance(tags, str):
         tags = [t.strip() for t in tags.replace("|", ",").split(",") if t.strip()]
+    tags = [n for n in (str(t).strip().lower() for t in _norm_list(tags)) if n]
 
     # price / free
     price = rec.get("price")  # could be 0, or string like "0", or cents in some dumps
@@ -123,50 +288,379 @@ def import_itchio_json_record(conn, rec: dict, *, web_only=False, free_only=Fals
     if web_only:
         platform_flags = set([s.lower() for s in plats])
         if "html5" not in platform_flags and "web" not in platform_flags and "browser" not in platform_flags:
-            return 0
+            return None
     if free_only and is_free is not None and is_free is False:
-        return 0
+        return None
+
+    return title, desc, plats, tags, game_id, url
 
+def import_itchio_json_record(conn, rec: dict, *, web_only=False, free_only=False):
+    norm = _normalize_itchio_record(rec, web_only=web_only, free_only=free_only)
+    if norm is None:
+        return 0
+    title, desc, plats, tags, game_id, url = norm
     item_id = ensure_item(conn, title, "game", desc)
     set_platforms(conn, item_id, plats)
-    attach_tags(conn, item_id, tags or [])
+    attach_tags(conn, item_id, tags)
     add_external_ref(conn, item_id, source="itchio", external_id=game_id, url=url)
     return 1
 
-def import_itchio_file(conn, path: str, *, web_only=False, free_only=False):
-    text = Path(path).read_text(encoding="utf-8", errors="ignore")
-    imported = 0
+# ---------- Bulk import (one transaction, executemany, in-memory id maps) ----------
+def _write_itchio_chunk(conn, norm, item_ids, tag_ids):
+    with phase("resolve"):
+        bulk_ensure_items(conn, item_ids, ((n[0], "game", n[1]) for n in norm))
+        bulk_ensure_tags(conn, tag_ids, {t for n in norm for t in n[3]})
+        plat_rows, tag_rows, ref_rows = [], [], []
+        for title, _desc, plats, tags, game_id, url in norm:
+            iid = item_ids[(title, "game")]
+            plat_rows.extend((iid, code) for code in platform_codes(plats))
+            tag_rows.extend((iid, tag_ids[t]) for t in tags)
+            ref_rows.append((iid, "itchio", game_id, url))
+    with phase("write"):
+        conn.executemany("INSERT OR IGNORE INTO item_platform(item_id,platform_code) VALUES (?,?)", plat_rows)
+        conn.executemany("INSERT OR IGNORE INTO item_tag(item_id,tag_id) VALUES (?,?)", tag_rows)
+        conn.executemany("INSERT OR IGNORE INTO external_ref(item_id,source,external_id,url) VALUES (?,?,?,?)", ref_rows)
 
-    # Try JSON first
+def bulk_import_itchio_records(conn, records, *, web_only=False, free_only=False,
+                               batch_size=None, chunk_size=2000):
+    """
+    Imports an iterable of raw itch.io dicts. Everything goes into a single
+    transaction unless batch_size is set, in which case we commit every
+    batch_size imported rows. Returns (imported, seconds).
+    """
+    t0 = time.perf_counter()
+    with phase("resolve"):
+        item_ids = load_item_ids(conn, "game")
+        tag_ids = load_tag_ids(conn)
+    imported = pending = 0
     try:
-        data = json.loads(text)
-        if isinstance(data, dict):
-            imported += import_itchio_json_record(conn, data, web_only=web_only, free_only=free_only)
-        elif isinstance(data, list):
-            for rec in data:
-                if isinstance(rec, dict):
-                    imported += import_itchio_json_record(conn, rec, web_only=web_only, free_only=free_only)
-        print(f"Imported {imported} from JSON")
-        return
-    except Exception:
-        pass
+        for raw in _chunks(timed(records, "parse"), chunk_size):
+            with phase("parse"):
+                norm = [n for n in (_normalize_itchio_record(r, web_only=web_only, free_only=free_only)
+                                    for r in raw if isinstance(r, dict)) if n]
+            if norm:
+                _write_itchio_chunk(conn, norm, item_ids, tag_ids)
+            imported += len(norm)
+            pending += len(norm)
+            if batch_size and pending >= batch_size:
+                with phase("commit"):
+                    conn.commit()
+                pending = 0
+        with phase("commit"):
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return imported, time.perf_counter() - t0
+
+def _import_summary(imported, secs, fmt):
+    rate = imported / secs if secs > 0 else 0.0
+    return f"Imported {imported} from {fmt} in {secs:.2f}s ({rate:,.0f} rows/s)"
+
+# ---------- Streaming readers (bounded memory) ----------
+_READ_CHUNK = 1 << 16
+
+def _sniff_format(path):
+    """Detects 'json' (array or single object), 'ndjson' or 'rss' from the first bytes."""
+    with open(path, "rb") as f:
+        head = f.read(_READ_CHUNK)
+    head = head.lstrip(b"\xef\xbb\xbf").lstrip()
+    if head.startswith(b"<"):
+        return "rss"
+    if head.startswith(b"["):
+        return "json"
+    if head.startswith(b"{"):
+        # one complete object on the first line -> NDJSON (also covers a one-line object)
+        with open(path, "r", encoding="utf-8-sig", errors="ignore") as f:
+            first = f.readline()
+        try:
+            json.loads(first)
+            return "ndjson"
+        except ValueError:
+            return "json"
+    return None
+
+def _iter_json(path):
+    """Yields records from a JSON array without loading the whole document."""
+    dec = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8-sig", errors="ignore") as f:
+        buf, pos, eof = "", 0, False
+        base, lines, col = 0, 0, 0          # chars, newlines and last line's chars before buf[0]
+
+        def fill():
+            nonlocal buf, pos, eof, base, lines, col
+            more = f.read(_READ_CHUNK)
+            eof = not more
+            gone = buf[:pos]
+            nl = gone.count("\n")
+            base, lines = base + pos, lines + nl
+            col = len(gone) - gone.rfind("\n") - 1 if nl else col + len(gone)
+            buf, pos = buf[pos:] + more, 0
+
+        def in_file(e):
+            # raw_decode's offsets are inside the trimmed buffer; report them for the file
+            lineno = e.lineno + lines
+            colno = e.colno + col if e.lineno == 1 else e.colno
+            err = json.JSONDecodeError(e.msg, e.doc, e.pos)
+            err.pos, err.lineno, err.colno = base + e.pos, lineno, colno
+            err.args = (f"{e.msg}: line {lineno} column {colno} (char {err.pos})",)
+            return err
+
+        def skip(chars):
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        skip(" \t\r\n")
+        if buf[pos:pos + 1] == "{":
+            # a single (pretty-printed) object is one record
+            yield json.loads(buf[pos:] + f.read())
+            return
+        if buf[pos:pos + 1] != "[":
+            raise ValueError("expected a JSON array")
+        pos += 1
+        while True:
+            skip(" \t\r\n,")
+            if pos >= len(buf):
+                raise ValueError("unterminated JSON array")
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = dec.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise in_file(e) from None
+                fill()
+                continue
+            if end == len(buf) and not eof:
+                # a scalar may continue past the buffer edge; re-read with more data
+                fill()
+                continue
+            pos = end
+            yield obj
+
+def _iter_ndjson(path):
+    with open(path, "r", encoding="utf-8-sig", errors="ignore") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def _iter_rss(path):
+    """Yields one record per <item>, detaching each from the tree once read."""
+    stack = []
+    for event, el in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            stack.append(el)
+            continue
+        stack.pop()
+        if el.tag.rsplit("}", 1)[-1] != "item":
+            continue
+        title = (el.findtext("title") or "").strip()
+        link = (el.findtext("link") or "").strip()
+        desc  = (el.findtext("description") or "").strip()
+        # tags sometimes in category nodes
+        tags = [c.text.strip().lower() for c in el.findall("category") if c.text]
+        # Heuristic: web playable is common in itch feed for HTML5; no direct flag, so let platforms empty
+        if stack:
+            stack[-1].remove(el)
+        el.clear()
+        yield {"title": title, "url": link, "short_text": desc, "tags": tags}
+
+_READERS = {
+    "json":   ("JSON", _iter_json),
+    "ndjson": ("NDJSON", _iter_ndjson),
+    "rss":    ("RSS", _iter_rss),
+}
 
-    # Try RSS (XML)
+def import_itchio_file(conn, path: str, *, web_only=False, free_only=False, batch_size=None):
+    fmt = _sniff_format(path)
+    if fmt is None:
+        print("Could not parse file as JSON, NDJSON or RSS. No rows imported.")
+        return
+    label, reader = _READERS[fmt]
     try:
-        root = ET.fromstring(text)
-        # Typical RSS: channel > item
-        for item in root.findall(".//item"):
-            title = (item.findtext("title") or "").strip()
-            link = (item.findtext("link") or "").strip()
-            desc  = (item.findtext("description") or "").strip()
-            # tags sometimes in category nodes
-            tags = [c.text.strip().lower() for c in item.findall("category") if c.text]
-            # Heuristic: web playable is common in itch feed for HTML5; no direct flag, so let platforms empty
-            rec = {"title": title, "url": link, "short_text": desc, "tags": tags}
-            imported += import_itchio_json_record(conn, rec, web_only=web_only, free_only=free_only)
-        print(f"Imported {imported} from RSS")
+        imported, secs = bulk_import_itchio_records(
+            conn, reader(path), web_only=web_only, free_only=free_only, batch_size=batch_size)
+    except (ValueError, ET.ParseError) as e:
+        print(f"Could not parse {path} as {label} ({e}). Uncommitted rows were rolled back.")
         return
-    except Exception:
-        pass
+    print(_import_summary(imported, secs, label))
+
+# ---------- Multi-file import (worker processes -> bounded queue -> one writer) ----------
+_DUMP_SUFFIXES = (".json", ".ndjson", ".jsonl", ".xml", ".rss")
+_out_q = None
+
+def expand_import_paths(patterns):
+    """Files for --file/--rss values: plain paths, globs (** allowed) or directories of dumps."""
+    paths = []
+    for pat in patterns:
+        if glob.has_magic(pat):
+            paths += sorted(p for p in glob.glob(pat, recursive=True) if os.path.isfile(p))
+        elif os.path.isdir(pat):
+            paths += sorted(os.path.join(pat, f) for f in os.listdir(pat) if f.lower().endswith(_DUMP_SUFFIXES))
+        else:
+            paths.append(pat)
+    return list(dict.fromkeys(paths))
+
+def _read_chunk(it, n):
+    """Up to n records from it, plus the reader's error if it broke part-way (records before it stay)."""
+    raw = []
+    try:
+        for r in it:
+            raw.append(r)
+            if len(raw) == n:
+                break
+    except (ValueError, OSError, ET.ParseError) as e:
+        return raw, e
+    return raw, None
+
+def _parse_file_worker(path, web_only, free_only, chunk_size):
+    """
+    Runs in a worker process: reads and normalizes one dump, putting chunks
+    of normalized records on the shared bounded queue (blocking while the
+    writer is behind), then a ("done", stats) message.
+    """
+    st = {"path": path, "format": None, "records": 0, "kept": 0, "error": None,
+          "parse": 0.0, "normalize": 0.0, "blocked": 0.0}
+    try:
+        fmt = _sniff_format(path)
+        if fmt is None:
+            raise ValueError("not JSON, NDJSON or RSS")
+        st["format"], reader = _READERS[fmt]
+        it = reader(path)
+        while True:
+            t0 = time.perf_counter()
+            raw, err = _read_chunk(it, chunk_size)
+            t1 = time.perf_counter()
+            st["parse"] += t1 - t0
+            norm = [n for n in (_normalize_itchio_record(r, web_only=web_only, free_only=free_only)
+                                for r in raw if isinstance(r, dict)) if n]
+            t2 = time.perf_counter()
+            st["normalize"] += t2 - t1
+            st["records"] += len(raw)
+            st["kept"] += len(norm)
+            if norm:
+                _out_q.put(("chunk", norm))
+                st["blocked"] += time.perf_counter() - t2
+            if err is not None:
+                raise err                       # after the records read before it
+            if not raw:
+                break
+    except (ValueError, OSError, ET.ParseError) as e:
+        st["error"] = str(e) or type(e).__name__
+    except BaseException as e:
+        st["error"] = f"{type(e).__name__}: {e}"
+        raise                                   # exits the worker non-zero; the writer aborts
+    finally:
+        _out_q.put(("done", st))                # always, or the writer waits for this file forever
 
-    print("Could not parse file as JSON or RSS. No rows imported.")
+def _parse_worker_main(tasks, out_q, web_only, free_only, chunk_size):
+    global _out_q
+    _out_q = out_q
+    for path in iter(tasks.get, None):
+        _parse_file_worker(path, web_only, free_only, chunk_size)
+
+def _check_parse_workers(procs):
+    for p in procs:
+        if p.exitcode not in (None, 0):
+            raise RuntimeError(f"parse worker {p.pid} exited with code {p.exitcode}")
+
+def parallel_import_itchio_files(conn, paths, *, workers, web_only=False, free_only=False,
+                                 batch_size=None, chunk_size=2000, max_queue=None):
+    """
+    Parses and normalizes paths in worker processes. Chunks of normalized
+    records flow through a bounded queue (max_queue chunks, default
+    4 per worker); workers block when it is full. This thread is the only
+    writer: same chunk writes as bulk_import_itchio_records, one transaction
+    unless batch_size. A file that fails to parse is reported, but records
+    it yielded before the error stay imported.
+    Returns (imported, seconds, {"files": [per-file stats], "writer": {...}}).
+    """
+    t0 = time.perf_counter()
+    wr = {"write": 0.0, "commit": 0.0, "idle": 0.0, "chunks": 0}
+    files = {}
+    with phase("resolve"):
+        item_ids = load_item_ids(conn, "game")
+        tag_ids = load_tag_ids(conn)
+    imported = pending = 0
+    ctx = multiprocessing.get_context()
+    q = ctx.Queue(maxsize=max_queue or 4 * workers)
+    tasks = ctx.Queue()
+    for p in paths + [None] * workers:
+        tasks.put(p)
+    # plain processes, not an executor: if the writer fails, workers blocked
+    # on put() into the full queue are terminated instead of waited for
+    procs = [ctx.Process(target=_parse_worker_main, daemon=True,
+                         args=(tasks, q, web_only, free_only, chunk_size)) for _ in range(workers)]
+    try:
+        for p in procs:
+            p.start()
+        while len(files) < len(paths):
+            t = time.perf_counter()
+            try:
+                kind, payload = q.get(timeout=0.5)
+            except queue.Empty:
+                wr["idle"] += time.perf_counter() - t
+                _check_parse_workers(procs)     # a worker died
+                continue
+            wr["idle"] += time.perf_counter() - t
+            if kind == "done":
+                files[payload["path"]] = payload
+                continue
+            t = time.perf_counter()
+            _write_itchio_chunk(conn, payload, item_ids, tag_ids)
+            wr["write"] += time.perf_counter() - t
+            wr["chunks"] += 1
+            imported += len(payload)
+            pending += len(payload)
+            if batch_size and pending >= batch_size:
+                t = time.perf_counter()
+                with phase("commit"):
+                    conn.commit()
+                wr["commit"] += time.perf_counter() - t
+                pending = 0
+        for p in procs:
+            p.join()
+        _check_parse_workers(procs)             # a worker that raised past its own handler
+        t = time.perf_counter()
+        with phase("commit"):
+            conn.commit()
+        wr["commit"] += time.perf_counter() - t
+    except BaseException:
+        # the queue is not drained: a killed worker can leave half a message in it
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+            if p.pid is not None:
+                p.join()
+        tasks.cancel_join_thread()              # unread paths must not block our exit
+        conn.rollback()
+        raise
+    finally:
+        q.close()
+        tasks.close()
+    return imported, time.perf_counter() - t0, {"files": [files[p] for p in paths], "writer": wr}
+
+def import_itchio_files(conn, paths, *, workers=None, web_only=False, free_only=False, batch_size=None):
+    """CLI entry for one or many dumps: one file (or workers=1) keeps the in-process reader."""
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        for path in paths:
+            import_itchio_file(conn, path, web_only=web_only, free_only=free_only, batch_size=batch_size)
+        return
+    imported, secs, stats = parallel_import_itchio_files(
+        conn, paths, workers=workers, web_only=web_only, free_only=free_only, batch_size=batch_size)
+    fs, wr = stats["files"], stats["writer"]
+    failed = [f for f in fs if f["error"]]
+    for f in failed[:10]:
+        print(f"  failed: {f['path']} ({f['error']}); records read before the error were kept")
+    print(_import_summary(imported, secs, f"{len(fs)} file(s) with {workers} workers"))
+    print(f"  workers (summed): parse {sum(f['parse'] for f in fs):.2f}s, "
+          f"normalize {sum(f['normalize'] for f in fs):.2f}s, blocked on full queue {sum(f['blocked'] for f in fs):.2f}s")
+    print(f"  writer: write {wr['write']:.2f}s over {wr['chunks']} chunk(s), commit {wr['commit']:.2f}s, "
+          f"waiting for chunks {wr['idle']:.2f}s" + (f"; {len(failed)} file(s) failed" if failed else ""))
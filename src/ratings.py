@@ -1,6 +1,15 @@
+import csv
+import json
 import math
+import sqlite3
+import time
+from itertools import islice
 from sqlite3 import Connection
 
+from db import connect, load_item_ids, bulk_ensure_items, source_id, scale_id, sync_item_fts, ROLLUP_UPSERT
+from db import ensure_item as _ensure_item
+from tracing import phase, timed
+
 def add_scale_defaults(conn: Connection):
     conn.execute("INSERT OR IGNORE INTO rating_scale(name,type,min_value,max_value,step,notes) VALUES (?,?,?,?,?,?)", ('stars_5','continuous',0,5,0.5,'Half-star increments'))
     conn.execute("INSERT OR IGNORE INTO rating_scale(name,type,min_value,max_value,step,notes) VALUES (?,?,?,?,?,?)", ('thumb','binary',None,None,None,'Thumbs up/down'))
@@ -14,24 +23,79 @@ def add_source(conn: Connection, name: str, kind: str, weight: float=1.0, trust:
     conn.commit()
 
 def ensure_item(conn: Connection, title: str, media_code: str):
-    row = conn.execute("SELECT id FROM item WHERE title=? AND media_code=?", (title, media_code)).fetchone()
-    if row: return row['id']
-    cur = conn.execute("INSERT INTO item(media_code,title) VALUES(?,?)", (media_code,title))
-    conn.commit()
-    return cur.lastrowid
+    return _ensure_item(conn, title, media_code)
 
 def normalize_percent_for_stars5(value_num: float) -> int:
     pct = int(round((value_num/5.0)*100))
     return max(0, min(100, pct))
 
+def confidence_for_votes(votes) -> float:
+    return 1.0 if not votes else max(1.0, math.sqrt(max(0, votes)))
+
+# ---------- Change-only writes ----------
+# A rating saying exactly what the latest one for its (item, source) already
+# says (same scale, value, percent, votes and notes) does not add a row: the
+# latest row's last_seen_at/seen_count are bumped instead. Re-scrapes of
+# unchanged pages therefore cost one UPDATE and no history growth.
+_LATEST_FOR_SOURCE = """
+    SELECT l.item_id, r.id, r.scale_id, r.raw_value, r.value_num, r.percent, r.vote_count, r.notes
+    FROM item_rating_latest l
+    JOIN item_rating r ON r.id = l.rating_id
+    WHERE l.source_id = ? AND l.item_id IN ({marks})"""
+_EXTEND_SQL = "UPDATE item_rating SET last_seen_at = datetime('now'), seen_count = seen_count + 1 WHERE id = ?"
+
+def _latest_ratings(conn, src, item_ids) -> dict:
+    """{item_id: (rating_id, scale_id, raw_value, value_num, percent, vote_count, notes)} for one source."""
+    out, ids = {}, sorted(set(item_ids))
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        for r in conn.execute(_LATEST_FOR_SOURCE.format(marks=",".join("?" * len(chunk))), [src] + chunk):
+            out[r[0]] = tuple(r[1:])
+    return out
+
+def _extend_if_unchanged(conn, item_id, src, scale, raw, num, percent, votes, notes) -> bool:
+    cur = _latest_ratings(conn, src, [item_id]).get(item_id)
+    if cur is None or cur[1:] != (scale, raw, num, percent, votes, notes):
+        return False
+    conn.execute(_EXTEND_SQL, (cur[0],))
+    return True
+
+def add_ratings_stars5_bulk(conn: Connection, *, source_name: str, rows):
+    """
+    rows: iterable of (item_id, stars, votes, notes) for existing items.
+    Rows identical to the item's latest rating from this source only extend
+    it; the rest are inserted. One executemany each and a single commit.
+    Returns (inserted, extended).
+    """
+    src = source_id(conn, source_name)
+    if src is None: raise ValueError('source not found')
+    scale = scale_id(conn, 'stars_5')
+    params = [(item_id, src, scale, stars, normalize_percent_for_stars5(stars), votes,
+               confidence_for_votes(votes), notes)
+              for item_id, stars, votes, notes in rows]
+    latest = _latest_ratings(conn, src, (p[0] for p in params))
+    inserts, extends = [], []
+    for p in params:
+        cur = latest.get(p[0])
+        if cur is not None and cur[1:] == (scale, None, p[3], p[4], p[5], p[7]):
+            extends.append((cur[0],))
+        else:
+            inserts.append(p)
+            latest.pop(p[0], None)      # a later duplicate in rows compares against nothing
+    conn.executemany(_EXTEND_SQL, extends)
+    conn.executemany("INSERT INTO item_rating(item_id,source_id,scale_id,value_num,percent,vote_count,confidence,notes) VALUES (?,?,?,?,?,?,?,?)", inserts)
+    conn.commit()
+    return len(inserts), len(extends)
+
 def add_rating_stars5(conn: Connection, *, item_title: str, media_code: str, source_name: str, stars: float, votes: int=None, notes: str=None):
     item_id = ensure_item(conn, item_title, media_code)
-    src = conn.execute("SELECT id FROM rating_source WHERE name=?", (source_name,)).fetchone()
-    if not src: raise ValueError('source not found')
-    scale = conn.execute("SELECT id FROM rating_scale WHERE name='stars_5'").fetchone()
+    src = source_id(conn, source_name)
+    if src is None: raise ValueError('source not found')
+    scale = scale_id(conn, 'stars_5')
     percent = normalize_percent_for_stars5(stars)
-    conf = 1.0 if not votes else max(1.0, math.sqrt(max(0, votes)))
-    conn.execute("INSERT INTO item_rating(item_id,source_id,scale_id,value_num,percent,vote_count,confidence,notes) VALUES (?,?,?,?,?,?,?,?)", (item_id, src['id'], scale['id'], stars, percent, votes, conf, notes))
+    conf = confidence_for_votes(votes)
+    if not _extend_if_unchanged(conn, item_id, src, scale, None, stars, percent, votes, notes):
+        conn.execute("INSERT INTO item_rating(item_id,source_id,scale_id,value_num,percent,vote_count,confidence,notes) VALUES (?,?,?,?,?,?,?,?)", (item_id, src, scale, stars, percent, votes, conf, notes))
     conn.commit()
     return item_id, percent, conf
 
@@ -41,21 +105,225 @@ def add_rating_thumb(conn, *, item_title: str, media_code: str, source_name: str
     
     item_id = ensure_item(conn, item_title, media_code)
     
-    src = conn.execute("SELECT id FROM rating_source WHERE name=?", (source_name,)).fetchone()
-    if not src:
+    src = source_id(conn, source_name)
+    if src is None:
         raise ValueError("source not found")
     
-    scale = conn.execute("SELECT id FROM rating_scale WHERE name='thumb'").fetchone()
+    scale = scale_id(conn, "thumb")
     raw = "true" if up else "false"
     
     percent = 100 if up else 0
-    conf = 1.0 if not votes else max(1.0, math.sqrt(max(0, votes)))
+    conf = confidence_for_votes(votes)
     
-    conn.execute(
-        "INSERT INTO item_rating(item_id,source_id,scale_id,raw_value,percent,vote_count,confidence,notes) "
-        "VALUES (?,?,?,?,?,?,?,?)",
-        (item_id, src["id"], scale["id"], raw, percent, votes, conf, notes)
-    )
+    if not _extend_if_unchanged(conn, item_id, src, scale, raw, None, percent, votes, notes):
+        conn.execute(
+            "INSERT INTO item_rating(item_id,source_id,scale_id,raw_value,percent,vote_count,confidence,notes) "
+            "VALUES (?,?,?,?,?,?,?,?)",
+            (item_id, src, scale, raw, percent, votes, conf, notes)
+        )
     conn.commit()
 
     return item_id, percent, conf
+
+# ---------- Bulk ingest (CSV / NDJSON) ----------
+_THUMB_ALIASES = {"up": "true", "yes": "true", "1": "true", "down": "false", "no": "false", "0": "false"}
+
+def iter_rating_rows(path):
+    """
+    Yields dicts with item, media, source, scale, value[, votes, notes, rated_at]
+    from a CSV (header row) or NDJSON file, picked by extension or first byte.
+    An NDJSON line that does not parse is yielded as a ValueError, so the
+    importer reports that row and carries on.
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        head = f.read(1)
+        f.seek(0)
+        if path.endswith((".ndjson", ".jsonl")) or head in ("{", ""):
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError as e:
+                        yield ValueError(f"bad JSON: {e}")
+        else:
+            yield from csv.DictReader(f)
+
+def _load_scales(conn):
+    scales = {r["name"]: (r["id"], r["type"], r["min_value"], r["max_value"])
+              for r in conn.execute("SELECT id, name, type, min_value, max_value FROM rating_scale")}
+    maps = {}
+    for r in conn.execute("SELECT scale_id, raw_value, percent FROM rating_scale_map"):
+        maps.setdefault(r["scale_id"], {})[r["raw_value"]] = r["percent"]
+    return scales, maps
+
+def _normalize_value(scale, mapping, value):
+    """Returns (raw_value, value_num, percent) for one value on one scale."""
+    sid, stype, lo, hi = scale
+    if mapping:
+        raw = str(value).strip().lower()
+        raw = _THUMB_ALIASES.get(raw, raw) if "true" in mapping else raw
+        if raw not in mapping:
+            raise ValueError(f"value {value!r} not in scale map")
+        return raw, None, mapping[raw]
+    if stype != "continuous" or lo is None or hi is None or hi == lo:
+        raise ValueError("scale has neither a value map nor a numeric range")
+    num = float(value)
+    pct = int(round((num - lo) / (hi - lo) * 100))
+    return None, num, max(0, min(100, pct))
+
+def import_ratings(conn: Connection, rows, *, batch_size=5000):
+    """
+    Bulk-inserts rating rows. Source/scale/item ids are resolved through
+    in-memory maps loaded once (new items are created in bulk); each chunk
+    of batch_size rows is one executemany and one commit.
+    Returns (imported, errors, seconds); errors is [(row_number, message)].
+    """
+    t0 = time.perf_counter()
+    sources = {r["name"]: r["id"] for r in conn.execute("SELECT id, name FROM rating_source")}
+    media_codes = {r["code"] for r in conn.execute("SELECT code FROM media_type")}
+    scales, maps = _load_scales(conn)
+    item_ids = load_item_ids(conn)
+    imported, errors = 0, []
+    it = enumerate(timed(rows, "parse"), start=1)
+    while True:
+        chunk = list(islice(it, batch_size))
+        if not chunk:
+            break
+        pending = []
+        with phase("resolve"):
+            for n, row in chunk:
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    if not isinstance(row, dict):
+                        raise ValueError("expected an object")
+                    title = str(row["item"]).strip()
+                    media = str(row["media"]).strip().lower()
+                    if media not in media_codes:
+                        raise ValueError(f"media {row['media']!r} not found")
+                    src_id = sources.get(str(row["source"]).strip())
+                    if src_id is None:
+                        raise ValueError(f"source {row['source']!r} not found")
+                    scale = scales.get(str(row["scale"]).strip())
+                    if scale is None:
+                        raise ValueError(f"scale {row['scale']!r} not found")
+                    raw, num, pct = _normalize_value(scale, maps.get(scale[0]), row["value"])
+                    votes = int(row["votes"]) if row.get("votes") not in (None, "") else None
+                except (KeyError, ValueError, TypeError) as e:
+                    errors.append((n, str(e)))
+                    continue
+                pending.append((title, media, src_id, scale[0], raw, num, pct, votes,
+                                row.get("notes") or None, row.get("rated_at") or None))
+        try:
+            with phase("resolve"):
+                bulk_ensure_items(conn, item_ids, ((p[0], p[1], None) for p in pending))
+            with phase("write"):
+                conn.executemany(
+                    "INSERT INTO item_rating(item_id,source_id,scale_id,raw_value,value_num,percent,"
+                    "vote_count,confidence,notes,rated_at) VALUES (?,?,?,?,?,?,?,?,?,COALESCE(?, datetime('now')))",
+                    [(item_ids[(p[0], p[1])], p[2], p[3], p[4], p[5], p[6], p[7],
+                      confidence_for_votes(p[7]), p[8], p[9]) for p in pending])
+            with phase("commit"):
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        imported += len(pending)
+    return imported, errors, time.perf_counter() - t0
+
+def cmd_import_ratings(args):
+    conn = connect(args.db)
+    imported, errors, secs = import_ratings(conn, iter_rating_rows(args.file), batch_size=args.batch_size)
+    sync_item_fts(conn)
+    for n, msg in errors[:10]:
+        print(f"  row {n}: {msg}")
+    rate = imported / secs if secs > 0 else 0.0
+    print(f"Imported {imported} ratings in {secs:.2f}s ({rate:,.0f} rows/s), skipped {len(errors)}")
+
+# ---------- History compaction ----------
+_PERIOD = {"day": "substr(r.rated_at, 1, 10)", "month": "substr(r.rated_at, 1, 7)"}
+_CUTOFF = {"day": "date('now', ?)", "month": "date('now', ?, 'start of month')"}
+
+def compact_history(conn: Connection, *, older_than_days: int, bucket: str = "day", archive: bool = False,
+                    sources=None, include_user: bool = False):
+    """
+    Folds item_rating rows rated before the cutoff (now - older_than_days,
+    rounded down to a whole day/month) into item_rating_rollup, one row per
+    (item, source, bucket period), then deletes them from item_rating. With
+    archive the raw rows are first copied to item_rating_archive.
+    Only external sources are compacted unless include_user; rows that are
+    the latest for their (item, source) always stay. One transaction.
+    Returns (rows compacted, rollup rows written).
+    """
+    if bucket not in _PERIOD:
+        raise ValueError("bucket must be day or month")
+    where, params = [f"r.rated_at < {_CUTOFF[bucket]}"], [f"-{int(older_than_days)} days"]
+    if not include_user:
+        where.append("s.kind <> 'user'")
+    if sources:
+        where.append(f"s.name IN ({','.join('?' * len(sources))})")
+        params += list(sources)
+    conn.commit()
+    conn.execute("BEGIN")
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp._compact")
+        conn.execute(f"""
+            CREATE TEMP TABLE _compact AS
+            SELECT r.id, r.item_id, r.source_id, {_PERIOD[bucket]} AS period,
+                   ROW_NUMBER() OVER (PARTITION BY r.item_id, r.source_id, {_PERIOD[bucket]}
+                                      ORDER BY r.rated_at DESC, r.id DESC) AS rn
+            FROM item_rating r
+            JOIN rating_source s ON s.id = r.source_id
+            WHERE {' AND '.join(where)}
+              AND NOT EXISTS (SELECT 1 FROM item_rating_latest l      -- by primary key, not rating_id
+                              WHERE l.item_id = r.item_id AND l.source_id = r.source_id
+                                AND l.rating_id = r.id)""", params)
+        n = conn.execute("SELECT COUNT(*) FROM temp._compact").fetchone()[0]
+        groups = 0
+        if n:
+            groups = conn.execute("""
+                SELECT COUNT(*) FROM (SELECT 1 FROM temp._compact GROUP BY item_id, source_id, period)
+                """).fetchone()[0]
+            conn.execute("""
+                INSERT INTO item_rating_rollup(item_id, source_id, bucket, period, n_rows, n_seen,
+                  percent_min, percent_max, percent_sum, percent_last, votes_min, votes_max, votes_last,
+                  first_at, last_at)
+                SELECT c.item_id, c.source_id, ?, c.period, COUNT(*), SUM(r.seen_count),
+                       MIN(r.percent), MAX(r.percent), SUM(r.percent), MAX(CASE WHEN c.rn = 1 THEN r.percent END),
+                       MIN(r.vote_count), MAX(r.vote_count), MAX(CASE WHEN c.rn = 1 THEN r.vote_count END),
+                       MIN(r.rated_at), MAX(COALESCE(r.last_seen_at, r.rated_at))
+                FROM temp._compact c
+                JOIN item_rating r ON r.id = c.id
+                GROUP BY c.item_id, c.source_id, c.period""" + ROLLUP_UPSERT, (bucket,))
+            if archive:
+                conn.execute("""
+                    INSERT OR REPLACE INTO item_rating_archive(id, item_id, source_id, scale_id, raw_value, value_num,
+                      percent, vote_count, confidence, rated_at, notes, last_seen_at, seen_count)
+                    SELECT r.id, r.item_id, r.source_id, r.scale_id, r.raw_value, r.value_num, r.percent,
+                           r.vote_count, r.confidence, r.rated_at, r.notes, r.last_seen_at, r.seen_count
+                    FROM item_rating r JOIN temp._compact c ON c.id = r.id""")
+            conn.execute("DELETE FROM item_rating WHERE id IN (SELECT id FROM temp._compact)")
+        conn.execute("DROP TABLE temp._compact")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return n, groups
+
+def cmd_compact_history(args):
+    conn = connect(args.db)
+    sources = [s.strip() for s in args.source.split(",") if s.strip()] if args.source else None
+    t0 = time.perf_counter()
+    try:
+        n, groups = compact_history(conn, older_than_days=args.older_than, bucket=args.bucket,
+                                    archive=args.archive, sources=sources, include_user=args.include_user)
+    except sqlite3.OperationalError as e:
+        if "item_rating_rollup" in str(e) or "seen_count" in str(e):  # pre-migration database
+            raise SystemExit("No rollup tables. Run:  python src/recommend-it.py migrate <db>")
+        raise
+    dest = "archived and rolled up" if args.archive else "rolled up"
+    print(f"Compacted {n} rating row(s) older than {args.older_than} days into {groups} "
+          f"{args.bucket} rollup row(s), {dest}, in {time.perf_counter() - t0:.2f}s")
+    if n and args.vacuum:
+        conn.execute("VACUUM")
+        print("Vacuumed")
@@ -1,96 +1,123 @@
 import argparse
-from db import init_db, connect
-from ratings import add_scale_defaults, add_source, add_rating_stars5, add_rating_thumb
-from itchio import cmd_fetch_itchio_rating, import_itchio_file
-from export import _fetch_items_for_export, _fetch_ratings_ledger, _write_xlsx, _bucket_by_media
+import importlib
+from db import init_db, connect, rebuild_rating_latest, check_rating_latest, id_cache_stats
+from db import migrate, schema_version, MIGRATIONS, SCHEMA_PATH, sync_item_fts
+
+# ---- lazy handlers ----
+# Command modules pull in urllib/ElementTree (itchio), numpy (recommend,
+# dedupe) and scipy (similar); import them only for the command being run.
+def _lazy(spec):
+    """'module:function' -> handler importing the module on dispatch."""
+    module, _, name = spec.partition(":")
+    def run(args):
+        return getattr(importlib.import_module(module), name)(args)
+    run.__qualname__ = spec
+    return run
 
 # ---- handlers ----
 def cmd_init_db(args):
     init_db(args.db)
     print("db ready")
 
+def cmd_migrate(args):
+    conn = connect(args.db)
+    current = schema_version(conn)
+    if args.status:
+        pending = [(v, d) for v, d, _ in MIGRATIONS if v > current]
+        print(f"schema version {current}, {len(pending)} pending")
+        for v, d in pending:
+            print(f"  {v}: {d}")
+        return
+    # bring the baseline objects up to date first (all IF NOT EXISTS)
+    with open(SCHEMA_PATH, 'r', encoding='utf-8') as f:
+        conn.executescript(f.read())
+    applied = migrate(conn)
+    for v, d in applied:
+        print(f"applied {v}: {d}")
+    print(f"schema version {schema_version(conn)}" + ("" if applied else " (up to date)"))
+
+def cmd_rebuild_latest(args):
+    conn = connect(args.db)
+    if args.check:
+        bad = check_rating_latest(conn)
+        print("item_rating_latest consistent" if not bad else f"item_rating_latest: {bad} mismatched rows")
+        raise SystemExit(1 if bad else 0)
+    print(f"item_rating_latest rebuilt ({rebuild_rating_latest(conn)} rows)")
+
 def cmd_add_scale_defaults(args):
+    from ratings import add_scale_defaults
     conn = connect(args.db)
     add_scale_defaults(conn)
     print("scales ready")
 
 def cmd_add_source(args):
+    from ratings import add_source
     conn = connect(args.db)
     add_source(conn, args.name, args.kind, args.weight, args.trust)
     print("source ready")
 
 def cmd_rate5(args):
+    from ratings import add_rating_stars5
     conn = connect(args.db)
     print(add_rating_stars5(
         conn,
         item_title=args.item, media_code=args.media, source_name=args.source,
         stars=args.stars, votes=args.votes, notes=args.notes
     ))
+    sync_item_fts(conn)
 
 def cmd_rate_thumb(args):
     if args.up and args.down:
         raise SystemExit("--up and --down are mutually exclusive")
+    from ratings import add_rating_thumb
     conn = connect(args.db)
     print(add_rating_thumb(
         conn,
         item_title=args.item, media_code=args.media, source_name=args.source,
         up=bool(args.up), votes=args.votes, notes=args.notes
     ))
+    sync_item_fts(conn)
 
 def cmd_import_itchio(args):
+    from itchio import import_itchio_files, expand_import_paths
     conn = connect(args.db)  # <-- make sure conn is defined here
     init_db(args.db)         # (optional if not already initialized)
     if not args.file and not args.rss:
-        raise SystemExit("Provide --file (JSON) or --rss (XML)")
-    path = args.file or args.rss
-    import_itchio_file(conn, path, web_only=args.web_only, free_only=args.free_only)
+        raise SystemExit("Provide --file (JSON/NDJSON) or --rss (XML)")
+    paths = expand_import_paths((args.file or []) + (args.rss or []))
+    if not paths:
+        raise SystemExit("No files matched")
+    import_itchio_files(conn, paths, workers=args.workers, web_only=args.web_only, free_only=args.free_only,
+                        batch_size=args.batch_size)
+    sync_item_fts(conn)
 
-def cmd_export_xlsx(args):
-    conn = connect(args.db)
-
-    # Pull items (optionally filtered by a single media/platform)
-    items = _fetch_items_for_export(
-        conn,
-        media=args.media,              # note: if you set --split-by-media, consider leaving this None
-        platform=args.platform,
-        min_itchio=args.min_itchio,
-        limit=args.limit
-    )
-
-    sheets = {}
-    if args.split_by_media:
-        # Optional explicit order via --tab-order=game,book,...
-        order = [s.strip() for s in (args.tab_order or "").split(",") if s.strip()] or None
-        sheets.update(_bucket_by_media(items, order=order, include_empty=args.include_empty_tabs))
-    else:
-        # Single 'Items' sheet (current behavior)
-        sheets["Items"] = {"rows": items}
-
-    # Optional Ratings sheet (unchanged behavior)
-    if args.include_ratings:
-        ratings = _fetch_ratings_ledger(
-            conn,
-            media=args.media if not args.split_by_media else None,  # if split, include all ratings
-            source=args.source,
-            since=args.since,
-            limit=args.limit_ratings
-        )
-        sheets["Ratings"] = {"rows": ratings}
-
-    # Write the workbook
-    _write_xlsx(args.out, sheets)
-    # Friendly summary
-    tab_counts = ", ".join(f"{name}:{len(payload['rows'])}" for name, payload in sheets.items())
-    print(f"wrote Excel → {args.out}  ({tab_counts})")
+def _add_http_cache_args(sp):
+    sp.add_argument("--no-cache", action="store_true", help="Bypass the on-disk HTTP cache")
+    sp.add_argument("--cache-ttl", type=float, default=20, help="Hours before a cached page is revalidated (default 20)")
+    sp.add_argument("--cache-max-mb", type=int, default=256, help="HTTP cache size budget in MB (default 256)")
 
 def main():
     p = argparse.ArgumentParser()
+    p.add_argument("--cache-stats", action="store_true", help="Print id cache hit/miss counts after the command")
+    p.add_argument("--profile", action="store_true", help="Print per-statement SQL timings and phase times to stderr")
+    p.add_argument("--profile-out", metavar="FILE", help="Write the profile as JSON to FILE (implies profiling)")
+    p.add_argument("--slow-ms", type=float, default=250.0, help="Profile: EXPLAIN QUERY PLAN statements slower than this (default 250)")
     sub = p.add_subparsers(dest='cmd', required=True)
 
     sp = sub.add_parser('init-db')
     sp.add_argument('db')
     sp.set_defaults(func=cmd_init_db)    
 
+    sp = sub.add_parser('migrate', help="Upgrade an existing database in place")
+    sp.add_argument('db')
+    sp.add_argument('--status', action='store_true', help="Only list pending migrations")
+    sp.set_defaults(func=cmd_migrate)
+
+    sp = sub.add_parser('rebuild-latest', help="Backfill item_rating_latest from the rating history")
+    sp.add_argument('db')
+    sp.add_argument('--check', action='store_true', help="Only report mismatches (exit 1 if any)")
+    sp.set_defaults(func=cmd_rebuild_latest)
+
     sp = sub.add_parser('add-scale-defaults')
     sp.add_argument('db')
     sp.set_defaults(func=cmd_add_scale_defaults)
@@ -123,24 +150,32 @@ def main():
     group.add_argument("--down", action="store_true", help="Thumbs down")
     sp.add_argument("--votes", type=int, help="Number of ratings at the source")
     sp.add_argument("--notes")
-    sp.set_defaults(func=lambda args: print(
-        add_rating_thumb(
-            connect(args.db),
-            item_title=args.item,
-            media_code=args.media,
-            source_name=args.source,
-            up=bool(args.up),
-            votes=args.votes,
-            notes=args.notes
-        )
-    ))
+    sp.set_defaults(func=cmd_rate_thumb)
+
+    sp = sub.add_parser("import-ratings", help="Bulk-load ratings from CSV or NDJSON")
+    sp.add_argument("db")
+    sp.add_argument("file", help="Columns: item, media, source, scale, value[, votes, notes, rated_at]")
+    sp.add_argument("--batch-size", type=int, default=5000, help="Rows per transaction (default 5000)")
+    sp.set_defaults(func=_lazy("ratings:cmd_import_ratings"))
+
+    sp = sub.add_parser("compact-history", help="Fold old scraped ratings into daily/monthly rollups")
+    sp.add_argument("db")
+    sp.add_argument("--older-than", type=int, required=True, metavar="DAYS", help="Compact ratings older than DAYS")
+    sp.add_argument("--bucket", choices=["day", "month"], default="day", help="Rollup period (default day)")
+    sp.add_argument("--archive", action="store_true", help="Keep the raw rows in item_rating_archive")
+    sp.add_argument("--source", help="Only these sources (comma list; default every external source)")
+    sp.add_argument("--include-user", action="store_true", help="Also compact 'user' sources")
+    sp.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return the space")
+    sp.set_defaults(func=_lazy("ratings:cmd_compact_history"))
 
     sp = sub.add_parser("import-itchio")
     sp.add_argument("db")
-    sp.add_argument("--file")
-    sp.add_argument("--rss")
+    sp.add_argument("--file", action="append", help="JSON/NDJSON dump, glob or directory (repeatable)")
+    sp.add_argument("--rss", action="append", help="RSS dump, glob or directory (repeatable)")
+    sp.add_argument("--workers", type=int, help="Parse processes for several files (default: CPU count)")
     sp.add_argument("--web-only", action="store_true")
     sp.add_argument("--free-only", action="store_true")
+    sp.add_argument("--batch-size", type=int, help="Commit every N rows (default: one transaction)")
     sp.set_defaults(func=cmd_import_itchio)
 
     # in your argparse wiring:
@@ -148,18 +183,94 @@ def main():
     sp.add_argument("db")
     sp.add_argument("--url", required=True)
     sp.add_argument("--title", help="Optional item title override")
-    sp.set_defaults(func=cmd_fetch_itchio_rating)
+    _add_http_cache_args(sp)
+    sp.set_defaults(func=_lazy("itchio:cmd_fetch_itchio_rating"))
+
+    sp = sub.add_parser("refresh-itchio-ratings", help="Re-scrape every stored itch.io URL concurrently")
+    sp.add_argument("db")
+    sp.add_argument("--workers", type=int, default=16, help="Concurrent fetches (default 16)")
+    sp.add_argument("--per-host", type=int, default=4, help="Max in-flight requests per site (default 4)")
+    sp.add_argument("--rate", type=float, help="Max requests per second per site")
+    sp.add_argument("--retries", type=int, default=3)
+    sp.add_argument("--limit", type=int, help="Only refresh the first N refs")
+    _add_http_cache_args(sp)
+    sp.set_defaults(func=_lazy("itchio:cmd_refresh_itchio_ratings"))
+
+    sp = sub.add_parser("recommend", help="Top items by confidence/weight/trust-blended score")
+    sp.add_argument("db")
+    sp.add_argument("--top", type=int, default=20, help="How many items to show (default 20)")
+    sp.add_argument("--media", choices=["game","book","movie","tv","music"])
+    sp.add_argument("--platform", help="Only items on this platform, e.g. web")
+    sp.add_argument("--tag", help="Only items with this tag")
+    sp.add_argument("--unrated-by", help="Skip items already rated by this source (e.g. fred)")
+    sp.add_argument("--min-sources", type=int, default=1, help="Require ratings from at least N sources")
+    sp.add_argument("--prior-weight", type=float, default=5.0,
+                    help="Pseudo-ratings pulling thinly rated items towards the global mean (default 5)")
+    sp.set_defaults(func=_lazy("recommend:cmd_recommend"))
+
+    sp = sub.add_parser("search", help="Full-text search over titles, descriptions and tags")
+    sp.add_argument("db")
+    sp.add_argument("query", help="Words to match (last word also matches as a prefix)")
+    sp.add_argument("--top", type=int, default=20, help="How many items to show (default 20)")
+    sp.add_argument("--media", choices=["game","book","movie","tv","music"])
+    sp.add_argument("--platform", help="Only items on this platform, e.g. web")
+    sp.add_argument("--blend", type=float, default=0.0,
+                    help="0..1: mix latest rating percent into the text relevance (default 0)")
+    sp.add_argument("--raw", action="store_true", help="Pass the query to FTS5 as-is (phrases, OR, NEAR, column:)")
+    sp.add_argument("--sync", action="store_true",
+                    help="Index items changed outside the CLI's writers first (opens the database for writing)")
+    sp.set_defaults(func=_lazy("search:cmd_search"))
+
+    sp = sub.add_parser("build-similar", help="Precompute top-N similar items from tags (and co-ratings)")
+    sp.add_argument("db")
+    sp.add_argument("--top-n", type=int, default=20, help="Neighbours stored per item (default 20)")
+    sp.add_argument("--ratings", type=float, default=0.0,
+                    help="0..1: weight of user-source rating similarity vs tags (default 0)")
+    sp.add_argument("--full", action="store_true", help="Recompute every item, not just the changed ones")
+    sp.set_defaults(func=_lazy("similar:cmd_build_similar"))
+
+    sp = sub.add_parser("similar", help="Items most like a given one (needs build-similar)")
+    sp.add_argument("db")
+    grp = sp.add_mutually_exclusive_group(required=True)
+    grp.add_argument("--item", help="Exact title")
+    grp.add_argument("--id", type=int, help="Item id")
+    sp.add_argument("--media", choices=["game","book","movie","tv","music"], help="Disambiguate --item")
+    sp.add_argument("--top", type=int, default=10, help="How many items to show (default 10)")
+    sp.set_defaults(func=_lazy("similar:cmd_similar"))
+
+    sp = sub.add_parser("dedupe", help="Find (and merge) duplicate items across sources")
+    sp.add_argument("db")
+    sp.add_argument("--apply", action="store_true", help="Merge the clusters (default: report only)")
+    sp.add_argument("--fuzzy", action="store_true", help="Also match near-identical titles (MinHash over trigrams)")
+    sp.add_argument("--threshold", type=float, default=0.85, help="--fuzzy: min trigram Jaccard (default 0.85)")
+    sp.add_argument("--show", type=int, default=20, help="Clusters to list (default 20)")
+    sp.set_defaults(func=_lazy("dedupe:cmd_dedupe"))
+
+    sp = sub.add_parser("serve", help="Local HTTP/JSON server: pooled readers, one group-committing writer")
+    sp.add_argument("db")
+    sp.add_argument("--host", default="127.0.0.1")
+    sp.add_argument("--port", type=int, default=8765)
+    sp.add_argument("--readers", type=int, default=4, help="Read-only connections in the pool (default 4)")
+    sp.add_argument("--max-group", type=int, default=256, help="Max writes committed together (default 256)")
+    sp.add_argument("--group-ms", type=float, default=0.0,
+                    help="Extra wait for more writes before committing a group (default 0)")
+    sp.add_argument("--write-timeout", type=float, default=60.0, help="Seconds a write request waits (default 60)")
+    sp.add_argument("--backlog", type=int, default=128,
+                    help="Connections the OS queues before accept (default 128; the stdlib's is 5)")
+    sp.add_argument("--verbose", action="store_true", help="Log every request with its latency")
+    sp.set_defaults(func=_lazy("server:cmd_serve"))
 
     sp = sub.add_parser("export-xlsx", help="Export items (and optional ratings) to Excel")
     sp.add_argument("db")
     sp.add_argument("--out", required=True, help="Output .xlsx path")
-    sp.set_defaults(func=cmd_export_xlsx)
+    sp.set_defaults(func=_lazy("export:cmd_export_xlsx"))
 
     # filters (same as before)
     sp.add_argument("--media", choices=["game","book","movie","tv","music"])
     sp.add_argument("--platform", help="Filter by platform, e.g. web")
     sp.add_argument("--min-itchio", type=int, help="Only items with Itch.io percent >= this")
     sp.add_argument("--limit", type=int, help="Max items")    
+    sp.add_argument("--sources", help="Rating columns to include: comma list of sources or 'all' (default itchio,fred)")
 
     # NEW: split tabs by media type
     sp.add_argument("--split-by-media", action="store_true", help="Create separate tabs per media type")
@@ -171,10 +282,60 @@ def main():
     sp.add_argument("--source", help="Filter ratings by source (e.g., itchio, fred)")
     sp.add_argument("--since", help="Only ratings since this date (YYYY-MM-DD)")
     sp.add_argument("--limit-ratings", type=int, help="Max ratings rows")
-    sp.set_defaults(func=cmd_export_xlsx)
+    sp.add_argument("--latest-only", action="store_true", help="Ratings sheet: only the latest rating per item and source")
+    sp.set_defaults(func=_lazy("export:cmd_export_xlsx"))
+
+    sp = sub.add_parser("export-delta", help="Export only what changed since this target's last run")
+    sp.add_argument("db")
+    sp.add_argument("--target", required=True, help="Name of the consumer; each keeps its own watermark")
+    sp.add_argument("--out-dir", required=True, help="Directory for the delta files and manifest.json")
+    sp.add_argument("--format", choices=["csv", "ndjson", "xlsx"], default="csv")
+    sp.add_argument("--gzip", action="store_true", help="gzip-compress CSV/NDJSON files")
+    sp.add_argument("--sources", help="Items: rating columns, comma list or 'all' (default itchio,fred)")
+    sp.add_argument("--full", action="store_true", help="Write a full snapshot and start a new chain")
+    sp.add_argument("--drop", action="store_true", help="Forget this target (stops change logging if it was the last)")
+    sp.set_defaults(func=_lazy("export:cmd_export_delta"))
+
+    for name, func, fmt in (("export-csv", "export:cmd_export_csv", "CSV"),
+                            ("export-ndjson", "export:cmd_export_ndjson", "NDJSON")):
+        sp = sub.add_parser(name, help=f"Stream items or the ratings ledger as {fmt}")
+        sp.add_argument("db")
+        sp.add_argument("--what", choices=["items", "ratings"], default="items")
+        sp.add_argument("--out", help="Output path (default stdout; .gz suffix implies --gzip)")
+        sp.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+        sp.add_argument("--media", choices=["game","book","movie","tv","music"])
+        sp.add_argument("--limit", type=int, help="Max rows")
+        sp.add_argument("--page-size", type=int,
+                        help="Write one keyset page of this many rows; the token for the next is printed to stderr")
+        sp.add_argument("--after", help="Page token from the previous --page-size run")
+        # items filters
+        sp.add_argument("--platform", help="Items: filter by platform, e.g. web")
+        sp.add_argument("--min-itchio", type=int, help="Items: only Itch.io percent >= this")
+        sp.add_argument("--sources", help="Items: rating columns, comma list or 'all' (default itchio,fred)")
+        # ratings filters
+        sp.add_argument("--source", help="Ratings: filter by source (e.g., itchio, fred)")
+        sp.add_argument("--since", help="Ratings: only ratings since this date (YYYY-MM-DD)")
+        sp.add_argument("--latest-only", action="store_true", help="Ratings: only the latest rating per item and source")
+        sp.set_defaults(func=_lazy(func))
 
     args = p.parse_args()
-    return args.func(args) 
+    prof = None
+    if args.profile or args.profile_out:
+        import tracing
+        prof = tracing.enable(slow_ms=args.slow_ms)
+    try:
+        return args.func(args)
+    finally:
+        if prof is not None:
+            report = prof.report()
+            if args.profile:
+                tracing.print_report(report)
+            if args.profile_out:
+                tracing.write_report(report, args.profile_out)
+        if args.cache_stats:
+            for ns, st in id_cache_stats().items():
+                print(f"id cache {ns:<6} hits={st['hits']} misses={st['misses']} "
+                      f"size={st['size']} hit_rate={st['hit_rate']:.1%}")
 
 if __name__=='__main__':
     main()
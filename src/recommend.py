@@ -0,0 +1,124 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from db import connect
+
+LOAD_CHUNK = 65536        # rows per fetchmany() in _load_latest
+_ROW = None if np is None else np.dtype([("item_id", np.int64), ("percent", np.float64), ("weight", np.float64)])
+
+def _load_latest(conn, *, media=None, platform=None, tag=None, unrated_by=None):
+    """
+    Latest rating per (item, source) as NumPy arrays:
+    item_ids, percent, and per-rating weight = confidence * source weight * source trust.
+    """
+    q = """
+    SELECT l.item_id, r.percent, r.confidence * s.weight * s.trust
+    FROM item_rating_latest l
+    JOIN item_rating r ON r.id = l.rating_id
+    JOIN rating_source s ON s.id = l.source_id
+    JOIN item i ON i.id = l.item_id
+    WHERE 1=1
+      AND (? IS NULL OR i.media_code = ?)
+      AND (? IS NULL OR EXISTS (
+          SELECT 1 FROM item_platform ip WHERE ip.item_id = i.id AND ip.platform_code = ?))
+      AND (? IS NULL OR EXISTS (
+          SELECT 1 FROM item_tag it JOIN tag t ON t.id = it.tag_id
+          WHERE it.item_id = i.id AND t.name = ?))
+      AND (? IS NULL OR NOT EXISTS (
+          SELECT 1 FROM item_rating_latest ul JOIN rating_source us ON us.id = ul.source_id
+          WHERE ul.item_id = i.id AND us.name = ?))
+    ORDER BY l.item_id
+    """
+    tag = tag.strip().lower() if tag else None
+    cur = conn.cursor()
+    cur.row_factory = None
+    cur.execute(q, (media, media, platform, platform, tag, tag, unrated_by, unrated_by))
+    # fetchmany chunks go straight into growing arrays: no list of every row
+    # (a Python tuple each) is ever built, so memory stays at one chunk
+    n, cap = 0, LOAD_CHUNK
+    item_ids = np.empty(cap, dtype=np.int64)
+    percent = np.empty(cap, dtype=np.float64)
+    weight = np.empty(cap, dtype=np.float64)
+    while True:
+        batch = cur.fetchmany(LOAD_CHUNK)
+        if not batch:
+            break
+        if n + len(batch) > cap:
+            cap *= 2
+            item_ids, percent, weight = (np.resize(a, cap) for a in (item_ids, percent, weight))
+        block = np.fromiter(batch, dtype=_ROW, count=len(batch))
+        item_ids[n:n + len(batch)] = block["item_id"]
+        percent[n:n + len(batch)] = block["percent"]
+        weight[n:n + len(batch)] = block["weight"]
+        n += len(batch)
+    return item_ids[:n], percent[:n], weight[:n]
+
+def blended_scores(item_ids, percent, weight, *, prior_weight=5.0):
+    """
+    One vectorized pass: per item, the weighted mean percent shrunk towards the
+    global weighted mean by prior_weight pseudo-ratings.
+    Returns (unique_item_ids, scores, rating_counts).
+    """
+    w = np.clip(weight, 0.0, None)
+    wp = w * percent
+    if len(item_ids) < 2 or np.all(item_ids[1:] >= item_ids[:-1]):
+        # rows arrive grouped by item (PK order): segment sums, no sort needed
+        starts = np.flatnonzero(np.r_[True, item_ids[1:] != item_ids[:-1]])
+        items = item_ids[starts]
+        wsum = np.add.reduceat(w, starts)
+        psum = np.add.reduceat(wp, starts)
+        counts = np.diff(np.r_[starts, len(item_ids)])
+    else:
+        items, inv = np.unique(item_ids, return_inverse=True)
+        wsum = np.bincount(inv, weights=w, minlength=len(items))
+        psum = np.bincount(inv, weights=wp, minlength=len(items))
+        counts = np.bincount(inv, minlength=len(items))
+    total = w.sum()
+    prior = wp.sum() / total if total > 0 else 50.0
+    scores = (psum + prior_weight * prior) / (wsum + prior_weight)
+    return items, scores, counts
+
+def top_k(scores, k):
+    """Indices of the k best scores, best first (argpartition, then sort only those k)."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+def recommend(conn, *, k=20, media=None, platform=None, tag=None, unrated_by=None,
+              min_sources=1, prior_weight=5.0):
+    """Returns [(item_id, title, media_code, score, n_sources)] best first."""
+    item_ids, percent, weight = _load_latest(conn, media=media, platform=platform, tag=tag,
+                                             unrated_by=unrated_by)
+    if not len(item_ids):
+        return []
+    items, scores, counts = blended_scores(item_ids, percent, weight, prior_weight=prior_weight)
+    if min_sources > 1:
+        keep = counts >= min_sources
+        items, scores, counts = items[keep], scores[keep], counts[keep]
+    best = top_k(scores, k)
+    ids = [int(i) for i in items[best]]
+    meta = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        for r in conn.execute(f"SELECT id, title, media_code FROM item WHERE id IN ({marks})", chunk):
+            meta[r["id"]] = (r["title"], r["media_code"])
+    return [(iid, *meta[iid], float(scores[j]), int(counts[j])) for iid, j in zip(ids, best)]
+
+def cmd_recommend(args):
+    if np is None:
+        raise SystemExit("numpy not installed. Run:  pip install numpy")
+    conn = connect(args.db)
+    rows = recommend(conn, k=args.top, media=args.media, platform=args.platform, tag=args.tag,
+                     unrated_by=args.unrated_by, min_sources=args.min_sources,
+                     prior_weight=args.prior_weight)
+    if not rows:
+        print("No rated items match.")
+        return
+    width = min(60, max(len(r[1]) for r in rows))
+    for rank, (iid, title, media, score, n) in enumerate(rows, start=1):
+        print(f"{rank:>3}. {score:6.2f}  {title[:width]:<{width}}  {media:<6} sources={n}  id={iid}")
@@ -0,0 +1,100 @@
+import re
+import sqlite3
+import sys
+import time
+
+from db import connect, sync_item_fts
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def fts_query(text: str, *, prefix=True) -> str:
+    """
+    Plain user text -> FTS5 query: every word quoted (so -, :, AND, etc. are
+    literal) and implicitly AND-ed; the last word also matches as a prefix.
+    """
+    words = _TOKEN.findall(text)
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    if prefix:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+def search(conn, text, *, media=None, platform=None, limit=20, blend=0.0, raw=False):
+    """
+    Returns [(item_id, title, media_code, score, percent|None)] best first.
+    Relevance is bm25 (title 10 / description 1 / tags 4). With blend > 0 a
+    wider candidate set is re-ranked by
+      (1 - blend) * relevance (scaled to 0..1 over the candidates) + blend * percent / 100
+    where percent is the weighted mean of the item's latest ratings (50 if unrated).
+    """
+    query = text if raw else fts_query(text)
+    if not query:
+        return []
+    n_candidates = max(limit * 5, 100) if blend > 0 else limit
+    q = """
+    WITH hits AS (
+      SELECT f.rowid AS id, f.rank AS rank
+      FROM item_fts f
+      JOIN item i ON i.id = f.rowid
+      WHERE item_fts MATCH ?
+        AND (? IS NULL OR i.media_code = ?)
+        AND (? IS NULL OR EXISTS (
+            SELECT 1 FROM item_platform ip WHERE ip.item_id = i.id AND ip.platform_code = ?))
+      ORDER BY f.rank
+      LIMIT ?
+    )
+    SELECT h.id, i.title, i.media_code, h.rank,
+           (SELECT SUM(r.percent * r.confidence * s.weight * s.trust)
+                   / NULLIF(SUM(r.confidence * s.weight * s.trust), 0)
+            FROM item_rating_latest l
+            JOIN item_rating r ON r.id = l.rating_id
+            JOIN rating_source s ON s.id = l.source_id
+            WHERE l.item_id = h.id) AS percent
+    FROM hits h
+    JOIN item i ON i.id = h.id
+    ORDER BY h.rank
+    """
+    rows = conn.execute(q, (query, media, media, platform, platform, n_candidates)).fetchall()
+    if not rows:
+        return []
+    # rank is bm25: negative, lower is better
+    best = max(-r["rank"] for r in rows) or 1.0
+    out = []
+    for r in rows:
+        rel = -r["rank"] / best
+        pct = r["percent"]
+        score = rel if blend <= 0 else (1 - blend) * rel + blend * (50.0 if pct is None else pct) / 100
+        out.append((r["id"], r["title"], r["media_code"], score, pct))
+    if blend > 0:
+        out.sort(key=lambda t: -t[3])
+    return out[:limit]
+
+def cmd_search(args):
+    # writers drain item_fts_pending; a search only reads unless --sync
+    conn = connect(args.db, readonly=not args.sync)
+    t0 = time.perf_counter()
+    try:
+        synced = sync_item_fts(conn) if args.sync else 0
+        stale = 0 if args.sync else conn.execute("SELECT COUNT(*) FROM item_fts_pending").fetchone()[0]
+        t1 = time.perf_counter()
+        rows = search(conn, args.query, media=args.media, platform=args.platform,
+                      limit=args.top, blend=args.blend, raw=args.raw)
+    except sqlite3.OperationalError as e:
+        if "item_fts" in str(e):  # pre-migration database
+            raise SystemExit("No search index. Run:  python src/recommend-it.py migrate <db>")
+        raise SystemExit(f"Bad search query: {e}")
+    if synced:
+        print(f"Indexed {synced} changed item(s) in {(t1 - t0) * 1000:.0f} ms")
+    if stale:
+        print(f"Warning: {stale} changed item(s) are not indexed yet; results may be stale "
+              f"(pass --sync to index them)", file=sys.stderr)
+    ms = (time.perf_counter() - t1) * 1000
+    if not rows:
+        print(f"No matches ({ms:.1f} ms).")
+        return
+    width = min(60, max(len(r[1]) for r in rows))
+    for rank, (iid, title, media, score, pct) in enumerate(rows, start=1):
+        pct_s = "   -" if pct is None else f"{pct:4.0f}"
+        print(f"{rank:>3}. {score:5.3f}  {title[:width]:<{width}}  {media:<6} {pct_s}%  id={iid}")
+    print(f"{len(rows)} result(s) in {ms:.1f} ms")
@@ -0,0 +1,434 @@
+"""
+`serve`: a long-running local HTTP/JSON server in front of one database.
+
+Reads go through a small pool of read-only (mode=ro) connections, so each
+request skips connect() and the pragmas. Under WAL they never wait for the
+writer. All writes go to one writer thread. It takes every mutation queued
+while the previous commit ran (up to --max-group), runs each inside its own
+SAVEPOINT so a failing request only undoes itself, and commits the group
+once. A request is answered only after its group has committed.
+
+    GET  /items?media=&platform=&min_itchio=&sources=&limit=
+    GET  /ratings?media=&source=&since=&latest_only=1&limit=
+                  either also takes page_size= and after=<token>: a keyset page
+                  plus "next" (the token for the following page, or null)
+    GET  /stats                      request latency percentiles, writer groups
+    POST /rate    {"item", "media", "source", "stars" | "up", "votes", "notes"}
+    POST /import  {"kind": "itchio", "records": [...], "web_only", "free_only"}
+                  {"kind": "ratings", "rows": [{"item", "media", "source", "scale", "value", ...}]}
+
+Every response has an X-Elapsed-Ms header.
+"""
+import json
+import queue
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import db
+from db import (connect, _fetch_items_for_export, _fetch_ratings_ledger, _fetch_items_page,
+                _fetch_ratings_page, _sync_item_fts)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10000
+MAX_BODY = 64 << 20          # bytes
+LATENCY_SAMPLES = 4096       # recent requests kept per route for percentiles
+
+# ---------- Read pool ----------
+class ReaderPool:
+    def __init__(self, db_path, size):
+        self.size = size
+        self._free = queue.Queue()
+        for _ in range(size):
+            self._free.put(connect(db_path, readonly=True, check_same_thread=False))
+
+    @contextmanager
+    def connection(self):
+        conn = self._free.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:      # a failed read must not pin its snapshot
+                conn.rollback()
+            self._free.put(conn)
+
+    def close(self):
+        while not self._free.empty():
+            self._free.get_nowait().close()
+
+# ---------- Single writer ----------
+class _GroupCommit:
+    """
+    Writer connection mixin. While a group is open, the commit()/rollback()
+    calls made by the ratings/itchio helpers do nothing, and the writer
+    decides for the whole group.
+    """
+    in_group = False
+
+    def commit(self):
+        if not self.in_group:
+            super().commit()
+
+    def rollback(self):
+        if not self.in_group:
+            super().rollback()
+
+    def commit_group(self):
+        super().commit()
+
+    def rollback_group(self):
+        super().rollback()
+
+class Writer(threading.Thread):
+    def __init__(self, db_path, *, max_group=256, group_ms=0.0, max_queue=10000):
+        super().__init__(name="writer", daemon=True)
+        self.db_path = db_path
+        self.max_group = max_group
+        self.group_wait = group_ms / 1000.0
+        self.jobs = queue.Queue(maxsize=max_queue)
+        self.lock = threading.Lock()
+        self.groups = self.grouped = self.mutations = self.failed = self.largest = 0
+        self.commit_secs = 0.0
+
+    def submit(self, fn, *args, timeout=5.0):
+        """Queues fn(conn, *args); the Future resolves once its group has committed."""
+        fut = Future()
+        self.jobs.put((fn, args, fut), timeout=timeout)
+        return fut
+
+    def stop(self):
+        self.jobs.put(None)              # queued mutations still run first
+        self.join()
+
+    def run(self):
+        factory = type("WriterConnection", (_GroupCommit, db.connection_factory), {})
+        conn = connect(self.db_path, factory=factory)
+        stopping = False
+        while not stopping:
+            job = self.jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.perf_counter() + self.group_wait
+            while len(batch) < self.max_group:
+                try:
+                    wait = deadline - time.perf_counter()
+                    job = self.jobs.get(timeout=wait) if wait > 0 else self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            self._apply(conn, batch)
+        conn.close()
+
+    def _apply(self, conn, batch):
+        done, errors = [], 0
+        conn.in_group = True
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, fut in batch:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT mutation")
+                try:
+                    result = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO mutation")
+                    conn.execute("RELEASE mutation")
+                    conn.ids.invalidate()        # ids created inside the savepoint are gone
+                    fut.set_exception(e)
+                    errors += 1
+                    continue
+                conn.execute("RELEASE mutation")
+                done.append((fut, result))
+            _sync_item_fts(conn)
+            t0 = time.perf_counter()
+            conn.commit_group()
+            dt = time.perf_counter() - t0
+        except Exception as e:
+            # the group itself failed (disk full, lock timeout...): nobody's write landed
+            if conn.in_transaction:
+                conn.rollback_group()
+            conn.ids.invalidate()
+            for _, _, fut in batch:
+                if fut.running():
+                    fut.set_exception(e)
+            with self.lock:
+                self.failed += len(batch)
+            return
+        finally:
+            conn.in_group = False
+        for fut, result in done:
+            fut.set_result(result)
+        with self.lock:
+            self.groups += 1
+            self.grouped += len(batch)
+            self.mutations += len(done)         # committed writes only
+            self.failed += errors
+            self.largest = max(self.largest, len(batch))
+            self.commit_secs += dt
+
+    def stats(self):
+        with self.lock:
+            return {"groups": self.groups, "mutations": self.mutations, "failed": self.failed,
+                    "avg_group": round(self.grouped / self.groups, 2) if self.groups else 0.0,
+                    "largest_group": self.largest, "queued": self.jobs.qsize(),
+                    "commit_ms_avg": round(self.commit_secs / self.groups * 1000, 3) if self.groups else 0.0}
+
+# ---------- Latency ----------
+class LatencyStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}     # route -> [count, errors, total secs, max secs, deque of recent secs]
+
+    def record(self, route, secs, status):
+        with self.lock:
+            st = self.routes.get(route)
+            if st is None:
+                st = self.routes[route] = [0, 0, 0.0, 0.0, deque(maxlen=LATENCY_SAMPLES)]
+            st[0] += 1
+            st[1] += status >= 400
+            st[2] += secs
+            st[3] = max(st[3], secs)
+            st[4].append(secs)
+
+    def snapshot(self):
+        with self.lock:
+            items = [(route, st[:4], sorted(st[4])) for route, st in self.routes.items()]
+        out = {}
+        for route, (count, errors, total, worst), recent in items:
+            pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 3)
+            out[route] = {"count": count, "errors": errors, "mean_ms": round(total / count * 1000, 3),
+                          "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+                          "max_ms": round(worst * 1000, 3)}
+        return out
+
+# ---------- Routes ----------
+def _one(q, name, cast=str):
+    values = q.get(name)
+    if not values or values[-1] == "":
+        return None
+    try:
+        return cast(values[-1])
+    except ValueError:
+        raise ValueError(f"bad value for {name}: {values[-1]!r}")
+
+def _limit(q):
+    limit = _one(q, "limit", int)
+    return DEFAULT_LIMIT if limit is None else max(0, min(limit, MAX_LIMIT))
+
+def _page(q):
+    """(page_size, after) when the request asks for a keyset page, else None."""
+    after = _one(q, "after")
+    size = _one(q, "page_size", int)
+    if size is None and after is None:
+        return None
+    return (DEFAULT_LIMIT if size is None else size), after
+
+def _get_items(app, q, _body):
+    sources = _one(q, "sources")
+    if sources and sources != "all":
+        sources = [s.strip() for s in sources.split(",") if s.strip()]
+    filters = dict(media=_one(q, "media"), platform=_one(q, "platform"),
+                   min_itchio=_one(q, "min_itchio", int), sources=sources)
+    page = _page(q)
+    with app.readers.connection() as conn:
+        if page:
+            rows, token = _fetch_items_page(conn, page_size=page[0], after=page[1], **filters)
+            return 200, {"items": rows, "next": token}
+        rows = list(_fetch_items_for_export(conn, limit=_limit(q), **filters))
+    return 200, {"items": rows}
+
+def _get_ratings(app, q, _body):
+    latest = (_one(q, "latest_only") or "").lower() in ("1", "true", "yes")
+    filters = dict(media=_one(q, "media"), source=_one(q, "source"), since=_one(q, "since"),
+                   latest_only=latest)
+    page = _page(q)
+    with app.readers.connection() as conn:
+        if page:
+            rows, token = _fetch_ratings_page(conn, page_size=page[0], after=page[1], **filters)
+            return 200, {"ratings": rows, "next": token}
+        rows = list(_fetch_ratings_ledger(conn, limit=_limit(q), **filters))
+    return 200, {"ratings": rows}
+
+def _get_stats(app, _q, _body):
+    return 200, {"uptime_secs": round(time.time() - app.started, 1), "readers": app.readers.size,
+                 "requests": app.latency.snapshot(), "writer": app.writer.stats(),
+                 "id_cache": db.id_cache_stats()}
+
+def _require(body, *keys):
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    missing = [k for k in keys if body.get(k) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+def _rate(conn, body):
+    from ratings import add_rating_stars5, add_rating_thumb
+    media = str(body["media"])
+    if conn.execute("SELECT 1 FROM media_type WHERE code = ?", (media,)).fetchone() is None:
+        raise ValueError(f"media {media!r} not found")
+    common = dict(item_title=str(body["item"]), media_code=media, source_name=str(body["source"]),
+                  votes=body.get("votes"), notes=body.get("notes"))
+    if body.get("stars") is not None:
+        item_id, percent, conf = add_rating_stars5(conn, stars=float(body["stars"]), **common)
+    else:
+        up = body["up"]
+        if isinstance(up, str):
+            up = up.strip().lower() in ("1", "true", "yes", "up")
+        item_id, percent, conf = add_rating_thumb(conn, up=bool(up), **common)
+    return {"item_id": item_id, "percent": percent, "confidence": conf}
+
+def _import(conn, body):
+    kind = body.get("kind", "itchio")
+    if kind == "itchio":
+        from itchio import bulk_import_itchio_records
+        imported, _ = bulk_import_itchio_records(conn, body["records"], web_only=bool(body.get("web_only")),
+                                                 free_only=bool(body.get("free_only")))
+        return {"imported": imported}
+    from ratings import import_ratings
+    imported, errors, _ = import_ratings(conn, body["rows"], batch_size=max(1, len(body["rows"])))
+    return {"imported": imported, "errors": [{"row": n, "error": msg} for n, msg in errors]}
+
+def _write(app, fn, body):
+    try:
+        fut = app.writer.submit(fn, body)
+    except queue.Full:
+        return 503, {"error": "write queue full"}
+    try:
+        return 200, fut.result(timeout=app.write_timeout)
+    except FutureTimeout:
+        return 503, {"error": "write not committed in time (still queued or running)"}
+
+def _post_rate(app, _q, body):
+    _require(body, "item", "media", "source")
+    if body.get("stars") is None and body.get("up") is None:
+        raise ValueError("give stars (0-5) or up (true/false)")
+    return _write(app, _rate, body)
+
+def _post_import(app, _q, body):
+    _require(body, "kind")
+    if body["kind"] not in ("itchio", "ratings"):
+        raise ValueError("kind must be itchio or ratings")
+    key = "records" if body["kind"] == "itchio" else "rows"
+    if not isinstance(body.get(key), list):
+        raise ValueError(f"{key} must be a list")
+    return _write(app, _import, body)
+
+ROUTES = {
+    ("GET", "/items"): _get_items,
+    ("GET", "/ratings"): _get_ratings,
+    ("GET", "/stats"): _get_stats,
+    ("POST", "/rate"): _post_rate,
+    ("POST", "/import"): _post_import,
+}
+
+# ---------- HTTP ----------
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"     # keep-alive: dashboards reuse the socket
+    server_version = "recommend-it"
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        app = self.server.app
+        t0 = time.perf_counter()
+        url = urlsplit(self.path)
+        route = f"{method} {url.path}"
+        handler = ROUTES.get((method, url.path))
+        try:
+            body = self._body() if method == "POST" else None
+            if handler is None:
+                status, payload, route = 404, {"error": f"no route {route}"}, "unknown"
+            else:
+                status, payload = handler(app, parse_qs(url.query), body)
+        except (ValueError, TypeError, KeyError, sqlite3.IntegrityError) as e:
+            # a constraint the request broke (e.g. an unknown code) is the client's error
+            status, payload = 400, {"error": str(e) or type(e).__name__}
+        except Exception as e:
+            traceback.print_exc()
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        data = json.dumps(payload, default=str).encode("utf-8")
+        elapsed = time.perf_counter() - t0
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Elapsed-Ms", f"{elapsed * 1000:.3f}")
+        self.end_headers()
+        self.wfile.write(data)
+        app.latency.record(route, elapsed, status)
+        if app.verbose:
+            print(f"{method} {self.path} {status} {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        if n > MAX_BODY:
+            raise ValueError(f"body over {MAX_BODY >> 20} MB")
+        raw = self.rfile.read(n) if n else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError as e:
+            raise ValueError(f"invalid JSON body: {e}")
+
+    def log_message(self, fmt, *args):
+        pass                            # _dispatch logs with latency when --verbose
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128                # listen backlog; the stdlib's 5 resets bursts of clients
+
+class _App:
+    def __init__(self, readers, writer, *, write_timeout, verbose):
+        self.readers, self.writer = readers, writer
+        self.latency = LatencyStats()
+        self.write_timeout = write_timeout
+        self.verbose = verbose
+        self.started = time.time()
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def cmd_serve(args):
+    if not (db.STORAGE_DIR / args.db).exists():
+        raise SystemExit(f"No database at {args.db}. Run:  python src/recommend-it.py init-db {args.db}")
+    connect(args.db).close()               # puts the file in WAL mode before the read-only opens
+    httpd = _Server((args.host, args.port), _Handler, bind_and_activate=False)
+    httpd.request_queue_size = args.backlog
+    httpd.server_bind()
+    httpd.server_activate()
+    writer = Writer(args.db, max_group=args.max_group, group_ms=args.group_ms)
+    writer.start()
+    app = _App(ReaderPool(args.db, args.readers), writer, write_timeout=args.write_timeout,
+               verbose=args.verbose)
+    httpd.app = app
+    signal.signal(signal.SIGTERM, _interrupt)
+    print(f"serving {args.db} on http://{args.host}:{httpd.server_port} "
+          f"({args.readers} readers, 1 writer); Ctrl-C to stop", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        writer.stop()
+        app.readers.close()
+        w = writer.stats()
+        print(f"\nstopped: {w['mutations']} write(s), {w['failed']} failed, in {w['groups']} commit(s) "
+              f"(avg group {w['avg_group']})", file=sys.stderr)
+        for route, st in sorted(app.latency.snapshot().items()):
+            print(f"  {route:<14} n={st['count']:<7} p50={st['p50_ms']:.1f} ms p95={st['p95_ms']:.1f} ms "
+                  f"p99={st['p99_ms']:.1f} ms max={st['max_ms']:.1f} ms", file=sys.stderr)
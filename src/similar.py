@@ -0,0 +1,205 @@
+import sqlite3
+import time
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+from db import connect
+
+BLOCK_CELLS = 1 << 24      # dense similarity cells per block (~64 MB as float32)
+MIN_SCORE = 1e-6           # neighbours must share at least something
+FULL_REBUILD_SHARE = 0.25  # refresh everything once this share of items is queued
+
+# ---------- Feature matrix ----------
+def _l2_rows(X):
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sparse.diags(inv.astype(np.float32)) @ X
+
+def _sparse_rows(ids, item_col, feat_col, values=None):
+    """(item id, feature key[, value]) pairs -> CSR over ids x distinct features."""
+    rows = np.searchsorted(ids, item_col)
+    feats, cols = np.unique(feat_col, return_inverse=True)
+    data = np.ones(len(rows), dtype=np.float32) if values is None else values.astype(np.float32)
+    return sparse.csr_matrix((data, (rows, cols)), shape=(len(ids), max(len(feats), 1)))
+
+def _feature_matrix(conn, *, rating_weight=0.0):
+    """
+    Returns (item ids sorted, X) where X rows are L2-normalized TF-IDF tag
+    vectors, optionally concatenated with centred user-source ratings so that
+    X @ X.T = (1 - w) * tag cosine + w * rating cosine.
+    """
+    cur = conn.cursor()
+    cur.row_factory = None
+    ids = np.array([r[0] for r in cur.execute("SELECT id FROM item ORDER BY id")], dtype=np.int64)
+    pairs = np.array(cur.execute("SELECT item_id, tag_id FROM item_tag").fetchall(), dtype=np.int64).reshape(-1, 2)
+    tags = _sparse_rows(ids, pairs[:, 0], pairs[:, 1])
+    df = np.asarray((tags > 0).sum(axis=0)).ravel()
+    idf = (np.log((1.0 + len(ids)) / (1.0 + df)) + 1.0).astype(np.float32)
+    X = _l2_rows(tags @ sparse.diags(idf))
+    if rating_weight > 0:
+        q = """
+        SELECT l.item_id, l.source_id, r.percent
+        FROM item_rating_latest l
+        JOIN item_rating r ON r.id = l.rating_id
+        JOIN rating_source s ON s.id = l.source_id
+        WHERE s.kind = 'user' AND r.percent IS NOT NULL
+        """
+        rated = np.array(cur.execute(q).fetchall(), dtype=np.float64).reshape(-1, 3)
+        R = _l2_rows(_sparse_rows(ids, rated[:, 0].astype(np.int64), rated[:, 1].astype(np.int64),
+                                  (rated[:, 2] - 50.0) / 50.0))
+        X = sparse.hstack([X * np.float32(np.sqrt(1.0 - rating_weight)),
+                           R * np.float32(np.sqrt(rating_weight))], format="csr")
+    return ids, X.tocsr()
+
+# ---------- Top-N ----------
+def _blocks(rows, n):
+    step = max(1, BLOCK_CELLS // max(n, 1))
+    for start in range(0, len(rows), step):
+        yield rows[start:start + step]
+
+def _top_neighbors(X, XT, ids, rows, top_n):
+    """Yields (item_id, rank, neighbor_id, score) for each row index in rows."""
+    n = len(ids)
+    k = min(top_n, n - 1)
+    if k <= 0:
+        return
+    for rb in _blocks(rows, n):
+        S = (X[rb] @ XT).toarray()
+        S[np.arange(len(rb)), rb] = -np.inf          # never your own neighbour
+        idx = np.argpartition(-S, k - 1, axis=1)[:, :k]
+        vals = np.take_along_axis(S, idx, axis=1)
+        order = np.argsort(-vals, axis=1, kind="stable")
+        idx = np.take_along_axis(idx, order, axis=1)
+        vals = np.take_along_axis(vals, order, axis=1)
+        for r, nbrs, scores in zip(rb, idx, vals):
+            item_id = int(ids[r])
+            keep = scores > MIN_SCORE
+            for rank, (j, sc) in enumerate(zip(nbrs[keep], scores[keep]), start=1):
+                yield item_id, rank, int(ids[j]), round(float(sc), 6)
+
+def _affected_rows(conn, X, XT, ids, pending):
+    """
+    Rows whose neighbour list may change after the pending items changed:
+    the pending items themselves, items listing one of them, and items for
+    which a pending item now beats their current N-th neighbour.
+    """
+    n = len(ids)
+    pos = np.searchsorted(ids, pending)
+    alive = pos[(pos < n) & (ids[np.minimum(pos, n - 1)] == pending)]
+    affected = set(alive.tolist())
+    plist = pending.tolist()
+    for start in range(0, len(plist), 500):
+        chunk = plist[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        listing = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT item_id FROM item_similar WHERE neighbor_id IN ({marks})", chunk)]
+        lpos = np.searchsorted(ids, listing)
+        affected.update(int(p) for p, i in zip(lpos, listing) if p < n and ids[p] == i)
+    if len(alive):
+        top_n = conn.execute("SELECT top_n FROM item_similar_build WHERE id = 1").fetchone()[0]
+        thr = np.zeros(n, dtype=np.float32)
+        for item_id, cnt, lowest in conn.execute(
+                "SELECT item_id, COUNT(*), MIN(score) FROM item_similar GROUP BY item_id"):
+            p = np.searchsorted(ids, item_id)
+            if cnt >= top_n and p < n and ids[p] == item_id:
+                thr[p] = lowest
+        best = np.zeros(n, dtype=np.float32)
+        for rb in _blocks(alive, n):
+            best = np.maximum(best, (X[rb] @ XT).max(axis=0).toarray().ravel())
+        affected.update(np.flatnonzero(best > np.maximum(thr, MIN_SCORE)).tolist())
+    return np.array(sorted(affected), dtype=np.int64)
+
+def build_similar(conn, *, top_n=20, rating_weight=0.0, full=False):
+    """
+    Brings item_similar up to date. A full build recomputes every item; an
+    incremental one only the rows touched since the last build (queued in
+    item_similar_pending by triggers). Note that tag IDF weights drift as the
+    catalogue grows: run a full build now and then.
+    Returns (mode, items recomputed, neighbour rows written).
+    """
+    ids, X = _feature_matrix(conn, rating_weight=rating_weight)
+    XT = X.T.tocsr()
+    state = conn.execute("SELECT top_n, rating_weight FROM item_similar_build WHERE id = 1").fetchone()
+    pending = np.array(sorted(r[0] for r in conn.execute("SELECT item_id FROM item_similar_pending")),
+                       dtype=np.int64)
+    if (full or state is None or state["top_n"] != top_n or state["rating_weight"] != rating_weight
+            or len(pending) > FULL_REBUILD_SHARE * len(ids)):
+        mode, rows = "full", np.arange(len(ids))
+        conn.execute("DELETE FROM item_similar")
+    else:
+        mode, rows = "incremental", _affected_rows(conn, X, XT, ids, pending)
+        stale = sorted(set(pending.tolist()) | set(ids[rows].tolist()))
+        for start in range(0, len(stale), 500):
+            chunk = stale[start:start + 500]
+            conn.execute(f"DELETE FROM item_similar WHERE item_id IN ({','.join('?' * len(chunk))})", chunk)
+    written = 0
+    batch = []
+    for row in _top_neighbors(X, XT, ids, rows, top_n):
+        batch.append(row)
+        if len(batch) >= 10000:
+            conn.executemany("INSERT INTO item_similar(item_id, rank, neighbor_id, score) VALUES (?,?,?,?)", batch)
+            written += len(batch)
+            batch.clear()
+    conn.executemany("INSERT INTO item_similar(item_id, rank, neighbor_id, score) VALUES (?,?,?,?)", batch)
+    written += len(batch)
+    conn.execute("DELETE FROM item_similar_pending")
+    conn.execute(
+        "INSERT OR REPLACE INTO item_similar_build(id, built_at, top_n, rating_weight, n_items) "
+        "VALUES (1, datetime('now'), ?, ?, ?)", (top_n, rating_weight, len(ids)))
+    conn.commit()
+    return mode, len(rows), written
+
+# ---------- Queries ----------
+def similar_items(conn, item_id, *, k=10):
+    """[(neighbor_id, title, media_code, score)] best first, from item_similar."""
+    return [(r["neighbor_id"], r["title"], r["media_code"], r["score"]) for r in conn.execute("""
+        SELECT s.neighbor_id, i.title, i.media_code, s.score
+        FROM item_similar s
+        JOIN item i ON i.id = s.neighbor_id
+        WHERE s.item_id = ?
+        ORDER BY s.rank
+        LIMIT ?""", (item_id, k))]
+
+def cmd_build_similar(args):
+    if np is None:
+        raise SystemExit("numpy/scipy not installed. Run:  pip install numpy scipy")
+    if not 0.0 <= args.ratings < 1.0:
+        raise SystemExit("--ratings must be in [0, 1)")
+    conn = connect(args.db)
+    t0 = time.perf_counter()
+    try:
+        mode, n, written = build_similar(conn, top_n=args.top_n, rating_weight=args.ratings, full=args.full)
+    except sqlite3.OperationalError as e:
+        if "item_similar" in str(e):  # pre-migration database
+            raise SystemExit("No item_similar table. Run:  python src/recommend-it.py migrate <db>")
+        raise
+    print(f"item_similar {mode}: {n} item(s) recomputed, {written} neighbour rows "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+def cmd_similar(args):
+    conn = connect(args.db)
+    if args.id is not None:
+        row = conn.execute("SELECT id, title, media_code FROM item WHERE id = ?", (args.id,)).fetchone()
+    else:
+        row = conn.execute(
+            "SELECT id, title, media_code FROM item WHERE title = ? AND (? IS NULL OR media_code = ?) "
+            "ORDER BY id LIMIT 1", (args.item, args.media, args.media)).fetchone()
+    if row is None:
+        raise SystemExit("item not found")
+    rows = similar_items(conn, row["id"], k=args.top)
+    if not rows:
+        built = conn.execute("SELECT 1 FROM item_similar_build").fetchone()
+        print("No similar items." if built else
+              "No similarity index. Run:  python src/recommend-it.py build-similar <db>")
+        return
+    pending = conn.execute("SELECT COUNT(*) FROM item_similar_pending").fetchone()[0]
+    print(f"Like {row['title']} ({row['media_code']}, id={row['id']}):")
+    width = min(60, max(len(r[1]) for r in rows))
+    for rank, (iid, title, media, score) in enumerate(rows, start=1):
+        print(f"{rank:>3}. {score:5.3f}  {title[:width]:<{width}}  {media:<6} id={iid}")
+    if pending:
+        print(f"({pending} item(s) changed since the last build-similar)")
@@ -0,0 +1,323 @@
+"""
+Opt-in SQL and phase profiling (the `--profile` / `--profile-out` CLI flags).
+
+enable() makes db.connect() hand out ProfiledConnection objects, which time
+every statement they run (execute plus row fetching, keyed by normalized SQL)
+and count commits. set_trace_callback counts the statements triggers run, and
+set_progress_handler counts VM work per statement. phase() / timed() time
+the pipeline stages (parse, resolve, write, fetch, serialize); they cost
+nothing while profiling is off.
+
+Everything is aggregated in a few dicts keyed by statement, so the overhead
+is a couple of perf_counter() calls per statement and per fetched row.
+"""
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+import db
+
+_active = None
+_NULL = nullcontext()
+_SPACES = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_NORM_CACHE_MAX = 4096
+PROGRESS_OPS = 1000        # progress handler granularity (VM instructions)
+
+def normalize_sql(sql: str) -> str:
+    """Whitespace collapsed, IN (?,?,...) lists folded, so chunked queries aggregate."""
+    return _IN_LIST.sub("(?...)", _SPACES.sub(" ", sql).strip())
+
+class Profiler:
+    def __init__(self, *, slow_ms=250.0, explain=True):
+        self.slow = slow_ms / 1000.0
+        self.explain = explain
+        self.started = time.perf_counter()
+        # normalized sql -> [calls, rows, exec secs, fetch secs, max secs, vm ticks]
+        self.stmts = {}
+        self.triggers = {}        # trigger name -> statements run
+        self.commits = 0
+        self.commit_secs = 0.0
+        self.phases = {}          # name -> [calls, exclusive secs, inclusive secs]
+        self.plans = {}           # normalized sql -> EXPLAIN QUERY PLAN lines
+        self._norm = {}
+        self._local = threading.local()
+
+    # ---- statements ----
+    def _key(self, sql):
+        key = self._norm.get(sql)
+        if key is None:
+            key = normalize_sql(sql)
+            if len(self._norm) < _NORM_CACHE_MAX:
+                self._norm[sql] = key
+        return key
+
+    def _stat(self, key):
+        st = self.stmts.get(key)
+        if st is None:
+            st = self.stmts[key] = [0, 0, 0.0, 0.0, 0.0, 0]
+        return st
+
+    def _trace(self, sql):
+        # only trigger bodies are counted here; top-level statements are timed by the cursor
+        if sql.startswith("-- TRIGGER "):
+            name = sql[11:].strip()
+            self.triggers[name] = self.triggers.get(name, 0) + 1
+
+    def _tick(self):
+        st = getattr(self._local, "current", None)
+        if st is not None:
+            st[5] += 1
+        return 0
+
+    def _maybe_explain(self, conn, key, sql, params, secs):
+        if secs < self.slow or not self.explain or key in self.plans:
+            return
+        head = sql.lstrip()[:7].upper()
+        if not head.startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")):
+            return
+        try:
+            cur = sqlite3.Cursor(conn)
+            cur.row_factory = None
+            rows = cur.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            self.plans[key] = [f"{'  ' * _depth(rows, r)}{r[-1]}" for r in rows]
+        except sqlite3.Error as e:
+            self.plans[key] = [f"(no plan: {e})"]
+
+    # ---- phases ----
+    def _stack(self):
+        stack = getattr(self._local, "phases", None)
+        if stack is None:
+            stack = self._local.phases = []
+        return stack
+
+    def push(self, name):
+        self._stack().append([name, time.perf_counter(), 0.0])
+
+    def pop(self):
+        stack = self._stack()
+        name, start, children = stack.pop()
+        dt = time.perf_counter() - start
+        ph = self.phases.get(name)
+        if ph is None:
+            ph = self.phases[name] = [0, 0.0, 0.0]
+        ph[0] += 1
+        ph[1] += dt - children
+        ph[2] += dt
+        if stack:
+            stack[-1][2] += dt
+
+    # ---- report ----
+    def report(self):
+        stmts = sorted(self.stmts.items(), key=lambda kv: -(kv[1][2] + kv[1][3]))
+        return {
+            "wall_secs": round(time.perf_counter() - self.started, 6),
+            "commits": self.commits,
+            "commit_secs": round(self.commit_secs, 6),
+            "phases": {name: {"calls": c, "secs": round(ex, 6), "inclusive_secs": round(inc, 6)}
+                       for name, (c, ex, inc) in sorted(self.phases.items(), key=lambda kv: -kv[1][1])},
+            "statements": [{"sql": sql, "calls": c, "rows": rows, "exec_secs": round(ex, 6),
+                            "fetch_secs": round(fe, 6), "max_ms": round(mx * 1000, 3),
+                            "vm_kops": ticks * PROGRESS_OPS // 1000, "plan": self.plans.get(sql)}
+                           for sql, (c, rows, ex, fe, mx, ticks) in stmts],
+            "triggers": dict(sorted(self.triggers.items(), key=lambda kv: -kv[1])),
+            "id_cache": db.id_cache_stats(),
+        }
+
+def _depth(rows, row):
+    # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail)
+    parents = {r[0]: r[1] for r in rows}
+    depth, p = 0, row[1]
+    while p in parents:
+        depth, p = depth + 1, parents[p]
+    return depth
+
+# ---------- Connection / cursor ----------
+class ProfiledCursor(sqlite3.Cursor):
+    _key = _stat = None
+    _sql = None
+    _params = ()
+    _spent = 0.0
+
+    def _begin(self, sql, params):
+        prof = _active
+        self._key = prof._key(sql)
+        self._stat = prof._stat(self._key)
+        self._params = params
+        prof._local.current = self._stat
+
+    def _done(self, dt_exec):
+        st = self._stat
+        st[0] += 1
+        st[2] += dt_exec
+        self._spent = dt_exec
+        if dt_exec > st[4]:
+            st[4] = dt_exec
+
+    def _fetched(self, dt, n, exhausted=False):
+        st = self._stat
+        if st is None:
+            return
+        st[1] += n
+        st[3] += dt
+        self._spent += dt
+        if self._spent > st[4]:
+            st[4] = self._spent
+        if exhausted:
+            _active._maybe_explain(self.connection, self._key, self._sql, self._params, self._spent)
+
+    def execute(self, sql, params=()):
+        self._begin(sql, params)
+        self._sql = sql
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            dt = time.perf_counter() - t0
+            self._done(dt)
+            if self.description is None:          # writes finish inside execute()
+                self._stat[1] += max(self.rowcount, 0)
+                _active._maybe_explain(self.connection, self._key, sql, params, dt)
+
+    def executemany(self, sql, seq):
+        self._begin(sql, ())
+        self._sql = sql
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            self._done(time.perf_counter() - t0)
+            self._stat[1] += max(self.rowcount, 0)
+
+    def __next__(self):
+        t0 = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(time.perf_counter() - t0, 0, exhausted=True)
+            raise
+        self._fetched(time.perf_counter() - t0, 1)
+        return row
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - t0, row is not None, exhausted=row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(time.perf_counter() - t0, len(rows), exhausted=not rows)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - t0, len(rows), exhausted=True)
+        return rows
+
+class ProfiledConnection(db.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_active._trace)
+        self.set_progress_handler(_active._tick, PROGRESS_OPS)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        super().commit()
+        _active.commits += 1
+        _active.commit_secs += time.perf_counter() - t0
+
+# ---------- Public API ----------
+def enable(*, slow_ms=250.0, explain=True):
+    """Starts profiling: connections opened from now on are instrumented."""
+    global _active
+    _active = Profiler(slow_ms=slow_ms, explain=explain)
+    db.connection_factory = ProfiledConnection
+    return _active
+
+def active():
+    return _active
+
+def phase(name):
+    """Context manager timing a pipeline stage (exclusive of nested phases)."""
+    if _active is None:
+        return _NULL
+    return _Phase(name)
+
+class _Phase:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _active.push(self.name)
+
+    def __exit__(self, *exc):
+        _active.pop()
+
+def timed(iterable, name):
+    """Iterates iterable, charging the time spent producing items to phase name."""
+    if _active is None:
+        return iterable
+    return _timed(iter(iterable), name)
+
+def _timed(it, name):
+    prof = _active
+    while True:
+        prof.push(name)
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            prof.pop()
+        yield item
+
+def print_report(report, out=sys.stderr, top=25):
+    w = lambda s="": print(s, file=out)
+    w(f"\n== profile: {report['wall_secs']:.3f}s wall, {report['commits']} commit(s) "
+      f"({report['commit_secs']:.3f}s) ==")
+    if report["phases"]:
+        w(f"{'phase':<24} {'calls':>9} {'secs':>10} {'incl secs':>10}")
+        for name, ph in report["phases"].items():
+            w(f"{name:<24} {ph['calls']:>9,} {ph['secs']:>10.3f} {ph['inclusive_secs']:>10.3f}")
+        w()
+    stmts = report["statements"]
+    w(f"{'calls':>8} {'rows':>10} {'exec s':>8} {'fetch s':>8} {'max ms':>9} {'vm kops':>9}  statement")
+    for st in stmts[:top]:
+        sql = st["sql"] if len(st["sql"]) <= 90 else st["sql"][:87] + "..."
+        w(f"{st['calls']:>8,} {st['rows']:>10,} {st['exec_secs']:>8.3f} {st['fetch_secs']:>8.3f} "
+          f"{st['max_ms']:>9.1f} {st['vm_kops']:>9,}  {sql}")
+    if len(stmts) > top:
+        w(f"... {len(stmts) - top} more statement(s)")
+    if report["triggers"]:
+        w("\ntrigger statements: " + ", ".join(f"{k}={v:,}" for k, v in report["triggers"].items()))
+    cache = {ns: st for ns, st in report["id_cache"].items() if st["hits"] or st["misses"]}
+    if cache:
+        w("id cache: " + ", ".join(f"{ns} {st['hit_rate']:.0%} of {st['hits'] + st['misses']:,}"
+                                   for ns, st in cache.items()))
+    slow = [st for st in stmts if st["plan"]]
+    for st in slow:
+        w(f"\nslow ({st['max_ms']:.0f} ms): {st['sql'][:200]}")
+        for line in st["plan"]:
+            w(f"    {line}")
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)